@@ -0,0 +1,23 @@
+-- Миграция для семантического кэша ответов LLM
+
+-- Таблица для хранения сгенерированных ответов на общие вопросы
+CREATE TABLE IF NOT EXISTS llm_answer_cache (
+    id BIGSERIAL PRIMARY KEY,
+    docs_key CHAR(32) NOT NULL,                       -- Хэш набора найденных документов и версии коллекций
+    collection_version VARCHAR(64) NOT NULL,          -- Версия коллекций Qdrant, для которой получен ответ
+    embedding BYTEA NOT NULL,                         -- Нормированный вектор запроса (float32)
+    answer TEXT NOT NULL,                             -- Ответ LLM
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() -- Время создания записи
+);
+
+-- Индексы для оптимизации запросов
+CREATE INDEX IF NOT EXISTS idx_llm_answer_cache_docs_key ON llm_answer_cache(docs_key, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_llm_answer_cache_version ON llm_answer_cache(collection_version);
+
+-- Комментарии к таблице
+COMMENT ON TABLE llm_answer_cache IS 'Семантический кэш ответов LLM на общие вопросы';
+COMMENT ON COLUMN llm_answer_cache.docs_key IS 'blake2b от версии коллекций и отсортированных ID документов';
+COMMENT ON COLUMN llm_answer_cache.collection_version IS 'Версия коллекций из embeddings/collection_version.json в MinIO';
+COMMENT ON COLUMN llm_answer_cache.embedding IS 'Вектор запроса для сравнения по косинусу';
+COMMENT ON COLUMN llm_answer_cache.answer IS 'Текст ответа LLM';
+COMMENT ON COLUMN llm_answer_cache.created_at IS 'Время создания записи';
@@ -17,4 +17,31 @@ class ContentItem(scrapy.Item):
     filename = scrapy.Field()
     raw_content = scrapy.Field()
     cleaned_content = scrapy.Field()
-    text_content = scrapy.Field()
\ No newline at end of file
+    text_content = scrapy.Field()
+
+class HtmlPageItem(scrapy.Item):
+    # Страница сайта для html_pages/ в MinIO
+    url = scrapy.Field()
+    body = scrapy.Field()
+
+
+class FileLinkItem(scrapy.Item):
+    # Ссылка на pdf/docx для манифеста results/links.csv
+    url = scrapy.Field()
+    type = scrapy.Field()
+
+
+class LessonItem(scrapy.Item):
+    # Занятие из расписания guap.ru/rasp, разобранное прямо из DOM
+    day = scrapy.Field()
+    time = scrapy.Field()          # "1 пара"
+    time_range = scrapy.Field()    # "9:30–11:00"
+    week = scrapy.Field()          # верхняя / нижняя / каждая
+    lesson_type = scrapy.Field()
+    subject = scrapy.Field()
+    room = scrapy.Field()
+    teacher = scrapy.Field()
+    groups = scrapy.Field()
+    department = scrapy.Field()
+    # страница, с которой снято занятие: groups_123, teachers_45, classrooms_6
+    source = scrapy.Field()
@@ -7,6 +7,9 @@ from scrapy import signals
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from twisted.internet.threads import deferToThread
+
+from out_spider.storage import minio_from_settings, read_json, write_json
 
 
 class OutSpiderSpiderMiddleware:
@@ -98,3 +101,72 @@ class OutSpiderDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class ConditionalGetMiddleware:
+    """Условные GET при повторном обходе.
+
+    ETag/Last-Modified страниц прошлого обхода лежат в MinIO (crawl_state/validators.json),
+    запросы пауков с conditional_get = True уходят с If-None-Match/If-Modified-Since,
+    и на неизменившиеся страницы сервер отвечает 304 без тела.
+    """
+
+    STATE_OBJECT = "crawl_state/validators.json"
+
+    def __init__(self, client, bucket, stats):
+        self.client = client
+        self.bucket = bucket
+        self.stats = stats
+        self.validators = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        client, bucket = minio_from_settings(crawler.settings)
+        s = cls(client, bucket, crawler.stats)
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def _enabled(self, request, spider):
+        return getattr(spider, "conditional_get", False) and request.meta.get("conditional", True)
+
+    def process_request(self, request, spider):
+        if not self._enabled(request, spider):
+            return None
+        validator = self.validators.get(request.url)
+        if validator:
+            if validator.get("etag"):
+                request.headers.setdefault("If-None-Match", validator["etag"])
+            if validator.get("last_modified"):
+                request.headers.setdefault("If-Modified-Since", validator["last_modified"])
+        return None
+
+    def process_response(self, request, response, spider):
+        if not getattr(spider, "conditional_get", False):
+            return response
+        if response.status == 304:
+            self.stats.inc_value("conditional_get/not_modified", spider=spider)
+        elif response.status == 200:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if etag or last_modified:
+                self.validators[response.url] = {
+                    "etag": etag.decode("latin-1") if etag else None,
+                    "last_modified": last_modified.decode("latin-1") if last_modified else None,
+                }
+        return response
+
+    def spider_opened(self, spider):
+        if not getattr(spider, "conditional_get", False):
+            return None
+
+        def load():
+            self.validators = read_json(self.client, self.bucket, self.STATE_OBJECT, {})
+            spider.logger.info(f"Валидаторов прошлого обхода: {len(self.validators)}")
+
+        return deferToThread(load)
+
+    def spider_closed(self, spider):
+        if not getattr(spider, "conditional_get", False):
+            return None
+        return deferToThread(write_json, self.client, self.bucket, self.STATE_OBJECT, self.validators)
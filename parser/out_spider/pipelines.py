@@ -3,11 +3,245 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import csv
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+from io import BytesIO
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from out_spider.items import FileLinkItem, HtmlPageItem, LessonItem
+from out_spider.storage import minio_from_settings, page_object_name, read_json, write_json
+from twisted.internet.threads import deferToThread
+
+# scrapy запускается из parser/, а общий формат чанков лежит в rag_sources в корне репозитория
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from rag_sources.chunk_io import find_chunk_object, read_chunks, write_chunks
 
 
 class OutSpiderPipeline:
     def process_item(self, item, spider):
         return item
+
+
+class MinioPipeline:
+    """Сохранение результатов паука в MinIO без блокировки реактора.
+
+    HtmlPageItem кладётся в html_pages/ в пуле потоков Twisted. FileLinkItem дописывается
+    в локальный links.csv (в JOBDIR, если он задан, - тогда файл переживает перезапуск обхода),
+    который каждые LINKS_UPLOAD_EVERY ссылок и в конце обхода целиком выгружается в results/links.csv.
+    """
+
+    LINKS_OBJECT = "results/links.csv"
+    LINKS_UPLOAD_EVERY = 500
+
+    def __init__(self, client, bucket, jobdir=None):
+        self.client = client
+        self.bucket = bucket
+        self.jobdir = jobdir
+        self.links_file = None
+        self.links_writer = None
+        self.links_path = None
+        self.pending_links = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        client, bucket = minio_from_settings(crawler.settings)
+        return cls(client, bucket, crawler.settings.get("JOBDIR"))
+
+    def open_spider(self, spider):
+        if not self.client.bucket_exists(self.bucket):
+            self.client.make_bucket(self.bucket)
+            spider.logger.info(f"Создан бакет в MinIO: {self.bucket}")
+
+        if self.jobdir:
+            os.makedirs(self.jobdir, exist_ok=True)
+            self.links_path = os.path.join(self.jobdir, "links.csv")
+        else:
+            fd, self.links_path = tempfile.mkstemp(prefix="links_", suffix=".csv")
+            os.close(fd)
+            os.remove(self.links_path)
+        is_new = not os.path.exists(self.links_path)
+        # построчная буферизация: после падения в файле остаются все записанные ссылки
+        self.links_file = open(self.links_path, "a", newline="", encoding="utf-8", buffering=1)
+        self.links_writer = csv.writer(self.links_file)
+        if is_new:
+            self.links_writer.writerow(["url", "type"])
+
+    def close_spider(self, spider):
+        self.links_file.close()
+        d = deferToThread(self._upload_links)
+        if not self.jobdir:
+            d.addBoth(lambda result: (os.remove(self.links_path), result)[1])
+        return d
+
+    def process_item(self, item, spider):
+        if isinstance(item, HtmlPageItem):
+            d = deferToThread(self._put_page, item["url"], item["body"])
+            d.addCallback(lambda _: item)
+            return d
+
+        if isinstance(item, FileLinkItem):
+            self.links_writer.writerow([item["url"], item["type"]])
+            self.pending_links += 1
+            if self.pending_links >= self.LINKS_UPLOAD_EVERY:
+                self.pending_links = 0
+                self.links_file.flush()
+                deferToThread(self._upload_links).addErrback(
+                    lambda failure: spider.logger.error(f"Ошибка выгрузки ссылок в MinIO: {failure.value}"))
+        return item
+
+    def _put_page(self, url, body):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.client.put_object(self.bucket, page_object_name(url), BytesIO(body), length=len(body),
+                               content_type="text/html")
+
+    def _upload_links(self):
+        self.client.fput_object(self.bucket, self.LINKS_OBJECT, self.links_path, content_type="text/csv")
+
+
+class LessonTablePipeline:
+    """Сводная таблица занятий расписания и дельта изменений.
+
+    Занятие со страниц группы, преподавателя и аудитории - одна строка с ключом
+    (день, пара, неделя, предмет, аудитория); преподаватели, группы и страницы-источники
+    объединяются. В конце обхода:
+
+    - для каждой страницы считается хэш её занятий, хэши лежат в schedules/manifest.json;
+    - таблица сравнивается с прошлой, и если что-то поменялось, публикуется дельта
+      schedules/delta/v<версия> (added / removed / modified) и новая таблица schedules/lessons;
+    - занятия страниц, которые в этот раз не скачались, берутся из прошлой таблицы, а не удаляются.
+
+    Дельту применяет rag_sources/schedule_delta.py.
+    """
+
+    LESSONS_OBJECT = "schedules/lessons"
+    MANIFEST_OBJECT = "schedules/manifest.json"
+    DELTA_PREFIX = "schedules/delta/v"
+    KEY_FIELDS = ("day", "time", "week", "subject", "room")
+
+    def __init__(self, client, bucket):
+        self.client = client
+        self.bucket = bucket
+        self.lessons = {}
+        # страница -> её занятия, для хэша страницы
+        self.by_source = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(*minio_from_settings(crawler.settings))
+
+    @classmethod
+    def lesson_key(cls, lesson):
+        return tuple(lesson.get(field) or "" for field in cls.KEY_FIELDS)
+
+    @staticmethod
+    def content_hash(value):
+        return hashlib.sha256(json.dumps(value, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def lesson_hash(cls, row):
+        # страницы-источники не входят в содержание занятия
+        return cls.content_hash({k: v for k, v in row.items() if k != "sources"})
+
+    def process_item(self, item, spider):
+        if not isinstance(item, LessonItem):
+            return item
+
+        lesson = ItemAdapter(item).asdict()
+        source = lesson.pop("source", None)
+        if source:
+            self.by_source.setdefault(source, []).append(lesson)
+        key = self.lesson_key(lesson)
+        row = self.lessons.get(key)
+        if row is None:
+            row = self.lessons[key] = {**lesson, "teacher": [], "groups": [], "sources": []}
+        for field in ("lesson_type", "time_range", "department"):
+            if not row.get(field):
+                row[field] = lesson.get(field) or ""
+        for teacher in lesson.get("teacher") or []:
+            if teacher not in row["teacher"]:
+                row["teacher"].append(teacher)
+        row["groups"] = sorted(set(row["groups"]) | set(lesson.get("groups") or []))
+        if source and source not in row["sources"]:
+            row["sources"].append(source)
+        return item
+
+    def close_spider(self, spider):
+        if not self.lessons:
+            spider.logger.warning("Занятий не собрано, таблица расписания не обновляется")
+            return None
+        return deferToThread(self.publish, spider)
+
+    # ========== ДЕЛЬТА ==========
+
+    def entity_hashes(self, spider):
+        # страница без занятий тоже скачана: её хэш - хэш пустого списка
+        hashes = {source: self.content_hash([]) for source in getattr(spider, "crawled_sources", ())}
+        for source, lessons in self.by_source.items():
+            hashes[source] = self.content_hash(sorted(lessons, key=lambda lesson: json.dumps(lesson, sort_keys=True)))
+        return hashes
+
+    def load_previous(self):
+        if find_chunk_object(self.client, self.bucket, self.LESSONS_OBJECT) is None:
+            return {}
+        return {self.lesson_key(row): row for row in read_chunks(self.client, self.bucket, self.LESSONS_OBJECT)}
+
+    @classmethod
+    def diff(cls, previous, current):
+        delta = []
+        for key, row in current.items():
+            old = previous.get(key)
+            if old is None:
+                delta.append({"op": "added", "lesson": row})
+            elif cls.lesson_hash(old) != cls.lesson_hash(row):
+                delta.append({"op": "modified", "lesson": row, "previous": old})
+        for key, old in previous.items():
+            if key not in current:
+                delta.append({"op": "removed", "previous": old})
+        return delta
+
+    def publish(self, spider):
+        manifest = read_json(self.client, self.bucket, self.MANIFEST_OBJECT, {})
+        old_hashes = manifest.get("entities", {})
+        hashes = self.entity_hashes(spider)
+        changed = sum(1 for source, h in hashes.items() if old_hashes.get(source) != h)
+        spider.logger.info(f"Страниц расписания: {len(hashes)}, изменилось: {changed}")
+
+        previous = self.load_previous()
+        current = dict(self.lessons)
+        # страница не скачалась - её занятия остаются как были
+        failed = set(getattr(spider, "failed_sources", ())) - set(hashes)
+        for key, row in previous.items():
+            if key not in current and failed & set(row.get("sources", [])):
+                current[key] = row
+        for source in failed:
+            if source in old_hashes:
+                hashes[source] = old_hashes[source]
+
+        delta = self.diff(previous, current)
+        version = manifest.get("version", 0)
+        if delta:
+            version += 1
+            for record in delta:
+                record["version"] = version
+            write_chunks(self.client, self.bucket, f"{self.DELTA_PREFIX}{version:06d}", delta)
+            write_chunks(self.client, self.bucket, self.LESSONS_OBJECT, [current[key] for key in sorted(current)])
+
+        counts = {op: sum(1 for r in delta if r["op"] == op) for op in ("added", "removed", "modified")}
+        # манифест пишется последним: по нему видно, что версия опубликована целиком
+        write_json(self.client, self.bucket, self.MANIFEST_OBJECT, {
+            "version": version,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "lessons": len(current),
+            "delta": counts,
+            "entities": hashes,
+        })
+        spider.logger.info(f"Расписание v{version}: занятий {len(current)}, +{counts['added']} "
+                           f"-{counts['removed']} ~{counts['modified']}")
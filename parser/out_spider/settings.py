@@ -22,9 +22,12 @@ ADDONS = {}
 #USER_AGENT = "out_spider (+http://www.yourdomain.com)"
 
 # Concurrency and throttling settings
-#CONCURRENT_REQUESTS = 16
-CONCURRENT_REQUESTS_PER_DOMAIN = 1
-DOWNLOAD_DELAY = 1
+CONCURRENT_REQUESTS = 32
+CONCURRENT_REQUESTS_PER_DOMAIN = 8
+DOWNLOAD_DELAY = 0  # темп подбирает AutoThrottle по задержкам сервера (см. ниже)
+
+# Пул потоков реактора: в нём же идут записи в MinIO из MinioPipeline
+REACTOR_THREADPOOL_MAXSIZE = 20
 
 DOWNLOAD_TIMEOUT = 30  # Таймаут для скачивания страницы (по умолчанию 180 секунд)
 
@@ -32,6 +35,7 @@ DOWNLOAD_TIMEOUT = 30  # Таймаут для скачивания страни
 # Добавляем поддержку файловой пайплайна
 ITEM_PIPELINES = {
     'scrapy.pipelines.files.FilesPipeline': 1,
+    'out_spider.pipelines.MinioPipeline': 300,
 }
 
 FILES_STORE = 'downloaded_files'  # Путь, где будут храниться файлы
@@ -56,9 +60,10 @@ FILES_STORE = 'downloaded_files'  # Путь, где будут хранитьс
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "out_spider.middlewares.OutSpiderDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    # после HttpCompression, чтобы видеть заголовки итогового ответа
+    "out_spider.middlewares.ConditionalGetMiddleware": 560,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
@@ -74,14 +79,14 @@ FILES_STORE = 'downloaded_files'  # Путь, где будут хранитьс
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
-#AUTOTHROTTLE_ENABLED = True
+AUTOTHROTTLE_ENABLED = True
 # The initial download delay
-#AUTOTHROTTLE_START_DELAY = 5
+AUTOTHROTTLE_START_DELAY = 0.5
 # The maximum download delay to be set in case of high latencies
-#AUTOTHROTTLE_MAX_DELAY = 60
+AUTOTHROTTLE_MAX_DELAY = 10
 # The average number of requests Scrapy should be sending in parallel to
 # each remote server
-#AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
+AUTOTHROTTLE_TARGET_CONCURRENCY = 4.0
 # Enable showing throttling stats for every response received:
 #AUTOTHROTTLE_DEBUG = False
 
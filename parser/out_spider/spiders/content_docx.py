@@ -1,10 +1,20 @@
-import os
+import asyncio
 import json
 from docx import Document
-import requests
 from io import BytesIO
 from minio import Minio
 import io
+import os
+import sys
+
+# скрипт запускается из parser/ (нужны настройки scrapy), а Fetcher лежит в rag_sources в корне репозитория
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+from rag_sources.fetcher import Fetcher
+
+# Папка в бакете для скачанных docx (имена по sha256 содержимого) и лимит соединений на хост
+DOCX_PREFIX = "saved_docx"
+MAX_PER_HOST = 4
 
 
 # Инициализация MinIO клиента
@@ -65,33 +75,33 @@ def extract_table_data(docx_path):
     return table_data
 
 
-# Функция для скачивания документа по URL
-def download_docx(url):
+# Чтение скачанного документа из MinIO
+def read_docx(minio_client, bucket_name, object_name):
+    response = minio_client.get_object(bucket_name, object_name)
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        docx_file = BytesIO(response.content)
-        return docx_file
-    except Exception as e:
-        print(f"Ошибка при скачивании {url}: {e}")
-        return None
+        return BytesIO(response.read())
+    finally:
+        response.close()
+        response.release_conn()
 
 
 # Основной процесс для обработки списка ссылок
 def process_docx_links(links):
     result = {}
+    minio_client, bucket_name = get_minio_client()
+    links = [url for url in links if url.lower().endswith('.docx')]
+
+    # Скачиваем все документы параллельно; неизменившиеся по ETag/Last-Modified не качаются
+    fetcher = Fetcher(minio_client, bucket_name, DOCX_PREFIX, per_host=MAX_PER_HOST)
+    fetched = asyncio.run(fetcher.fetch_all(links))
 
     for url in links:
-        if not url.lower().endswith('.docx'):
+        if not fetched[url].object_name:
             continue
 
         print(f"Обрабатывается: {url}")
 
-        # Скачиваем документ
-        docx_file = download_docx(url)
+        docx_file = read_docx(minio_client, bucket_name, fetched[url].object_name)
         if docx_file:
             # Извлекаем текст
             text_content = extract_text_from_docx(docx_file)
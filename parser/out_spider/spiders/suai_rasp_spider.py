@@ -1,64 +1,65 @@
 import scrapy
-import json
-import os
 import re
-from urllib.parse import urlencode
-from bs4 import BeautifulSoup
-from minio import Minio
-import io
+
+from out_spider.items import LessonItem
+
+
+WEEKS = {"▲": "верхняя", "▼": "нижняя"}
+PAIR_RE = re.compile(r"(\d+)\s*пара")
+PAIR_RANGE_RE = re.compile(r"\(([^)]*)\)")
+DEPARTMENT_RE = re.compile(r"Кафедра\s+(\d+)")
+# Метки разделов в блоке деталей занятия: до "преп:" - аудитория, дальше преподаватели и группы
+SECTION_RE = re.compile(r"(преп:|гр:)")
+SECTIONS = {"преп:": "teacher", "гр:": "groups"}
+
+
+def clean(text):
+    return re.sub(r"\s+", " ", text or "").strip()
+
 
 class SheduleSpider(scrapy.Spider):
+    """Расписание guap.ru/rasp: занятия отдаются структурными LessonItem прямо из DOM.
+
+    Одно и то же занятие видно на странице группы, преподавателя и аудитории - LessonTablePipeline
+    сводит их в одну таблицу по (день, пара, неделя, предмет, аудитория) и пишет её в MinIO
+    как NDJSON (schedules/lessons.ndjson), которую читает txt_to_chunks, вместе с дельтой
+    изменений относительно прошлого обхода.
+    """
     name = 'guap_rasp'
     start_urls = ['https://guap.ru/rasp']
 
     custom_settings = {
         'CONCURRENT_REQUESTS': 3,
         'DOWNLOAD_DELAY': 0.5,
+        'ITEM_PIPELINES': {
+            'out_spider.pipelines.LessonTablePipeline': 300,
+        },
+    }
+
+    # Страницы, с которых снимаются занятия, и параметр URL для каждой.
+    # Кафедры не обходим: их занятия те же, что у преподавателей кафедры
+    entity_params = {
+        'groups': 'gr',
+        'teachers': 'pr',
+        'classrooms': 'ad',
+    }
+    selectors = {
+        'selGroup': 'groups',
+        'selPrep': 'teachers',
+        'selRoom': 'classrooms',
     }
 
     def __init__(self, *args, **kwargs):
         super(SheduleSpider, self).__init__(*args, **kwargs)
-
-        # Берем настройки из settings.py
-        from scrapy.utils.project import get_project_settings
-        settings = get_project_settings()
-        self.minio_config = settings.get('MINIO_CONFIG', {})
-
-        # Инициализация MinIO клиента
-        self.minio_client = Minio(
-            self.minio_config['endpoint'],
-            access_key=self.minio_config['access_key'],
-            secret_key=self.minio_config['secret_key'],
-            secure=self.minio_config['secure']
-        )
-        self.bucket_name = self.minio_config['bucket_name']
-
-        # Создаем бакет если не существует
-        self.setup_minio_bucket()
-
-    def setup_minio_bucket(self):
-        """Создает бакет в MinIO если не существует"""
-        try:
-            if not self.minio_client.bucket_exists(self.bucket_name):
-                self.minio_client.make_bucket(self.bucket_name)
-                self.logger.info(f"Создан бакет в MinIO: {self.bucket_name}")
-        except Exception as e:
-            self.logger.error(f"Ошибка создания бакета в MinIO: {e}")
+        # Какие страницы скачались, а какие нет - LessonTablePipeline не удаляет занятия
+        # страниц, которые в этот раз не скачались
+        self.crawled_sources = set()
+        self.failed_sources = set()
 
     def parse(self, response):
         self.logger.info("Собираем фильтры")
 
-        # Простые селекторы
-        selectors = {
-            'selGroup': 'groups',
-            'selPrep': 'teachers',
-            'selChair': 'departments',
-            'selRoom': 'classrooms'
-        }
-
-        filters_data = {}
-
-        for selector, entity_type in selectors.items():
+        for selector, entity_type in self.selectors.items():
             options = response.css(f'select[name="{selector}"] option[value][value!=""]')
             entities = []
 
@@ -72,30 +73,18 @@ class SheduleSpider(scrapy.Spider):
                         'name': entity_name.strip()
                     })
 
-            filters_data[entity_type] = entities
             self.logger.info(f"{entity_type}: {len(entities)}")
 
-        # Парсим
-        for entity_type, entities in filters_data.items():
             for entity in entities:
-                yield from self.download_schedule(response.url, entity_type, entity)
-
-    def download_schedule(self, base_url, entity_type, entity):
-        """Скачиваем расписание для одной сущности"""
-        # Маппинг селекторов на параметры URL
-        param_map = {
-            'groups': 'gr',
-            'teachers': 'pr',
-            'departments': 'ch',
-            'classrooms': 'ad'
-        }
-
-        param_name = param_map[entity_type]
-        url = f"{base_url}?{param_name}={entity['id']}"
-
-        yield scrapy.Request(
+                yield self.schedule_request(response.url, entity_type, entity)
+
+    def schedule_request(self, base_url, entity_type, entity):
+        """Запрос расписания одной сущности"""
+        url = f"{base_url}?{self.entity_params[entity_type]}={entity['id']}"
+        return scrapy.Request(
             url,
-            callback=self.extract_schedule_text,
+            callback=self.parse_lessons,
+            errback=self.handle_error,
             meta={
                 'entity_type': entity_type,
                 'entity_id': entity['id'],
@@ -103,123 +92,119 @@ class SheduleSpider(scrapy.Spider):
             }
         )
 
-    def extract_schedule_text(self, response):
-        """Извлекаем расписание в виде чистого текста"""
-        meta = response.meta
-        schedule_text = self.parse_schedule_to_text(response)
+    # ========== РАЗБОР СТРАНИЦЫ ==========
 
-        # Сохраняем ВСЕ txt файлы в одну папку schedules/
-        filename = f"schedules/{meta['entity_type']}_{meta['entity_id']}.txt"
+    def parse_lessons(self, response):
+        """Занятия со страницы расписания: день и пара берутся из предшествующих заголовков"""
+        source = self.source_name(response.meta)
+        self.crawled_sources.add(source)
+        count = 0
 
-        # Сохраняем в MinIO
-        self.save_to_minio(
-            filename,
-            schedule_text.encode('utf-8'),
-            "text/plain"
-        )
+        for day in response.css('h4.text-danger.border-bottom'):
+            day_name = clean(day.css('::text').get())
+            pair, time_range = "", ""
 
-        self.logger.info(f"Сохранено: {filename}")
-
-        yield {
-            'type': meta['entity_type'],
-            'id': meta['entity_id'],
-            'name': meta['entity_name'],
-            'file': filename
-        }
-
-    def save_to_minio(self, object_name, data, content_type):
-        """Сохраняет данные в MinIO"""
-        try:
-            self.minio_client.put_object(
-                self.bucket_name,
-                object_name,
-                io.BytesIO(data),
-                length=len(data),
-                content_type=content_type
-            )
-        except Exception as e:
-            self.logger.error(f"Ошибка сохранения в MinIO {object_name}: {e}")
-
-    def parse_schedule_to_text(self, response):
-        """Преобразуем HTML расписание в чистый текст"""
-        text_parts = []
-
-        # Извлекаем дни недели
-        days = response.css('h4.text-danger.border-bottom')
-
-        for day in days:
-            day_name = day.css('::text').get().strip()
-            text_parts.append(f"\n{day_name}")
-
-            # Находим все занятия для этого дня
             current = day.xpath('following-sibling::*[1]')
-            while current and not (current.css('h4.text-danger.border-bottom')):
-                # Если это время пары
-                if 'mt-3 text-danger' in current.attrib.get('class', ''):
-                    time_text = current.css('::text').get().strip()
-                    text_parts.append(f"\n{time_text}")
-
-                # Если это блок с занятием
-                elif 'mb-3 py-2 d-flex gap-2' in current.attrib.get('class', ''):
-                    lesson_text = self.parse_lesson_to_text(current)
-                    if lesson_text.strip():  # Добавляем только если есть текст
-                        text_parts.append(lesson_text)
-
+            while current and not current.css('h4.text-danger.border-bottom'):
+                css_class = current.attrib.get('class', '')
+                # Заголовок пары: "1 пара (9:30–11:00)"
+                if 'mt-3 text-danger' in css_class:
+                    pair, time_range = self.parse_pair(current)
+                # Блок с занятием
+                elif 'mb-3 py-2 d-flex gap-2' in css_class:
+                    item = self.parse_lesson(current, day_name, pair, time_range, source)
+                    if item is not None:
+                        count += 1
+                        yield item
                 current = current.xpath('following-sibling::*[1]')
 
-        return '\n'.join(text_parts)
-
-    def parse_lesson_to_text(self, lesson_element):
-        """Преобразуем один блок занятия в норм текст"""
-        # Получаем текст из блока с деталями
-        details_text = self.extract_all_details_text(lesson_element)
-
-        # Неделя (▲ или ▼)
-        week_symbol = lesson_element.css('div[class*="week"]::text').get('').strip()
-
-        # Тип занятия
-        lesson_type = lesson_element.css('.fs-6.lh-sm.opacity-50::text').get('').strip()
-
-        # Название предмета
-        subject = lesson_element.css('.lead.lh-sm::text').get('').strip()
-
-        # Форматируем
-        lines = []
-        if week_symbol:
-            lines.append(week_symbol)
-        if lesson_type:
-            lines.append(lesson_type)
-        if subject:
-            lines.append(subject)
-        if details_text:
-            lines.append(details_text)
-
-        return '\n'.join(lines)
-
-    def extract_all_details_text(self, lesson_element):
-        """Извлекает текст из блока с деталями и добавляет переносы"""
-        details_div = lesson_element.css('.opacity-75')
-        if not details_div:
-            return ''
-
-        # Получаем весь HTML блока
-        details_html = details_div.get()
-
-        # Сначала извлекаем чистый текст без HTML
-        soup = BeautifulSoup(details_html, 'html.parser')
-        clean_text = soup.get_text(separator=' ')
-
-        # Очищаем пробелы
-        clean_text = re.sub(r'\s+', ' ', clean_text).strip()
-
-        # Теперь добавляем переносы в чистый текст
-        # Добавляем перенос перед "преп:"
-        clean_text = re.sub(r'преп:', '\nпреп:', clean_text)
-
-        # Добавляем перенос перед "гр:"
-        clean_text = re.sub(r'гр:', '\nгр:', clean_text)
-
-        return clean_text
+        self.logger.info(f"{source}: занятий {count}")
+
+    @staticmethod
+    def source_name(meta):
+        return f"{meta['entity_type']}_{meta['entity_id']}"
+
+    def handle_error(self, failure):
+        self.failed_sources.add(self.source_name(failure.request.meta))
+        self.logger.error(f"Ошибка запроса {failure.request.url}: {failure.value}")
+
+    @staticmethod
+    def parse_pair(element):
+        text = clean(" ".join(element.css('::text').getall()))
+        match = PAIR_RE.search(text)
+        range_match = PAIR_RANGE_RE.search(text)
+        pair = f"{match.group(1)} пара" if match else text
+        return pair, clean(range_match.group(1)) if range_match else ""
+
+    def parse_lesson(self, lesson_element, day, pair, time_range, source):
+        subject = clean(lesson_element.css('.lead.lh-sm::text').get())
+        if not subject:
+            return None
+        week_symbol = clean(lesson_element.css('div[class*="week"]::text').get())
+
+        details = lesson_element.css('.opacity-75')
+        sections = self.parse_details(details[0].root) if details else {}
+        details_text = clean(" ".join(details.css('::text').getall())) if details else ""
+        department = DEPARTMENT_RE.search(details_text)
+
+        return LessonItem(
+            day=day,
+            time=pair,
+            time_range=time_range,
+            week=WEEKS.get(week_symbol, "каждая"),
+            lesson_type=clean(lesson_element.css('.fs-6.lh-sm.opacity-50::text').get()),
+            subject=subject,
+            room=(sections.get("room") or [""])[0],
+            teacher=sections.get("teacher", []),
+            groups=sorted({g.lower() for g in sections.get("groups", [])}),
+            department=department.group(1) if department else "",
+            source=source,
+        )
 
-def closed(self, reason):
-    self.logger.info("Парсинг расписаний завершен")
\ No newline at end of file
+    @staticmethod
+    def parse_details(element):
+        """Блок деталей -> {"room": [...], "teacher": [...], "groups": [...]}.
+
+        Текст ссылок - целые значения (ФИО, номер группы), обычный текст режется по ",;".
+        """
+        pieces = []
+
+        def walk(el, in_link):
+            in_link = in_link or el.tag == "a"
+            if el.text:
+                pieces.append((el.text, in_link))
+            for child in el:
+                if isinstance(child.tag, str):
+                    walk(child, in_link)
+                if child.tail:
+                    pieces.append((child.tail, in_link))
+
+        walk(element, False)
+
+        section = "room"
+        parts = {"room": [], "teacher": [], "groups": []}
+        for text, is_link in pieces:
+            if is_link:
+                parts[section].append((text, True))
+                continue
+            for part in SECTION_RE.split(text):
+                if part in SECTIONS:
+                    section = SECTIONS[part]
+                else:
+                    parts[section].append((part, False))
+
+        room = clean("".join(text for text, _ in parts["room"])).strip(" —–-.;,")
+        result = {"room": [room] if room else []}
+        for name in ("teacher", "groups"):
+            links = [clean(text) for text, is_link in parts[name] if is_link]
+            if links:
+                values = links
+            else:
+                plain = "".join(text for text, _ in parts[name])
+                # точка в конце - часть инициалов преподавателя, у групп - мусор
+                values = [clean(v).strip(" —–-." if name == "groups" else " —–-") for v in re.split(r"[;,]", plain)]
+            result[name] = [v for v in values if v]
+        return result
+
+    def closed(self, reason):
+        self.logger.info("Парсинг расписаний завершен")
@@ -1,170 +1,143 @@
 import scrapy
 from urllib.parse import urljoin, urlparse
-import csv
-import os
-import hashlib
-from scrapy.pipelines.files import FilesPipeline
-import requests
-from minio import Minio
-import io
+from scrapy.http import HtmlResponse
+from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.gz import gunzip
+from scrapy.utils.sitemap import Sitemap
+from twisted.internet.threads import deferToThread
+
+from out_spider.items import FileLinkItem, HtmlPageItem
+from out_spider.storage import minio_from_settings, page_object_name, read_object
+
 
 class LinkParserSpider(scrapy.Spider):
+    """Обход сайта: html-страницы в MinIO, ссылки на pdf/docx в results/links.csv.
+
+    Очередь запросов и множество увиденных URL хранятся в JOBDIR, поэтому обход можно
+    прервать (Ctrl+C один раз) и продолжить той же командой:
+
+        scrapy crawl link_parser -a start_urls=https://guap.ru -s JOBDIR=crawls/guap-2026-10-17
+
+    JOBDIR - состояние одного обхода. Каждый новый обход запускается с новым JOBDIR (например,
+    crawls/guap-$(date +%F)): requests.seen законченного обхода отсёк бы и sitemap, и start_urls,
+    и все страницы, и повторный обход не сделал бы ни одного запроса.
+
+    Обход начинается с sitemap.xml сайта (или -a sitemap_urls=url1,url2), затем идут start_urls.
+    При повторном обходе страницы запрашиваются условно (ConditionalGetMiddleware): ETag и
+    Last-Modified прошлого обхода лежат в MinIO, а не в JOBDIR. На 304 страница берётся из MinIO
+    и ссылки из неё всё равно разбираются.
+    """
     name = 'link_parser'
     start_urls = []
-    output_file = "out_spider/spiders/links.csv"
 
-    visited = set()
-    file_links = set()
-    file_extensions = [".pdf", ".docx"]
+    file_extensions = (".pdf", ".docx")
+    conditional_get = True
+    handle_httpstatus_list = [304, 404]
 
-    def __init__(self, start_urls=None, output_file=None, *args, **kwargs):
+    def __init__(self, start_urls=None, sitemap_urls=None, *args, **kwargs):
         super(LinkParserSpider, self).__init__(*args, **kwargs)
         if start_urls:
             self.start_urls = [start_urls]
-        if output_file:
-            self.output_file = output_file
-
-        # Берем настройки из settings.py
-        from scrapy.utils.project import get_project_settings
-        settings = get_project_settings()
-        self.minio_config = settings.get('MINIO_CONFIG', {})
-
-        # Инициализация MinIO клиента
-        self.minio_client = Minio(
-            self.minio_config['endpoint'],
-            access_key=self.minio_config['access_key'],
-            secret_key=self.minio_config['secret_key'],
-            secure=self.minio_config['secure']
-        )
-        self.bucket_name = self.minio_config['bucket_name']
-
-        # Накопление ссылок в памяти
-        self.links_buffer = []
-
-        # Создаем бакет если не существует
-        self.setup_minio_bucket()
-
-    def setup_minio_bucket(self):
-        """Создает бакет в MinIO если не существует"""
+        if sitemap_urls:
+            self.sitemap_urls = [url for url in sitemap_urls.split(",") if url]
+        else:
+            self.sitemap_urls = [urljoin(url, "/sitemap.xml") for url in self.start_urls]
+        self.domain = urlparse(self.start_urls[0]).netloc if self.start_urls else None
+        self._file_links = set()
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.minio_client, spider.bucket_name = minio_from_settings(crawler.settings)
+        return spider
+
+    @property
+    def file_links(self):
+        # с JOBDIR множество сохраняется между перезапусками обхода вместе с остальным состоянием
+        state = getattr(self, "state", None)
+        if state is None:
+            return self._file_links
+        return state.setdefault("file_links", set())
+
+    async def start(self):
+        for url in self.sitemap_urls:
+            yield scrapy.Request(url, callback=self.parse_sitemap, errback=self.handle_error,
+                                 meta={"conditional": False})
+        for url in self.start_urls:
+            yield scrapy.Request(url, callback=self.parse, errback=self.handle_error)
+
+    def is_internal(self, url):
+        return urlparse(url).netloc == self.domain
+
+    # ========== SITEMAP ==========
+
+    def parse_sitemap(self, response):
+        if response.status != 200:
+            self.logger.info(f"Sitemap недоступен ({response.status}): {response.url}")
+            return
+        body = response.body
+        if body[:2] == b"\x1f\x8b":
+            body = gunzip(body)
         try:
-            if not self.minio_client.bucket_exists(self.bucket_name):
-                self.minio_client.make_bucket(self.bucket_name)
-                self.logger.info(f"Создан бакет в MinIO: {self.bucket_name}")
+            sitemap = Sitemap(body)
         except Exception as e:
-            self.logger.error(f"Ошибка создания бакета в MinIO: {e}")
+            self.logger.warning(f"Не удалось разобрать sitemap {response.url}: {e}")
+            return
 
-    def parse(self, response):
-        self.save_html_page(response.url, response.body)
+        callback = self.parse_sitemap if sitemap.type == "sitemapindex" else self.parse
+        meta = {"conditional": False} if sitemap.type == "sitemapindex" else {}
+        count = 0
+        for entry in sitemap:
+            url = entry.get("loc")
+            if url and self.is_internal(url):
+                count += 1
+                yield scrapy.Request(url, callback=callback, errback=self.handle_error, meta=meta)
+        self.logger.info(f"Из sitemap {response.url} добавлено {count} URL")
 
+    # ========== СТРАНИЦЫ ==========
+
+    async def parse(self, response):
         if response.status == 404:
             self.logger.warning(f"Страница не найдена: {response.url}")
             return
 
-        links = response.css('a::attr(href)').getall()
-
-        for link in links:
-            if link:
-                try:
-                    full_url = response.urljoin(link)
-
-                    # Пропускаем уже посещенные URL
-                    if full_url in self.visited:
-                        continue
-
-                    self.visited.add(full_url)
-
-                    # Проверяем на PDF или DOCX
-                    is_pdf = full_url.lower().endswith('.pdf')
-                    is_docx = full_url.lower().endswith('.docx')
-
-                    if is_pdf or is_docx:
-                        file_type = "pdf" if is_pdf else "docx"
-                        self.file_links.add(full_url)
-                        self.save_link(full_url, file_type)
-
-                    elif full_url.lower().endswith('.html') or urlparse(full_url).netloc == urlparse(
-                            self.start_urls[0]).netloc:
-                        # Внутренние страницы продолжаем обходить
-                        yield scrapy.Request(
-                            url=full_url,
-                            callback=self.parse,
-                            errback=self.handle_error
-                        )
-
-                except Exception as e:
-                    self.logger.error(f"Ошибка при обработке ссылки {link}: {e}")
-
-    def save_html_page(self, url, html_content):
-        """Сохраняет HTML страницу в MinIO"""
-        try:
-            file_name = hashlib.md5(url.encode('utf-8')).hexdigest() + ".html"
-            object_name = f"html_pages/{file_name}"
-
-            # Конвертируем в bytes если нужно
-            if isinstance(html_content, str):
-                html_content = html_content.encode('utf-8')
-
-            # Сохраняем в MinIO
-            self.minio_client.put_object(
-                self.bucket_name,
-                object_name,
-                io.BytesIO(html_content),
-                length=len(html_content),
-                content_type="text/html"
-            )
-
-            self.logger.info(f"Сохранена HTML-страница в MinIO: {object_name}")
-        except Exception as e:
-            self.logger.error(f"Ошибка сохранения HTML в MinIO: {e}")
-
-    def save_link(self, url, link_type):
-        """Сохраняем ссылку в буфер (в памяти)"""
-        self.links_buffer.append([url, link_type])
-
-        # Сбрасываем в MinIO каждые 10 ссылок
-        if len(self.links_buffer) >= 10:
-            self.flush_links_to_minio()
-
-        self.logger.info(f"Ссылка добавлена в буфер ({link_type}): {url}")
-
-    def flush_links_to_minio(self):
-        """Сбрасывает накопленные ссылки в MinIO"""
-        if not self.links_buffer:
+        if response.status == 304:
+            # страница не менялась: берём сохранённую копию, чтобы пройти по её ссылкам
+            body = await maybe_deferred_to_future(deferToThread(
+                read_object, self.minio_client, self.bucket_name, page_object_name(response.url)))
+            if body is None:
+                yield response.request.replace(dont_filter=True, meta={**response.meta, "conditional": False})
+                return
+            response = HtmlResponse(response.url, body=body, encoding="utf-8", request=response.request)
+        elif not isinstance(response, HtmlResponse):
             return
-
-        try:
-            # Создаем CSV в памяти
-            output = io.StringIO()
-            writer = csv.writer(output)
-
-            # Заголовок
-            writer.writerow(['url', 'type'])
-
-            # Данные
-            for url, link_type in self.links_buffer:
-                writer.writerow([url, link_type])
-
-            # Конвертируем в bytes
-            csv_data = output.getvalue().encode('utf-8')
-
-            # Сохраняем в MinIO (перезаписываем весь файл)
-            self.minio_client.put_object(
-                self.bucket_name,
-                "results/links.csv",
-                io.BytesIO(csv_data),
-                length=len(csv_data),
-                content_type="text/csv"
-            )
-
-            self.logger.info(f"Сброшено {len(self.links_buffer)} ссылок в MinIO")
-            self.links_buffer = []  # Очищаем буфер
-
-        except Exception as e:
-            self.logger.error(f"Ошибка сохранения ссылок в MinIO: {e}")
+        else:
+            yield HtmlPageItem(url=response.url, body=response.body)
+
+        for link in response.css('a::attr(href)').getall():
+            if not link:
+                continue
+            try:
+                full_url = response.urljoin(link)
+                lower = urlparse(full_url).path.lower()
+
+                # Проверяем на PDF или DOCX
+                if lower.endswith(self.file_extensions):
+                    if full_url not in self.file_links:
+                        self.file_links.add(full_url)
+                        yield FileLinkItem(url=full_url, type="pdf" if lower.endswith(".pdf") else "docx")
+                elif lower.endswith('.html') or self.is_internal(full_url):
+                    # Внутренние страницы продолжаем обходить; повторы отсекает dupefilter (с JOBDIR - и после перезапуска обхода)
+                    yield scrapy.Request(full_url, callback=self.parse, errback=self.handle_error)
+            except Exception as e:
+                self.logger.error(f"Ошибка при обработке ссылки {link}: {e}")
 
     def handle_error(self, failure):
         """Обработка ошибок запроса"""
         self.logger.error(f"Ошибка запроса: {failure.value}")
 
     def closed(self, reason):
-        self.logger.info(f"Парсинг завершён. Всего найдено {len(self.visited)} ссылок, {len(self.file_links)} файлов.")
+        stats = self.crawler.stats
+        self.logger.info(f"Парсинг завершён ({reason}). Страниц: {stats.get_value('response_received_count', 0)}, "
+                         f"без изменений (304): {stats.get_value('conditional_get/not_modified', 0)}, "
+                         f"файлов: {len(self.file_links)}.")
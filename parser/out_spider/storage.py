@@ -0,0 +1,49 @@
+"""Общий доступ к MinIO для паука, его пайплайнов и middleware"""
+import hashlib
+import json
+from io import BytesIO
+
+from minio import Minio
+from minio.error import S3Error
+
+HTML_PREFIX = "html_pages"
+
+
+def minio_from_settings(settings):
+    config = settings.get("MINIO_CONFIG", {})
+    client = Minio(
+        config["endpoint"],
+        access_key=config["access_key"],
+        secret_key=config["secret_key"],
+        secure=config["secure"],
+    )
+    return client, config["bucket_name"]
+
+
+def page_object_name(url: str) -> str:
+    return f"{HTML_PREFIX}/{hashlib.md5(url.encode('utf-8')).hexdigest()}.html"
+
+
+def read_object(client, bucket: str, object_name: str):
+    """Содержимое объекта или None, если его нет"""
+    try:
+        response = client.get_object(bucket, object_name)
+    except S3Error as e:
+        if e.code != "NoSuchKey":
+            raise
+        return None
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def read_json(client, bucket: str, object_name: str, default):
+    data = read_object(client, bucket, object_name)
+    return json.loads(data.decode("utf-8")) if data is not None else default
+
+
+def write_json(client, bucket: str, object_name: str, value):
+    data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+    client.put_object(bucket, object_name, BytesIO(data), length=len(data), content_type="application/json")
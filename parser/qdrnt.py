@@ -1,82 +1,314 @@
+import io
 import json
 import sys
 import os
-from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance
+import tempfile
+from qdrant_client.models import (
+    Distance, Modifier, PointIdsList, PointStruct, SparseVector, SparseVectorParams, VectorParams,
+)
 
 # добавляем корневую директорию проекта в путь
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
+from rag_sources.answer_cache import publish_collection_version
+from rag_sources.embedding_artifact import (
+    PAYLOAD_HASH_FIELD,
+    download_artifact,
+    download_sparse,
+    iter_artifact_segments,
+    iter_sparse_segments,
+    jsonl_object,
+    open_artifact,
+    open_sparse,
+    vectors_object,
+    with_payload_hash,
+)
 from rag_sources.minio_client import get_minio_client
+from rag_sources.qdrant_factory import QdrantClientOptions, create_qdrant_client
+from rag_sources.sparse_encoder import DENSE_VECTOR, RETRIEVAL_MODE, SPARSE_VECTOR
 
 # инициализация клиента Minio
 minio_client = get_minio_client()
 
-# путь к объекту в Minio 
-jsonl_object_path1 = 'embeddings/all_chunks.jsonl'
-jsonl_object_path2 = 'embeddings/schedules_chunks.jsonl'
+# префиксы эмбеддингов в Minio: <префикс>.vectors.npy + .payloads.parquet (или старый .jsonl)
+embeddings_prefix1 = 'embeddings/all_chunks'
+embeddings_prefix2 = 'embeddings/schedules_chunks'
 bucket_name = 'rag-sources'
 
 # две коллекции для документов и расписания
 collection_name1 = 'text_embeddings'
 collection_name2 = 'schedules_embeddings'
 
+# куда сохраняем прогресс загрузки, чтобы после сбоя продолжить с того же места
+checkpoint_prefix = 'checkpoints/qdrnt'
+
+# точек в одном upsert, параллельных воркеров и точек между чекпоинтами;
+# в памяти одновременно не больше segment_size точек, независимо от размера корпуса
+batch_size = int(os.getenv('QDRANT_UPLOAD_BATCH', '256'))
+parallel = int(os.getenv('QDRANT_UPLOAD_PARALLEL', '4'))
+segment_size = int(os.getenv('QDRANT_UPLOAD_SEGMENT', '10000'))
+
+# RETRIEVAL_MODE=hybrid: коллекции с именованными векторами dense + bm25 (IDF считает Qdrant)
+hybrid = RETRIEVAL_MODE == 'hybrid'
+
 # клиент Qdrant
-client = QdrantClient(
-    url='http://212.192.220.24:6333',
-    api_key='pii5z%cE1',
-    timeout=120, # Таймаут для предотвращения разрыва соединения
-    prefer_grpc=False # Используем REST вместо gRPC для стабильности
+# транспорт выбирается переменной QDRANT_TRANSPORT (rest/grpc), сбои сети повторяются
+client = create_qdrant_client(
+    options=QdrantClientOptions(timeout=120) # Таймаут для предотвращения разрыва соединения
 )
 
-# ЗАПИХАЛИ В ФУНКЦИЮ
-def to_qdrnt(bucket_name, jsonl_object_path, collection_name):
-    collections = [col.name for col in client.get_collections().collections]
-    if collection_name not in collections:
-        print(f"Создаю коллекцию '{collection_name}'...")
+
+def create_collection(collection_name):
+    if hybrid:
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config={DENSE_VECTOR: VectorParams(size=384, distance=Distance.COSINE)},
+            sparse_vectors_config={SPARSE_VECTOR: SparseVectorParams(modifier=Modifier.IDF)},
+        )
+    else:
         client.create_collection(
             collection_name=collection_name,
             vectors_config=VectorParams(size=384, distance=Distance.COSINE)
         )
+
+
+def ensure_collection(collection_name):
+    collections = [col.name for col in client.get_collections().collections]
+    if collection_name not in collections:
+        print(f"Создаю коллекцию '{collection_name}'...")
+        create_collection(collection_name)
         print(f"Коллекция '{collection_name}' успешно создана.")
+        return
+
+    sparse_config = client.get_collection(collection_name).config.params.sparse_vectors or {}
+    if hybrid and SPARSE_VECTOR not in sparse_config:
+        # схему векторов у существующей коллекции не поменять - пересоздаём, точки зальются заново
+        print(f"Коллекция '{collection_name}' без вектора '{SPARSE_VECTOR}', пересоздаю для гибридного поиска...")
+        client.delete_collection(collection_name)
+        create_collection(collection_name)
+        clear_checkpoint(bucket_name, collection_name)
     else:
         print(f"Коллекция '{collection_name}' уже существует.")
 
-    response = minio_client.get_object(bucket_name, jsonl_object_path)
 
-    points = []
+# ========== ЧЕКПОИНТЫ ==========
+
+def checkpoint_path(collection_name):
+    return f"{checkpoint_prefix}/{collection_name}.json"
+
 
+def load_checkpoint(bucket_name, object_path, collection_name, etag):
+    """Смещение в байтах, до которого файл уже загружен (0 - если файл сменился)"""
     try:
-        data = response.read().decode("utf-8")
-        for line in data.splitlines():
-            obj = json.loads(line)
+        response = minio_client.get_object(bucket_name, checkpoint_path(collection_name))
+        try:
+            state = json.loads(response.read())
+        finally:
+            response.close()
+            response.release_conn()
+    except Exception:
+        return 0
+
+    if state.get("object") != object_path or state.get("etag") != etag:
+        return 0
+    return state["offset"]
+
+
+def save_checkpoint(bucket_name, object_path, collection_name, etag, offset):
+    data = json.dumps({"object": object_path, "etag": etag, "offset": offset}).encode("utf-8")
+    minio_client.put_object(
+        bucket_name, checkpoint_path(collection_name), io.BytesIO(data), len(data),
+        content_type="application/json",
+    )
+
+
+def clear_checkpoint(bucket_name, collection_name):
+    minio_client.remove_object(bucket_name, checkpoint_path(collection_name))
+
+
+# ========== ПОТОКОВОЕ ЧТЕНИЕ ==========
 
-            # ВАЖНО: мы НЕ пересобираем структуру
-            point = {
-                "id": obj["id"],
-                "vector": obj["vector"],
-                "payload": obj["payload"]
-            }
+def iter_jsonl_lines(response, start_offset=0, chunk_size=1 << 20):
+    """Построчно читает JSONL из потока Minio, отдаёт (смещение конца строки, строка)"""
+    offset = start_offset
+    tail = b""
+    for chunk in response.stream(chunk_size):
+        tail += chunk
+        lines = tail.split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            offset += len(line) + 1
+            if line.strip():
+                yield offset, line
+    if tail.strip():
+        yield offset + len(tail), tail
 
-            points.append(point)
+
+def iter_segments(lines, size):
+    """Группирует точки по size штук, отдаёт (точки, смещение после последней)"""
+    points = []
+    end_offset = None
+    for end_offset, line in lines:
+        obj = json.loads(line)
+
+        # ВАЖНО: мы НЕ пересобираем структуру
+        # (в старом JSONL нет BM25 - в гибридной коллекции такие точки только с dense-вектором)
+        vector = {DENSE_VECTOR: obj["vector"]} if hybrid else obj["vector"]
+        points.append(PointStruct(id=obj["id"], vector=vector, payload=with_payload_hash(obj["payload"])))
+
+        if len(points) >= size:
+            yield points, end_offset
+            points = []
+    if points:
+        yield points, end_offset
+
+
+# ЗАПИХАЛИ В ФУНКЦИЮ
+def to_qdrnt(bucket_name, jsonl_object_path, collection_name):
+    ensure_collection(collection_name)
+
+    etag = minio_client.stat_object(bucket_name, jsonl_object_path).etag
+    offset = load_checkpoint(bucket_name, jsonl_object_path, collection_name, etag)
+    if offset:
+        print(f"Продолжаю загрузку '{jsonl_object_path}' с байта {offset}")
+
+    response = minio_client.get_object(bucket_name, jsonl_object_path, offset=offset)
+
+    uploaded = 0
+    try:
+        for points, end_offset in iter_segments(iter_jsonl_lines(response, offset), segment_size):
+            client.upload_points(
+                collection_name=collection_name,
+                points=points,
+                batch_size=batch_size,
+                parallel=parallel,
+                wait=True,
+            )
+            # сегмент целиком в Qdrant - можно сдвигать чекпоинт
+            save_checkpoint(bucket_name, jsonl_object_path, collection_name, etag, end_offset)
+            uploaded += len(points)
+            print(f"Загружено {uploaded} точек (байт {end_offset})")
 
     finally:
         response.close()
+        response.release_conn()
+
+    clear_checkpoint(bucket_name, collection_name)
+    print("Загрузка завершена.")
 
-    batch_size = 100
-    total_points = len(points)
 
-    for i in range(0, total_points, batch_size):
-        batch = points[i:i + batch_size]
-        client.upsert(
+def existing_point_hashes(collection_name):
+    """ID всех точек коллекции -> хэш payload (None у точек, залитых без хэша)"""
+    hashes = {}
+    next_offset = None
+    while True:
+        points, next_offset = client.scroll(
             collection_name=collection_name,
-            points=batch
+            limit=10000,
+            offset=next_offset,
+            with_payload=[PAYLOAD_HASH_FIELD],
+            with_vectors=False,
         )
-        print(f"Загружено {i + len(batch)} / {total_points}")
+        for point in points:
+            hashes[str(point.id)] = (point.payload or {}).get(PAYLOAD_HASH_FIELD)
+        if next_offset is None:
+            return hashes
+
+
+def to_qdrnt_artifact(bucket_name, embeddings_prefix, collection_name):
+    """Синхронизация с бинарным артефактом: грузим новые и изменившиеся точки, удаляем пропавшие.
+
+    ID чанков детерминированы (источник + позиция + хэш текста), поэтому изменившийся
+    текст - это новый ID. Метаданные же могут поменяться и при прежнем ID (алиасы дублей,
+    смещения), поэтому в payload лежит его хэш: точки с другим хэшем (или без него)
+    перезаливаются, остальные повторно не отправляются. created_at в хэш не входит -
+    у неизменившейся точки остаётся время первой загрузки. Повторный запуск после сбоя
+    сам продолжает с того места, где остановился.
+    """
+    ensure_collection(collection_name)
+    existing = existing_point_hashes(collection_name)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vectors, payloads = open_artifact(*download_artifact(minio_client, bucket_name, embeddings_prefix, tmp_dir))
+        # ID артефакта собираются по ходу чтения сегментов - таблица целиком в память не читается
+        current = set()
+        sparse = None
+        if hybrid:
+            sparse_path = download_sparse(minio_client, bucket_name, embeddings_prefix, tmp_dir)
+            if sparse_path is None:
+                print(f"⚠ У '{embeddings_prefix}' нет BM25-векторов - пересоберите making_embeddings")
+            else:
+                sparse = open_sparse(sparse_path, len(vectors))
+        sparse_segments = iter_sparse_segments(sparse, 0, segment_size) if sparse is not None else None
+
+        uploaded = updated = 0
+        for ids, segment, payload, end_row in iter_artifact_segments(vectors, payloads, 0, segment_size):
+            current.update(ids)
+            # BM25-сегменты читаются в ногу с payload, в том числе для пропускаемых сегментов
+            sparse_segment = next(sparse_segments) if sparse_segments is not None else None
+            for row in payload:
+                with_payload_hash(row)
+            rows = [i for i, point_id in enumerate(ids)
+                    if existing.get(point_id) != payload[i][PAYLOAD_HASH_FIELD]]
+            if not rows:
+                continue
+            if hybrid:
+                segment_vectors = []
+                for i in rows:
+                    vector = {DENSE_VECTOR: segment[i].tolist()}
+                    if sparse_segment is not None:
+                        indices, values = sparse_segment[i]
+                        vector[SPARSE_VECTOR] = SparseVector(indices=indices, values=values)
+                    segment_vectors.append(vector)
+            else:
+                segment_vectors = segment[rows]
+            client.upload_collection(
+                collection_name=collection_name,
+                vectors=segment_vectors,
+                payload=[payload[i] for i in rows],
+                ids=[ids[i] for i in rows],
+                batch_size=batch_size,
+                parallel=parallel,
+                wait=True,
+            )
+            changed = sum(ids[i] in existing for i in rows)
+            updated += changed
+            uploaded += len(rows) - changed
+            print(f"Загружено {uploaded} новых и {updated} изменившихся точек "
+                  f"(просмотрено {end_row} / {len(vectors)})")
+
+        del vectors, payloads, sparse, sparse_segments
+
+    vanished = list(existing.keys() - current)
+    for i in range(0, len(vanished), 1000):
+        client.delete(
+            collection_name=collection_name,
+            points_selector=PointIdsList(points=vanished[i:i + 1000]),
+            wait=True,
+        )
+    print(f"Синхронизация завершена: +{uploaded}, изменено {updated}, -{len(vanished)}, "
+          f"без изменений {len(current) - uploaded - updated}")
+
+
+def has_artifact(bucket_name, embeddings_prefix):
+    try:
+        minio_client.stat_object(bucket_name, vectors_object(embeddings_prefix))
+        return True
+    except Exception:
+        return False
+
+
+def upload_embeddings(bucket_name, embeddings_prefix, collection_name):
+    if has_artifact(bucket_name, embeddings_prefix):
+        to_qdrnt_artifact(bucket_name, embeddings_prefix, collection_name)
+    else:
+        to_qdrnt(bucket_name, jsonl_object(embeddings_prefix), collection_name)
 
-    print("Загрузка завершена.")
 
+if __name__ == "__main__":
+    # вызываем функцию для каждого набора эмбеддингов
+    upload_embeddings(bucket_name, embeddings_prefix1, collection_name1)
+    upload_embeddings(bucket_name, embeddings_prefix2, collection_name2)
 
-# вызываем функцию для каждого файла
-to_qdrnt(bucket_name, jsonl_object_path1, collection_name1)
-to_qdrnt(bucket_name, jsonl_object_path2, collection_name2)
\ No newline at end of file
+    # новая версия коллекций - боты сбрасывают закэшированные ответы LLM
+    publish_collection_version(minio_client, bucket_name)
@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import io
+import json
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+COLLECTION_VERSION_BUCKET = "rag-sources"
+COLLECTION_VERSION_OBJECT = "embeddings/collection_version.json"
+DEFAULT_VERSION = "unversioned"
+
+
+# ========== ВЕРСИЯ КОЛЛЕКЦИЙ ==========
+
+def publish_collection_version(client=None, bucket: str = COLLECTION_VERSION_BUCKET,
+                               object_name: str = COLLECTION_VERSION_OBJECT) -> str:
+    """Публикует новую версию коллекций в MinIO (вызывается после загрузки в Qdrant)"""
+    if client is None:
+        from rag_sources.minio_client import get_minio_client
+        client = get_minio_client()
+
+    version = uuid.uuid4().hex
+    data = json.dumps({
+        "version": version,
+        "published_at": datetime.now(timezone.utc).isoformat(),
+    }).encode("utf-8")
+
+    client.put_object(bucket, object_name, io.BytesIO(data), len(data), content_type="application/json")
+    print(f"✓ Опубликована версия коллекций {version}")
+    return version
+
+
+class CollectionVersionWatcher:
+    """Читает маркер версии коллекций из MinIO не чаще раза в refresh_seconds"""
+
+    def __init__(self, client=None, bucket: str = COLLECTION_VERSION_BUCKET,
+                 object_name: str = COLLECTION_VERSION_OBJECT, refresh_seconds: float = 60.0):
+        self.client = client
+        self.bucket = bucket
+        self.object_name = object_name
+        self.refresh_seconds = refresh_seconds
+        self._version = DEFAULT_VERSION
+        self._checked_at: Optional[float] = None
+
+    @property
+    def stale(self) -> bool:
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.refresh_seconds
+
+    def get(self) -> str:
+        if not self.stale:
+            return self._version
+
+        self._checked_at = time.monotonic()
+        try:
+            if self.client is None:
+                from rag_sources.minio_client import get_minio_client
+                self.client = get_minio_client()
+            response = self.client.get_object(self.bucket, self.object_name)
+            try:
+                self._version = json.loads(response.read())["version"]
+            finally:
+                response.close()
+                response.release_conn()
+        except Exception as e:
+            # Маркер недоступен - продолжаем со старой версией
+            print(f"⚠ Версия коллекций не прочитана: {e}")
+        return self._version
+
+    async def aget(self) -> str:
+        if not self.stale:
+            return self._version
+        return await asyncio.to_thread(self.get)
+
+
+# ========== ХРАНИЛИЩА ==========
+
+class InMemoryAnswerStore:
+    """Ответы в памяти процесса: docs_key -> список (вектор запроса, ответ), LRU по docs_key"""
+
+    def __init__(self, max_keys: int = 10000, max_per_key: int = 16,
+                 ttl_seconds: Optional[float] = 24 * 3600):
+        self.max_keys = max_keys
+        self.max_per_key = max_per_key
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, List[Tuple[str, np.ndarray, str, float]]]" = OrderedDict()
+
+    async def candidates(self, docs_key: str, limit: int) -> List[Tuple[np.ndarray, str]]:
+        entries = self._entries.get(docs_key)
+        if not entries:
+            return []
+
+        if self.ttl_seconds is not None:
+            now = time.time()
+            entries[:] = [e for e in entries if now - e[3] <= self.ttl_seconds]
+            if not entries:
+                del self._entries[docs_key]
+                return []
+
+        self._entries.move_to_end(docs_key)
+        return [(vector, answer) for _, vector, answer, _ in entries[-limit:]]
+
+    async def add(self, docs_key: str, version: str, vector: np.ndarray, answer: str):
+        entries = self._entries.setdefault(docs_key, [])
+        entries.append((version, vector, answer, time.time()))
+        del entries[:-self.max_per_key]
+        self._entries.move_to_end(docs_key)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+
+    async def purge(self, keep_version: str) -> int:
+        removed = 0
+        for docs_key in list(self._entries):
+            entries = self._entries[docs_key]
+            kept = [e for e in entries if e[0] == keep_version]
+            removed += len(entries) - len(kept)
+            if kept:
+                self._entries[docs_key] = kept
+            else:
+                del self._entries[docs_key]
+        return removed
+
+    async def close(self):
+        pass
+
+
+class PostgresAnswerStore:
+    """Ответы в Postgres (таблица llm_answer_cache, см. migrations/003_llm_answer_cache.sql).
+
+    Общий кэш для нескольких экземпляров бота; переживает рестарты.
+    """
+
+    def __init__(self, dsn: str, ttl_seconds: Optional[float] = 7 * 24 * 3600,
+                 min_size: int = 1, max_size: int = 10):
+        self.dsn = dsn
+        self.ttl_seconds = ttl_seconds
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _get_pool(self):
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    import asyncpg
+                    self._pool = await asyncpg.create_pool(
+                        self.dsn, min_size=self.min_size, max_size=self.max_size
+                    )
+        return self._pool
+
+    async def candidates(self, docs_key: str, limit: int) -> List[Tuple[np.ndarray, str]]:
+        pool = await self._get_pool()
+        ttl = self.ttl_seconds if self.ttl_seconds is not None else 10 ** 9
+        rows = await pool.fetch(
+            """
+            SELECT embedding, answer
+            FROM llm_answer_cache
+            WHERE docs_key = $1
+              AND created_at > NOW() - make_interval(secs => $2)
+            ORDER BY created_at DESC
+            LIMIT $3
+            """,
+            docs_key, float(ttl), limit,
+        )
+        return [(np.frombuffer(row["embedding"], dtype=np.float32), row["answer"]) for row in rows]
+
+    async def add(self, docs_key: str, version: str, vector: np.ndarray, answer: str):
+        pool = await self._get_pool()
+        await pool.execute(
+            """
+            INSERT INTO llm_answer_cache (docs_key, collection_version, embedding, answer)
+            VALUES ($1, $2, $3, $4)
+            """,
+            docs_key, version, np.asarray(vector, dtype=np.float32).tobytes(), answer,
+        )
+
+    async def purge(self, keep_version: str) -> int:
+        pool = await self._get_pool()
+        result = await pool.execute(
+            "DELETE FROM llm_answer_cache WHERE collection_version <> $1", keep_version
+        )
+        return int(result.split()[-1])
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+
+# ========== КЭШ ==========
+
+class SemanticAnswerCache:
+    """Семантический кэш ответов LLM.
+
+    Ключ - набор найденных документов (их ID) и версия коллекций; внутри ключа ответ
+    переиспользуется, если косинус между векторами запросов не ниже threshold.
+    Так "как получить стипендию" и "как получить стипендию?" получают один ответ,
+    а после переиндексации старые ответы перестают находиться и вычищаются.
+    """
+
+    def __init__(self, store=None, version_watcher: Optional[CollectionVersionWatcher] = None,
+                 threshold: float = 0.95, max_candidates: int = 32):
+        self.store = store if store is not None else InMemoryAnswerStore()
+        self.version_watcher = version_watcher
+        self.threshold = threshold
+        self.max_candidates = max_candidates
+        self._version: Optional[str] = None
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def docs_key(doc_ids: Sequence, version: str) -> str:
+        ids = "\x00".join(sorted(str(doc_id) for doc_id in doc_ids))
+        return hashlib.blake2b(f"{version}\x01{ids}".encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def _current_version(self) -> str:
+        if self.version_watcher is None:
+            return DEFAULT_VERSION
+
+        version = await self.version_watcher.aget()
+        if self._version is not None and version != self._version:
+            removed = await self.store.purge(version)
+            print(f"♻ Версия коллекций сменилась, из кэша ответов удалено {removed} записей")
+        self._version = version
+        return version
+
+    async def alookup(self, query_vector, doc_ids: Sequence) -> Optional[str]:
+        docs_key = self.docs_key(doc_ids, await self._current_version())
+        candidates = await self.store.candidates(docs_key, self.max_candidates)
+
+        if candidates:
+            query = self._normalize(query_vector)
+            matrix = np.stack([self._normalize(vector) for vector, _ in candidates])
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                self.hits += 1
+                return candidates[best][1]
+
+        self.misses += 1
+        return None
+
+    async def astore(self, query_vector, doc_ids: Sequence, answer: str):
+        version = await self._current_version()
+        await self.store.add(self.docs_key(doc_ids, version), version, self._normalize(query_vector), answer)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    async def close(self):
+        await self.store.close()
@@ -0,0 +1,231 @@
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+from rag_sources.answer_cache import SemanticAnswerCache
+from rag_sources.context_builder import ContextBuilder
+from rag_sources.embedding_cache import EmbeddingCache
+from rag_sources.qdrant_factory import (
+    AsyncRetryingQdrantClient,
+    QdrantClientOptions,
+    create_async_qdrant_client,
+)
+from rag_sources.qdrant_search import (
+    LLM_ERROR_PREFIXES,
+    UniversityBot,
+    lessons_from_points,
+    merge_documents,
+)
+from rag_sources.reranker import Reranker
+from rag_sources.schedule_index import ScheduleIndex
+from rag_sources.sparse_encoder import RETRIEVAL_MODE
+
+
+class AsyncUniversityBot(UniversityBot):
+    """Неблокирующая версия UniversityBot для async-обработчиков Telegram.
+
+    Qdrant - через AsyncQdrantClient, LLM - через общий httpx.AsyncClient,
+    encode модели - в ограниченном пуле потоков, чтобы не держать event loop.
+    """
+
+    def __init__(self, qdrant_url: str, api_key: str, llm_api_key: str = None,
+                 schedule_index: Optional[ScheduleIndex] = None,
+                 encode_workers: int = 2, batch_window_ms: Optional[float] = None,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 collection_timeout: float = 5.0,
+                 answer_cache: Optional[SemanticAnswerCache] = None,
+                 qdrant_options: Optional[QdrantClientOptions] = None,
+                 model=None, qdrant: Optional[AsyncRetryingQdrantClient] = None,
+                 retrieval_mode: str = RETRIEVAL_MODE,
+                 reranker: Optional[Reranker] = None,
+                 context_builder: Optional[ContextBuilder] = None):
+        self.answer_cache = answer_cache
+        # encode на CPU: не больше encode_workers одновременных прогонов модели
+        self.encode_workers = encode_workers
+        super().__init__(qdrant_url, api_key, llm_api_key, schedule_index=schedule_index,
+                         batch_window_ms=batch_window_ms, embedding_cache=embedding_cache,
+                         collection_timeout=collection_timeout, qdrant_options=qdrant_options,
+                         retrieval_mode=retrieval_mode, reranker=reranker,
+                         context_builder=context_builder, model=model, qdrant=qdrant)
+
+    def _create_qdrant(self, qdrant_url: str, api_key: str, qdrant_options: Optional[QdrantClientOptions]):
+        qdrant = create_async_qdrant_client(qdrant_url, api_key, qdrant_options)
+        print("Async Qdrant client initialized")
+        return qdrant
+
+    def _init_executors(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.encode_workers, thread_name_prefix="encode")
+
+    def _check_collections(self):
+        # клиент асинхронный - коллекции проверяет await check_collections() после старта цикла
+        pass
+
+    async def check_collections(self):
+        """Проверяет доступность коллекций"""
+        try:
+            collections = await self.qdrant.get_collections()
+            names = {collection.name for collection in collections.collections}
+            for coll in [self.text_collection, self.schedule_collection]:
+                if coll in names:
+                    info = await self.qdrant.get_collection(coll)
+                    print(f"✓ Коллекция '{coll}': {info.points_count} записей")
+                else:
+                    print(f"⚠ Коллекция '{coll}' не найдена")
+        except Exception as e:
+            print(f"Ошибка при проверке коллекций: {e}")
+
+    async def close(self):
+        await self.qdrant.close()
+        if self.has_llm:
+            await self.llm.aclose()
+        self._executor.shutdown(wait=False)
+        if self.batcher is not None:
+            self.batcher.close()
+        if self.embedding_cache is not None:
+            self.embedding_cache.save()
+        if self.answer_cache is not None:
+            await self.answer_cache.close()
+
+    async def _aencode(self, query: str) -> List[float]:
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(query)
+            if cached is not None:
+                return cached.tolist()
+
+        if self.batcher is not None:
+            vector = await self.batcher.aencode(query)
+        else:
+            loop = asyncio.get_running_loop()
+            vector = await loop.run_in_executor(
+                self._executor, partial(self.model.encode, query, normalize_embeddings=True)
+            )
+
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(query, vector)
+        return vector.tolist()
+
+    # ========== РАСПИСАНИЕ ==========
+
+    async def asearch_schedule_flexible(self, query: str, criteria: Dict[str, Any], limit=1000):
+        """Поиск расписания"""
+        if any([criteria["groups"], criteria["rooms"], criteria["teachers"],
+                criteria["days"], criteria["times"]]):
+            if self.schedule_index is not None:
+                if self.schedule_index.sync_stale:
+                    # дельты читаются в потоке, применяются в цикле событий - поиск не видит индекс наполовину
+                    records = await asyncio.to_thread(self.schedule_index.fetch_deltas)
+                    self.schedule_index.apply_delta(records)
+                return self.schedule_index.search(criteria, limit)
+            return await self._asearch_schedule_with_filters(criteria, limit)
+
+        query_vector = await self._aencode(query)
+
+        try:
+            results = await self.qdrant.query_points(
+                collection_name=self.schedule_collection,
+                **self._query_params(query, query_vector, limit),
+            )
+            return lessons_from_points(results.points, with_score=True)
+
+        except Exception:
+            return []
+
+    async def _asearch_schedule_with_filters(self, criteria: Dict[str, Any], limit=1000):
+        filter_ = self._build_schedule_filter(criteria)
+        if filter_ is None:
+            return []
+
+        all_points = []
+        next_offset = None
+
+        while len(all_points) < limit:
+            try:
+                points, next_offset = await self.qdrant.scroll(
+                    collection_name=self.schedule_collection,
+                    scroll_filter=filter_,
+                    limit=500,
+                    offset=next_offset,
+                    with_payload=True
+                )
+            except Exception:
+                break
+
+            all_points.extend(points)
+            if not points or next_offset is None:
+                break
+
+        return lessons_from_points(all_points)
+
+    # ========== ОБЩИЕ ВОПРОСЫ ==========
+
+    async def _aquery_collection(self, coll: str, params: Dict[str, Any]):
+        try:
+            response = await asyncio.wait_for(
+                self.qdrant.query_points(collection_name=coll, timeout=math.ceil(self.collection_timeout), **params),
+                timeout=self.collection_timeout,
+            )
+            return coll, response.points
+        except asyncio.TimeoutError:
+            print(f"⚠ Коллекция '{coll}' не ответила за {self.collection_timeout} с, пропускаем")
+        except Exception as e:
+            print(f"Ошибка поиска в коллекции '{coll}': {e}")
+        return coll, []
+
+    async def asearch_documents(self, query: str, top_k: int = 10,
+                                query_vector: Optional[List[float]] = None) -> List[Dict]:
+        if query_vector is None:
+            query_vector = await self._aencode(query)
+
+        params = self._query_params(query, query_vector, top_k)
+        results = await asyncio.gather(*(
+            self._aquery_collection(coll, params)
+            for coll in [self.text_collection, self.schedule_collection]
+        ))
+        return merge_documents(results, top_k)
+
+    # ========== ОСНОВНОЙ МЕТОД ОБРАБОТКИ ==========
+
+    async def aprocess_query(self, query: str, use_llm_for_general: bool = True) -> Dict[str, Any]:
+        """Асинхронный аналог process_query"""
+        analysis = self.detect_query_type(query)
+        print(f"🔍 Анализ запроса: {analysis}")
+
+        if analysis["type"] == "schedule":
+            lessons = await self.asearch_schedule_flexible(query, analysis, limit=300)
+            return self._schedule_response(query, lessons)
+
+        query_vector = await self._aencode(query)
+        docs = await self.asearch_documents(query, top_k=self._candidate_count(8), query_vector=query_vector)
+        if self.reranker is not None:
+            # кросс-энкодер на CPU - в том же пуле, что и encode; дедлайн ставим до очереди пула,
+            # чтобы ожидание свободного потока тоже входило в бюджет
+            deadline = self.reranker.deadline()
+            loop = asyncio.get_running_loop()
+            docs = await loop.run_in_executor(
+                self._executor, partial(self.reranker.rerank, query, docs, deadline=deadline)
+            )
+
+        llm_answer = None
+        if docs and use_llm_for_general and self.has_llm:
+            llm_answer = await self._agenerate_cached(query, query_vector, docs)
+
+        return self._general_response(query, docs, llm_answer)
+
+    async def _agenerate_cached(self, query: str, query_vector: List[float], docs: List[Dict]) -> str:
+        """Ответ LLM с семантическим кэшем по вектору запроса и набору документов"""
+        doc_ids = [doc["id"] for doc in docs]
+        if self.answer_cache is not None:
+            cached = await self.answer_cache.alookup(query_vector, doc_ids)
+            if cached is not None:
+                return cached
+
+        # подсчёт токенов tiktoken и дедупликация предложений - CPU, тоже в пул
+        loop = asyncio.get_running_loop()
+        context = await loop.run_in_executor(self._executor, self.build_context, docs)
+        llm_answer = await self.llm.agenerate_answer(query, context)
+
+        if self.answer_cache is not None and not llm_answer.startswith(LLM_ERROR_PREFIXES):
+            await self.answer_cache.astore(query_vector, doc_ids, llm_answer)
+        return llm_answer
@@ -0,0 +1,170 @@
+"""Нагрузочный бенчмарк AsyncUniversityBot: много одновременных чатов.
+
+Модель, Qdrant и Caila заменены заглушками с фиксированными задержками, поэтому
+измеряется только то, как бот распределяет ожидание. Быстрые запросы расписания
+не должны стоять в очереди за медленными ответами LLM.
+
+    python -m rag_sources.benchmarks.bench_async_bot --chats 200 --llm-ms 800
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import statistics
+import time
+
+import httpx
+import numpy as np
+
+from rag_sources.async_university_bot import AsyncUniversityBot
+from rag_sources.schedule_index import ScheduleIndex
+
+GENERAL_QUERIES = [
+    "Как получить стипендию?",
+    "Где найти методические материалы?",
+    "Как получить материальную помощь?",
+    "Какие документы нужны для поступления?",
+]
+SCHEDULE_QUERIES = [
+    "расписание группы 4318",
+    "расписание группы 3333",
+    "пары в аудитории 52-17",
+]
+
+
+class FakeModel:
+    """CPU-нагрузка encode: блокирует поток на encode_ms"""
+
+    def __init__(self, encode_ms: float):
+        self.encode_ms = encode_ms
+
+    def encode(self, text, normalize_embeddings=True):
+        time.sleep(self.encode_ms / 1000)
+        return np.random.rand(384).astype(np.float32)
+
+
+class FakePoint:
+    def __init__(self, i: int, collection: str):
+        self.id = i
+        self.score = random.random()
+        self.payload = {"text": f"{collection} документ {i}", "document_id": f"doc_{i}"}
+
+
+class FakeResponse:
+    def __init__(self, points):
+        self.points = points
+
+
+class FakeAsyncQdrant:
+    def __init__(self, search_ms: float):
+        self.search_ms = search_ms
+
+    async def query_points(self, collection_name, query, limit=10, **kwargs):
+        await asyncio.sleep(self.search_ms / 1000)
+        return FakeResponse([FakePoint(i, collection_name) for i in range(limit)])
+
+    async def close(self):
+        pass
+
+
+def make_llm_transport(llm_ms: float) -> httpx.MockTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(llm_ms / 1000)
+        body = {"choices": [{"message": {"content": "ответ"}}]}
+        return httpx.Response(200, content=json.dumps(body).encode("utf-8"))
+
+    return httpx.MockTransport(handler)
+
+
+def make_schedule_index() -> ScheduleIndex:
+    index = ScheduleIndex()
+    for group in ("4318", "3333"):
+        for day in ("Понедельник", "Вторник", "Среда"):
+            for pair in range(1, 5):
+                index.add_lesson({
+                    "day": day, "time": f"{pair} пара", "week": "верхняя",
+                    "subject": f"Предмет {pair}", "room": "ауд. 52-17",
+                    "teacher": ["Иванов И.И."], "groups": [group],
+                })
+    return index
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+async def loop_lag_probe(stop: asyncio.Event, interval: float = 0.01):
+    """Максимальная задержка тиков event loop - признак блокирующих вызовов"""
+    max_lag = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.perf_counter() - started - interval)
+    return max_lag
+
+
+async def run(args):
+    bot = AsyncUniversityBot(
+        qdrant_url="", api_key="", llm_api_key="bench",
+        schedule_index=make_schedule_index(),
+        encode_workers=args.encode_workers,
+        model=FakeModel(args.encode_ms),
+        qdrant=FakeAsyncQdrant(args.search_ms),
+    )
+    bot.llm._async_client = httpx.AsyncClient(transport=make_llm_transport(args.llm_ms))
+
+    async def one_chat(query: str):
+        started = time.perf_counter()
+        await bot.aprocess_query(query)
+        return query in SCHEDULE_QUERIES, time.perf_counter() - started
+
+    # Бот печатает анализ каждого запроса - в бенчмарке это шум
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Одиночный общий запрос - столько же ждал бы каждый пользователь в очереди sync-бота
+        _, single = await one_chat(GENERAL_QUERIES[0])
+
+        queries = [
+            random.choice(SCHEDULE_QUERIES) if random.random() < args.schedule_share else random.choice(GENERAL_QUERIES)
+            for _ in range(args.chats)
+        ]
+
+        stop = asyncio.Event()
+        probe = asyncio.create_task(loop_lag_probe(stop))
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one_chat(q) for q in queries))
+        wall = time.perf_counter() - started
+        stop.set()
+        max_lag = await probe
+
+    general = [lat for is_schedule, lat in results if not is_schedule]
+    schedule = [lat for is_schedule, lat in results if is_schedule]
+
+    print(f"Чатов: {args.chats} (расписание: {len(schedule)}, общие: {len(general)})")
+    print(f"Один общий запрос: {single * 1000:.0f} мс; последовательно было бы ~{single * len(general):.1f} с")
+    print(f"Общее время async: {wall:.2f} с, пропускная способность {args.chats / wall:.1f} запросов/с")
+    if general:
+        print(f"Общие вопросы: p50 {percentile(general, 50) * 1000:.0f} мс, p99 {percentile(general, 99) * 1000:.0f} мс")
+    if schedule:
+        print(f"Расписание: p50 {percentile(schedule, 50) * 1000:.1f} мс, p99 {percentile(schedule, 99) * 1000:.1f} мс, "
+              f"среднее {statistics.mean(schedule) * 1000:.1f} мс")
+    print(f"Максимальная задержка event loop: {max_lag * 1000:.1f} мс")
+
+    await bot.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--schedule-share", type=float, default=0.5)
+    parser.add_argument("--llm-ms", type=float, default=800)
+    parser.add_argument("--search-ms", type=float, default=20)
+    parser.add_argument("--encode-ms", type=float, default=10)
+    parser.add_argument("--encode-workers", type=int, default=2)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Старый chunk_by_gpt_tokens против rag_sources.chunking на больших документах.
+
+Документы - локальные PDF (--pdf, текст через pdfminer) и/или текстовые файлы (--text);
+без них берётся синтетический текст размером --synthetic-chars. Для каждого варианта
+печатается время, скорость в символах/с, число чанков и доля чанков с верными смещениями
+(text[start_offset:end_offset] совпадает с текстом чанка).
+
+    python -m rag_sources.benchmarks.bench_chunking --pdf docs/*.pdf --repeat 3
+"""
+import argparse
+import random
+import time
+
+import tiktoken
+
+from rag_sources.chunking import STRATEGIES, chunk_text, normalize_text
+
+
+def legacy_chunk_by_gpt_tokens(text, chunk_size=512, overlap=50):
+    """Реализация из pdf_to_chunks до общего модуля, как была"""
+    enc = tiktoken.encoding_for_model("gpt-3.5-turbo")
+    tokens = enc.encode(text)
+    chunks, start_idx, chunk_id = [], 0, 0
+
+    while start_idx < len(tokens):
+        end_idx = min(start_idx + chunk_size, len(tokens))
+        chunk_text = enc.decode(tokens[start_idx:end_idx])
+        last_space = chunk_text.rfind(" ")
+        if last_space != -1 and end_idx != len(tokens):
+            chunk_text = chunk_text[:last_space]
+            end_idx = start_idx + len(enc.encode(chunk_text))
+        start_offset = text.find(chunk_text)
+        end_offset = start_offset + len(chunk_text)
+        chunks.append({
+            "chunk_uid": f"chunk_{chunk_id}",
+            "chunk_id": chunk_id,
+            "text": chunk_text.strip(),
+            "token_count": len(enc.encode(chunk_text)),
+            "start_offset": start_offset,
+            "end_offset": end_offset
+        })
+        start_idx = max(end_idx - overlap, end_idx)
+        chunk_id += 1
+    return [c for c in chunks if c["token_count"] >= 40]
+
+
+def load_documents(args):
+    documents = []
+    for path in args.pdf or []:
+        from pdfminer.high_level import extract_text
+        documents.append((path, extract_text(path)))
+    for path in args.text or []:
+        with open(path, encoding="utf-8") as f:
+            documents.append((path, f.read()))
+    if not documents:
+        rng = random.Random(0)
+        words = ("студент обязан предоставить документы в деканат до начала сессии "
+                 "расписание занятий кафедра приказ ректора положение о порядке").split()
+        lines, size = [], 0
+        while size < args.synthetic_chars:
+            line = " ".join(rng.choice(words) for _ in range(rng.randint(5, 25))).capitalize() + "."
+            if rng.random() < 0.02:
+                line = f"{rng.randint(1, 9)}.{rng.randint(1, 9)} Общие положения"
+            lines.append(line)
+            size += len(line) + 1
+        documents.append(("synthetic", "\n".join(lines)))
+    return documents
+
+
+def offsets_ok(text, chunks):
+    if not chunks:
+        return 1.0
+    ok = sum(text[c["start_offset"]:c["end_offset"]].strip() == c["text"] for c in chunks)
+    return ok / len(chunks)
+
+
+def measure(name, func, documents, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [func(text) for _, text in documents]
+        best = min(best, time.perf_counter() - started)
+    chars = sum(len(text) for _, text in documents)
+    chunks = sum(len(r) for r in results)
+    ok = sum(offsets_ok(text, r) * len(r) for (_, text), r in zip(documents, results, strict=True)) / max(chunks, 1)
+    print(f"{name:>10} | {best * 1000:>9.1f} | {chars / best:>12.0f} | {chunks:>7} | {ok:>8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", nargs="*", help="локальные PDF")
+    parser.add_argument("--text", nargs="*", help="локальные текстовые файлы")
+    parser.add_argument("--synthetic-chars", type=int, default=2_000_000)
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--overlap", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    documents = load_documents(args)
+    # старый код получает текст, как его готовила стадия: с пробелами вместо переносов
+    flat = [(name, normalize_text(text)) for name, text in documents]
+    lined = [(name, normalize_text(text, keep_lines=True)) for name, text in documents]
+    chunk_text("прогрев энкодера", "token")
+    print(f"Документов: {len(documents)}, символов: {sum(len(t) for _, t in flat)}")
+
+    print(f"{'вариант':>10} | {'мс':>9} | {'символов/с':>12} | {'чанков':>7} | {'смещения':>8}")
+    measure("legacy", lambda t: legacy_chunk_by_gpt_tokens(t, args.chunk_size, args.overlap), flat, args.repeat)
+    for strategy in STRATEGIES:
+        docs = lined if strategy == "heading" else flat
+        measure(strategy, lambda t, s=strategy: chunk_text(t, s, args.chunk_size, args.overlap, min_tokens=40),
+                docs, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
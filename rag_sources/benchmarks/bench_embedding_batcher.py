@@ -0,0 +1,73 @@
+"""Пропускная способность EmbeddingBatcher в зависимости от окна батча.
+
+По умолчанию используется заглушка модели со стоимостью прогона
+fixed_ms + per_item_ms * размер_батча (как у MiniLM на CPU: накладные расходы
+прогона велики, добавочный текст в батче дешёвый). С --real грузится настоящая модель.
+
+    python -m rag_sources.benchmarks.bench_embedding_batcher --windows 0 1 2 5 10 20
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from rag_sources.embedding_batcher import EmbeddingBatcher
+
+EMBED_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+QUERIES = [
+    "Как получить стипендию?",
+    "Где находится деканат моего факультета?",
+    "Какие контакты учебного отдела?",
+    "Как получить материальную помощь?",
+    "Какие документы нужны для поступления?",
+]
+
+
+class FakeModel:
+    def __init__(self, fixed_ms: float, per_item_ms: float):
+        self.fixed_ms = fixed_ms
+        self.per_item_ms = per_item_ms
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True, show_progress_bar=False):
+        time.sleep((self.fixed_ms + self.per_item_ms * len(texts)) / 1000)
+        return np.random.rand(len(texts), 384).astype(np.float32)
+
+
+def run_window(model, window_ms: float, requests: int, clients: int):
+    batcher = EmbeddingBatcher(model, max_batch_size=64, max_wait_ms=window_ms)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(batcher.encode, (QUERIES[i % len(QUERIES)] for i in range(requests))))
+    elapsed = time.perf_counter() - started
+    stats = batcher.stats()
+    batcher.close()
+    return elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 1, 2, 5, 10, 20])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=32, help="одновременных вызывающих потоков")
+    parser.add_argument("--fixed-ms", type=float, default=8.0)
+    parser.add_argument("--per-item-ms", type=float, default=0.5)
+    parser.add_argument("--real", action="store_true", help="использовать настоящую модель")
+    args = parser.parse_args()
+
+    if args.real:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(EMBED_MODEL, device="cpu")
+    else:
+        model = FakeModel(args.fixed_ms, args.per_item_ms)
+
+    print(f"{'окно, мс':>9} | {'запросов/с':>10} | {'ср. батч':>8} | {'ср. ожидание, мс':>16}")
+    for window in args.windows:
+        elapsed, stats = run_window(model, window, args.requests, args.clients)
+        print(f"{window:>9g} | {args.requests / elapsed:>10.1f} | "
+              f"{stats['batch_size']['mean']:>8.1f} | {stats['queue_wait_ms']['mean']:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
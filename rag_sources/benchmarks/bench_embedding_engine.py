@@ -0,0 +1,79 @@
+"""Скорость EmbeddingEngine по backend'ам и проверка recall@10 квантованных векторов.
+
+Корпус - первые --limit чанков all_chunks (локальный файл или объект в MinIO).
+Эталон - backend torch; для остальных считается recall@10 соседей относительно эталона,
+и если он ниже --min-recall, скрипт завершается с кодом 1.
+
+    python -m rag_sources.benchmarks.bench_embedding_engine --limit 2000 \\
+        --backends torch onnx onnx-int8 --processes 0 4
+"""
+import argparse
+import sys
+import time
+from itertools import islice
+
+import numpy as np
+
+from rag_sources.chunk_io import read_chunks, read_chunks_file
+from rag_sources.embedding_engine import BACKENDS, EmbeddingEngine, recall_at_k
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+CHUNKS_OBJECT = "tmp_chunks_for_embeddings/all_chunks"
+
+
+def load_texts(path, limit):
+    if path:
+        chunks = read_chunks_file(path)
+    else:
+        from rag_sources.minio_client import get_minio_client
+        chunks = read_chunks(get_minio_client(), "rag-sources", CHUNKS_OBJECT)
+    return [c["text"] for c in islice(chunks, limit) if c.get("text")]
+
+
+def run(texts, backend, processes, batch_size):
+    engine = EmbeddingEngine(MODEL_NAME, backend=backend, processes=processes, batch_size=batch_size)
+    try:
+        # прогрев: загрузка модели (и процессов) не входит в замер
+        engine.encode(texts[:processes * 2 or 1])
+        started = time.perf_counter()
+        vectors = engine.encode(texts)
+        elapsed = time.perf_counter() - started
+    finally:
+        engine.close()
+    return vectors, len(texts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks-file", help="локальный all_chunks (.ndjson/.json) вместо MinIO")
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--processes", type=int, nargs="+", default=[0])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200, help="запросов для recall@10")
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    args = parser.parse_args()
+
+    texts = load_texts(args.chunks_file, args.limit)
+    queries = np.random.default_rng(0).choice(len(texts), size=min(args.queries, len(texts)), replace=False)
+    print(f"Корпус: {len(texts)} чанков")
+
+    reference = None
+    failed = False
+    print(f"{'backend':>10} | {'процессов':>9} | {'чанков/с':>9} | {'recall@10':>9}")
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        for processes in args.processes:
+            vectors, speed = run(texts, backend, processes, args.batch_size)
+            if reference is None:
+                reference = vectors
+            recall = recall_at_k(reference, vectors, k=10, queries=queries)
+            failed |= recall < args.min_recall
+            print(f"{backend:>10} | {processes:>9} | {speed:>9.1f} | {recall:>9.3f}")
+
+    if failed:
+        print(f"recall@10 ниже порога {args.min_recall}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
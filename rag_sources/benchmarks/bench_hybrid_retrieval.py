@@ -0,0 +1,136 @@
+"""Dense против гибридного (dense + BM25, RRF) поиска на запросах с точными токенами.
+
+Нужен локальный Qdrant и файл чанков расписания (NDJSON из txt_to_chunks):
+
+    docker run --rm -p 6333:6333 qdrant/qdrant
+    python -m rag_sources.benchmarks.bench_hybrid_retrieval --chunks schedules_chunks.ndjson --queries 300
+
+Чанки заливаются в две временные коллекции: с безымянным вектором (как сейчас) и с именованными
+dense + bm25. Запросы строятся из метаданных: "расписание группы 4318", "что в аудитории 52-17",
+"пары у Иванова"; релевантны чанки с этой группой / аудиторией / преподавателем.
+Печатается доля запросов, где в top-k есть релевантный чанк, precision@k и задержка p50/p95.
+"""
+import argparse
+import random
+import time
+import uuid
+
+import numpy as np
+from qdrant_client import models
+
+from rag_sources.chunk_io import read_chunks_file
+from rag_sources.qdrant_factory import QdrantClientOptions, create_qdrant_client
+from rag_sources.qdrant_search import EMBED_MODEL, HYBRID_PREFETCH
+from rag_sources.schedule_index import room_keys, teacher_surname
+from rag_sources.sparse_encoder import DENSE_VECTOR, SPARSE_VECTOR, SparseEncoder
+
+
+def make_queries(chunks, count, rng):
+    """(текст запроса, функция релевантности чанка)"""
+    queries = []
+    for _ in range(count * 3):
+        meta = rng.choice(chunks).get("metadata") or {}
+        kind = rng.choice(("group", "room", "teacher"))
+        if kind == "group" and meta.get("groups"):
+            group = rng.choice(meta["groups"])
+            queries.append((f"расписание группы {group}", lambda m, g=group: g in (m.get("groups") or [])))
+        elif kind == "room" and meta.get("room"):
+            keys = room_keys(meta["room"])
+            if keys:
+                key = sorted(keys)[0]
+                queries.append((f"какие пары в аудитории {key}",
+                                lambda m, k=key: k in room_keys(m.get("room") or "")))
+        elif kind == "teacher" and meta.get("teacher"):
+            surname = teacher_surname(rng.choice(meta["teacher"]))
+            if surname:
+                queries.append((f"занятия преподавателя {surname.capitalize()}",
+                                lambda m, s=surname: s in {teacher_surname(t) for t in m.get("teacher") or []}))
+        if len(queries) >= count:
+            break
+    return queries
+
+
+def measure(name, client, collection, queries, vectors, params_fn, k):
+    hits, precision, latencies = 0, 0.0, []
+    for (text, relevant), vector in zip(queries, vectors, strict=True):
+        started = time.perf_counter()
+        points = client.query_points(collection_name=collection, **params_fn(text, vector.tolist(), k)).points
+        latencies.append((time.perf_counter() - started) * 1000)
+        flags = [relevant(point.payload["metadata"]) for point in points]
+        hits += any(flags)
+        precision += sum(flags) / k
+    print(f"{name:>7} | {hits / len(queries):>8.1%} | {precision / len(queries):>8.1%} | "
+          f"{np.percentile(latencies, 50):>7.1f} | {np.percentile(latencies, 95):>7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", required=True, help="NDJSON с чанками расписания")
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=8)
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    chunks = [c for c in read_chunks_file(args.chunks) if c.get("metadata")]
+    rng = random.Random(0)
+    queries = make_queries(chunks, args.queries, rng)
+    print(f"Чанков: {len(chunks)}, запросов: {len(queries)}")
+
+    model = SentenceTransformer(EMBED_MODEL, device="cpu")
+    texts = [c["text"] for c in chunks]
+    doc_vectors = model.encode(texts, batch_size=64, normalize_embeddings=True, show_progress_bar=True)
+    query_vectors = model.encode([q for q, _ in queries], normalize_embeddings=True)
+    sparse = SparseEncoder().fit(texts)
+
+    client = create_qdrant_client(args.url, args.api_key, QdrantClientOptions(timeout=120))
+    dense_coll = f"bench_dense_{uuid.uuid4().hex[:8]}"
+    hybrid_coll = f"bench_hybrid_{uuid.uuid4().hex[:8]}"
+    client.create_collection(dense_coll, vectors_config=models.VectorParams(size=doc_vectors.shape[1],
+                                                                             distance=models.Distance.COSINE))
+    client.create_collection(
+        hybrid_coll,
+        vectors_config={DENSE_VECTOR: models.VectorParams(size=doc_vectors.shape[1], distance=models.Distance.COSINE)},
+        sparse_vectors_config={SPARSE_VECTOR: models.SparseVectorParams(modifier=models.Modifier.IDF)},
+    )
+
+    try:
+        payloads = [{"metadata": c["metadata"]} for c in chunks]
+        client.upload_collection(dense_coll, vectors=doc_vectors, payload=payloads, ids=list(range(len(chunks))), wait=True)
+        hybrid_vectors = []
+        for text, vector in zip(texts, doc_vectors, strict=True):
+            indices, values = sparse.encode_document(text)
+            hybrid_vectors.append({DENSE_VECTOR: vector.tolist(),
+                                   SPARSE_VECTOR: models.SparseVector(indices=indices, values=values)})
+        client.upload_collection(hybrid_coll, vectors=hybrid_vectors, payload=payloads,
+                                 ids=list(range(len(chunks))), wait=True)
+
+        def dense_params(text, vector, k):
+            return {"query": vector, "limit": k, "with_payload": True}
+
+        def hybrid_params(text, vector, k):
+            indices, values = SparseEncoder.encode_query(text)
+            prefetch_limit = max(k, HYBRID_PREFETCH)
+            return {
+                "prefetch": [
+                    models.Prefetch(query=vector, using=DENSE_VECTOR, limit=prefetch_limit),
+                    models.Prefetch(query=models.SparseVector(indices=indices, values=values),
+                                    using=SPARSE_VECTOR, limit=prefetch_limit),
+                ],
+                "query": models.FusionQuery(fusion=models.Fusion.RRF),
+                "limit": k,
+                "with_payload": True,
+            }
+
+        print(f"{'режим':>7} | {'hit@k':>8} | {'P@k':>8} | {'p50 мс':>7} | {'p95 мс':>7}")
+        measure("dense", client, dense_coll, queries, query_vectors, dense_params, args.top_k)
+        measure("hybrid", client, hybrid_coll, queries, query_vectors, hybrid_params, args.top_k)
+    finally:
+        client.delete_collection(dense_coll)
+        client.delete_collection(hybrid_coll)
+
+
+if __name__ == "__main__":
+    main()
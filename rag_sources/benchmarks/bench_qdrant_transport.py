@@ -0,0 +1,87 @@
+"""Сравнение REST и gRPC транспорта Qdrant: задержка поиска и скорость upsert.
+
+Нужен локальный Qdrant (обе порта - REST 6333 и gRPC 6334):
+
+    docker run --rm -p 6333:6333 -p 6334:6334 qdrant/qdrant
+    python -m rag_sources.benchmarks.bench_qdrant_transport --points 20000 --searches 2000
+
+Для каждого транспорта создаётся временная коллекция, заливается случайными
+векторами размерности MiniLM и опрашивается последовательными поисками.
+"""
+import argparse
+import statistics
+import time
+import uuid
+
+import numpy as np
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from rag_sources.qdrant_factory import QdrantClientOptions, create_qdrant_client
+
+VECTOR_SIZE = 384
+
+
+def random_vectors(count: int, rng: np.random.Generator) -> np.ndarray:
+    vectors = rng.standard_normal((count, VECTOR_SIZE), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def percentile(values, q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run_transport(transport: str, args, vectors: np.ndarray, queries: np.ndarray):
+    client = create_qdrant_client(args.url, args.api_key, QdrantClientOptions(transport=transport, timeout=120))
+    collection = f"bench_{transport}_{uuid.uuid4().hex[:8]}"
+    client.create_collection(collection, vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE))
+
+    try:
+        started = time.perf_counter()
+        for i in range(0, len(vectors), args.batch_size):
+            batch = vectors[i:i + args.batch_size]
+            client.upsert(
+                collection_name=collection,
+                points=[
+                    PointStruct(id=i + j, vector=vector.tolist(), payload={"text": f"chunk {i + j}"})
+                    for j, vector in enumerate(batch)
+                ],
+                wait=True,
+            )
+        upsert_elapsed = time.perf_counter() - started
+
+        latencies = []
+        for query in queries:
+            t = time.perf_counter()
+            client.query_points(collection_name=collection, query=query.tolist(), limit=10, with_payload=True)
+            latencies.append((time.perf_counter() - t) * 1000)
+    finally:
+        client.delete_collection(collection)
+        client.close()
+
+    return len(vectors) / upsert_elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--transports", nargs="+", default=["rest", "grpc"], choices=["rest", "grpc"])
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--searches", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = random_vectors(args.points, rng)
+    queries = random_vectors(args.searches, rng)
+
+    print(f"{'транспорт':>9} | {'upsert, точек/с':>15} | {'поиск p50, мс':>13} | {'поиск p99, мс':>13} | {'среднее, мс':>11}")
+    for transport in args.transports:
+        throughput, latencies = run_transport(transport, args, vectors, queries)
+        print(f"{transport:>9} | {throughput:>15.0f} | {percentile(latencies, 50):>13.2f} | "
+              f"{percentile(latencies, 99):>13.2f} | {statistics.mean(latencies):>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Точность и скорость QueryAnalyzer против прежнего detect_query_type.
+
+Набор запросов - query_analyzer_cases.jsonl: кнопки меню python_bot, запросы, которые бот
+собирает из ввода пользователя ("расписание группы ..."), и свободные вопросы. По нему
+правились правила анализатора, поэтому его точность завышена. Отдельно считается
+query_analyzer_holdout.jsonl - запросы в живой форме (сокращения, опечатки в регистре,
+вопросы с днями и фамилиями не про расписание), на которые правила не подгонялись;
+--min-accuracy проверяется по нему. Вместо него можно подать выгрузку реальных
+запросов из логов бота (--holdout) в том же формате. Справочники -
+небольшое расписание с группами/аудиториями/преподавателями из кнопок бота; с --chunks
+к нему добавляются реальные чанки расписания (размер справочников как в проде).
+"Сегодня" - понедельник, чтобы ожидаемые дни не зависели от даты запуска.
+
+    python rag_sources/benchmarks/bench_query_analyzer.py
+    python -m rag_sources.benchmarks.bench_query_analyzer --chunks schedules_chunks.ndjson --min-accuracy 0.9
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import date
+
+# запуск файлом из корня репозитория: пакет rag_sources лежит двумя уровнями выше
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from rag_sources.query_analyzer import QueryAnalyzer
+from rag_sources.schedule_index import ScheduleIndex
+
+CASES_PATH = os.path.join(os.path.dirname(__file__), "query_analyzer_cases.jsonl")
+HOLDOUT_PATH = os.path.join(os.path.dirname(__file__), "query_analyzer_holdout.jsonl")
+TODAY = date(2026, 10, 12)  # понедельник
+FIELDS = ("groups", "rooms", "teachers", "days", "times")
+
+FIXTURE_LESSONS = [
+    {"day": "Понедельник", "time": "1 пара", "subject": "Математический анализ", "room": "52-17",
+     "teacher": ["Иванов И.И."], "groups": ["4318", "3333"]},
+    {"day": "Среда", "time": "2 пара", "subject": "Физика", "room": "21-04",
+     "teacher": ["Петрова А.А."], "groups": ["М412"]},
+    {"day": "Пятница", "time": "3 пара", "subject": "Программирование", "room": "13-12а",
+     "teacher": ["Смирнов П.П."], "groups": ["ПМ-101", "4318"]},
+]
+
+
+def legacy_detect_query_type(query):
+    """detect_query_type до QueryAnalyzer (для сравнения)"""
+    query_lower = query.lower().strip()
+    analysis = {"type": "general", "groups": [], "rooms": [], "teachers": [], "days": [], "times": []}
+    schedule_keywords = ["расписание", "пара", "пары", "аудитория", "ауд",
+                         "лекция", "занятие", "семинар", "практика"]
+    has_schedule_kw = any(kw in query_lower for kw in schedule_keywords)
+    analysis["groups"] = list(set(re.findall(r'\b\d{3,4}[а-ямк]?\b', query_lower)))
+    analysis["rooms"] = re.findall(r'\b\d+-\d+\b', query)
+    days = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота"]
+    analysis["days"] = [day.capitalize() for day in days if day in query_lower]
+    analysis["times"] = [f"{i} пара" for i in range(1, 7)
+                         if f"{i} пара" in query_lower or f"{i}-я пара" in query_lower]
+    if has_schedule_kw or analysis["groups"] or analysis["rooms"] or analysis["days"] or analysis["times"]:
+        for word in query.split():
+            clean_word = re.sub(r'[.,!?;:]', '', word)
+            if (len(clean_word) > 2 and clean_word[0].isupper() and not clean_word.isdigit()
+                    and clean_word.lower() not in days and clean_word.lower() not in schedule_keywords):
+                analysis["teachers"].append(clean_word)
+    analysis["teachers"] = list(set(analysis["teachers"]))
+    if has_schedule_kw or any(analysis[field] for field in FIELDS):
+        analysis["type"] = "schedule"
+    return analysis
+
+
+def load_cases(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def case_correct(analysis, case):
+    if analysis["type"] != case["type"]:
+        return False
+    return all(sorted(analysis[field]) == sorted(case.get(field, [])) for field in FIELDS)
+
+
+def evaluate(name, detect, cases, repeat, verbose):
+    correct = typed = 0
+    for case in cases:
+        analysis = detect(case["query"])
+        typed += analysis["type"] == case["type"]
+        if case_correct(analysis, case):
+            correct += 1
+        elif verbose:
+            got = {field: analysis[field] for field in FIELDS if analysis[field]}
+            print(f"  ✗ {name}: {case['query']!r} -> {analysis['type']} {got}")
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for case in cases:
+            detect(case["query"])
+    per_query_us = (time.perf_counter() - started) / (repeat * len(cases)) * 1e6
+
+    accuracy = correct / len(cases)
+    print(f"{name:>10} | {typed / len(cases):>8.1%} | {accuracy:>9.1%} | {per_query_us:>8.1f}")
+    return accuracy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", default=CASES_PATH)
+    parser.add_argument("--holdout", default=HOLDOUT_PATH, help="отложенный набор (или запросы из логов)")
+    parser.add_argument("--chunks", default=None, help="NDJSON с чанками расписания для справочников")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--min-accuracy", type=float, default=None,
+                        help="код возврата 1, если точность QueryAnalyzer на отложенном наборе ниже")
+    parser.add_argument("-v", "--verbose", action="store_true", help="печатать ошибки разбора")
+    args = parser.parse_args()
+
+    index = ScheduleIndex.from_file(args.chunks) if args.chunks else ScheduleIndex()
+    for lesson in FIXTURE_LESSONS:
+        index.add_lesson(dict(lesson, week="каждая"))
+    print(f"Групп: {len(index.by_group)}, аудиторий: {len(index.by_room)}, фамилий: {len(index.by_teacher)}")
+
+    analyzer = QueryAnalyzer(index)
+    for title, path in (("Настроечный набор", args.cases), ("Отложенный набор", args.holdout)):
+        cases = load_cases(path)
+        print(f"\n{title}: {os.path.basename(path)}, запросов: {len(cases)}")
+        print(f"{'разбор':>10} | {'тип':>8} | {'всё верно':>9} | {'мкс/запр':>8}")
+        evaluate("прежний", legacy_detect_query_type, cases, args.repeat, args.verbose)
+        accuracy = evaluate("analyzer", lambda q: analyzer.analyze(q, TODAY), cases, args.repeat, args.verbose)
+
+    if args.min_accuracy is not None and accuracy < args.min_accuracy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import hashlib
+import uuid
+from typing import Optional
+
+# Пространство имён для uuid5: ID точки зависит только от источника, позиции и текста
+CHUNK_NAMESPACE = uuid.UUID("6f1c5e0a-3b7d-5a8e-9c41-2d0f7b6a1e93")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_uid(source_url: Optional[str], offset: int, text: str) -> str:
+    """Детерминированный ID чанка: одинаковый чанк получает одинаковый ID при каждой пересборке"""
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{source_url or ''}\x00{offset}\x00{text_hash(text)}"))
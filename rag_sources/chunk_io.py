@@ -0,0 +1,190 @@
+"""Потоковый формат файлов с чанками: по одному JSON-объекту на строку (NDJSON), опционально zstd.
+
+Стадии пайплайна пишут чанки генератором прямо в multipart-загрузку MinIO и читают
+их построчно из потока ответа, поэтому память не зависит от размера корпуса.
+Объекты адресуются базовым именем без расширения (например "tmp_chunks/pdf_chunks"):
+
+    <база>.ndjson.zst  - NDJSON, сжатый zstd
+    <база>.ndjson      - NDJSON
+    <база>.json        - старый формат {"chunks": [...]}, только чтение
+"""
+import io
+import json
+import os
+from typing import Dict, Iterable, Iterator, Optional
+
+NDJSON_SUFFIX = ".ndjson"
+ZSTD_SUFFIX = ".ndjson.zst"
+LEGACY_SUFFIX = ".json"
+SUFFIXES = (ZSTD_SUFFIX, NDJSON_SUFFIX, LEGACY_SUFFIX)
+
+# Сжатие новых файлов: "zstd" или пусто
+CHUNKS_COMPRESSION = os.getenv("CHUNKS_COMPRESSION", "")
+PART_SIZE = 16 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+
+
+def chunk_object_name(base: str, compression: Optional[str] = None) -> str:
+    return base + (ZSTD_SUFFIX if compression == "zstd" else NDJSON_SUFFIX)
+
+
+def strip_suffix(object_name: str) -> str:
+    for suffix in SUFFIXES:
+        if object_name.endswith(suffix):
+            return object_name[:-len(suffix)]
+    return object_name
+
+
+# ========== ЗАПИСЬ ==========
+
+class _GeneratorStream(io.RawIOBase):
+    """Файлоподобная обёртка над генератором байтов для put_object(length=-1)"""
+
+    def __init__(self, parts: Iterator[bytes]):
+        self._parts = parts
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._parts)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _encode_lines(chunks: Iterable[Dict], counter: list) -> Iterator[bytes]:
+    lines = []
+    size = 0
+    for chunk in chunks:
+        line = json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n"
+        lines.append(line)
+        size += len(line)
+        counter[0] += 1
+        # склеиваем строки в блоки, чтобы не гонять по одной через read()
+        if size >= READ_SIZE:
+            yield b"".join(lines)
+            lines, size = [], 0
+    if lines:
+        yield b"".join(lines)
+
+
+def _zstd_compress(parts: Iterator[bytes]) -> Iterator[bytes]:
+    import zstandard
+
+    compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def write_chunks(client, bucket: str, base: str, chunks: Iterable[Dict],
+                 compression: Optional[str] = CHUNKS_COMPRESSION) -> int:
+    """Пишет чанки из итератора в <база>.ndjson[.zst] multipart-загрузкой, возвращает их число"""
+    object_name = chunk_object_name(base, compression)
+    counter = [0]
+    parts = _encode_lines(chunks, counter)
+    if compression == "zstd":
+        parts = _zstd_compress(parts)
+
+    client.put_object(
+        bucket, object_name, _GeneratorStream(parts), length=-1, part_size=PART_SIZE,
+        content_type="application/x-ndjson",
+    )
+
+    # файлы того же набора в других форматах больше не актуальны
+    for suffix in SUFFIXES:
+        if base + suffix != object_name:
+            try:
+                client.remove_object(bucket, base + suffix)
+            except Exception:
+                pass
+
+    print(f"[MinIO] Загружено: {object_name} ({counter[0]} чанков)", flush=True)
+    return counter[0]
+
+
+# ========== ЧТЕНИЕ ==========
+
+def _iter_lines(stream: Iterable[bytes]) -> Iterator[bytes]:
+    tail = b""
+    for block in stream:
+        tail += block
+        lines = tail.split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if tail.strip():
+        yield tail
+
+
+def _zstd_decompress(stream: Iterable[bytes]) -> Iterator[bytes]:
+    import zstandard
+
+    decompressor = zstandard.ZstdDecompressor().decompressobj()
+    for block in stream:
+        data = decompressor.decompress(block)
+        if data:
+            yield data
+
+
+def _legacy_chunks(data: bytes) -> Iterator[Dict]:
+    parsed = json.loads(data.decode("utf-8"))
+    yield from parsed.get("chunks", []) if isinstance(parsed, dict) else parsed
+
+
+def iter_chunk_stream(stream: Iterable[bytes], object_name: str) -> Iterator[Dict]:
+    """Разбирает поток байтов объекта по его расширению"""
+    if object_name.endswith(LEGACY_SUFFIX):
+        yield from _legacy_chunks(b"".join(stream))
+        return
+    if object_name.endswith(ZSTD_SUFFIX):
+        stream = _zstd_decompress(stream)
+    for line in _iter_lines(stream):
+        yield json.loads(line)
+
+
+def find_chunk_object(client, bucket: str, base: str) -> Optional[str]:
+    for suffix in SUFFIXES:
+        try:
+            client.stat_object(bucket, base + suffix)
+            return base + suffix
+        except Exception:
+            continue
+    return None
+
+
+def read_chunks(client, bucket: str, base: str) -> Iterator[Dict]:
+    """Построчно читает набор чанков из MinIO в любом из поддерживаемых форматов"""
+    object_name = find_chunk_object(client, bucket, strip_suffix(base))
+    if object_name is None:
+        raise FileNotFoundError(f"{bucket}/{base}: нет файла чанков")
+
+    response = client.get_object(bucket, object_name)
+    try:
+        yield from iter_chunk_stream(response.stream(READ_SIZE), object_name)
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def read_chunks_file(path: str) -> Iterator[Dict]:
+    """То же для локального файла (.ndjson, .ndjson.zst или старый .json)"""
+    def blocks():
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(READ_SIZE)
+                if not block:
+                    return
+                yield block
+
+    yield from iter_chunk_stream(blocks(), path)
@@ -0,0 +1,217 @@
+"""Общий чанкинг по токенам gpt для стадий pdf/docx и подсчёт токенов для остальных.
+
+Текст кодируется один раз: смещения токенов в символах считаются так же, как в
+decode_with_offsets, но через numpy (длины токенов в байтах + карта байт -> символ),
+а границы чанков и их смещения берутся из них, без повторных encode и text.find. Стратегии:
+
+    token    - окно chunk_size токенов с мягким переносом по пробелу и перекрытием overlap
+    sentence - предложения набираются в чанк, пока влезают в chunk_size
+    heading  - как sentence, но чанк не пересекает заголовки (нужен текст с переносами строк)
+"""
+import bisect
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import tiktoken
+
+ENCODING_MODEL = "gpt-3.5-turbo"
+STRATEGIES = ("token", "sentence", "heading")
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "token")
+
+# Конец предложения или перенос строки
+SENTENCE_BREAK = re.compile(r"(?<=[.!?…])\s+|\n+")
+# Заголовок - отдельная строка: markdown, "1.2 Название", "Глава 3 ...", либо строка капсом
+HEADING = re.compile(
+    r"^[ \t]*(?:#{1,6}[ \t]+\S.*"
+    r"|(?:\d+\.)+\d*[ \t]+[А-ЯЁA-Z][^\n]{0,100}"
+    r"|(?:Глава|Раздел|Статья|Приложение)[ \t]+\S[^\n]{0,100}"
+    r"|(?=[^\n]*[А-ЯЁA-Z])[А-ЯЁA-Z0-9 ,.\-«»]{4,80})[ \t]*$",
+    re.MULTILINE,
+)
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str = ENCODING_MODEL):
+    """Энкодер грузится один раз на процесс"""
+    return tiktoken.encoding_for_model(model)
+
+
+@lru_cache(maxsize=None)
+def _token_lengths(model: str = ENCODING_MODEL) -> np.ndarray:
+    """Длина каждого токена словаря в байтах"""
+    enc = get_encoder(model)
+    lengths = np.zeros(enc.n_vocab, dtype=np.int64)
+    for token in range(enc.n_vocab):
+        try:
+            lengths[token] = len(enc.decode_single_token_bytes(token))
+        except KeyError:
+            pass
+    return lengths
+
+
+def count_tokens(text: str, model: str = ENCODING_MODEL) -> int:
+    return len(get_encoder(model).encode(text, disallowed_special=()))
+
+
+def normalize_text(text: str, keep_lines: bool = False) -> str:
+    """Схлопывает пробелы; keep_lines оставляет по одному переносу между строками (для heading)"""
+    if not keep_lines:
+        return re.sub(r"\s+", " ", text).strip()
+    lines = (re.sub(r"[^\S\n]+", " ", line).strip() for line in text.split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+class TokenizedText:
+    """Текст, его токены и смещение в символах начала каждого токена"""
+
+    def __init__(self, text: str, model: str = ENCODING_MODEL):
+        self.text = text
+        self.tokens = get_encoder(model).encode(text, disallowed_special=())
+        # в конце - длина текста, чтобы offsets[end] работал и для последнего токена
+        self.offsets = self._char_offsets(text, self.tokens, model) + [len(text)]
+
+    @staticmethod
+    def _char_offsets(text: str, tokens: List[int], model: str) -> List[int]:
+        if not tokens:
+            return []
+        data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        # номер символа для каждого байта (байты продолжения относятся к своему символу)
+        char_at = np.cumsum((data & 0xC0) != 0x80) - 1
+        lengths = _token_lengths(model)[np.asarray(tokens)]
+        return char_at[np.cumsum(lengths) - lengths].tolist()
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def token_at(self, char: int) -> int:
+        """Номер первого токена, который начинается не раньше char"""
+        return bisect.bisect_left(self.offsets, char, 0, len(self.tokens))
+
+    def count(self, start: int, end: int) -> int:
+        return self.token_at(end) - self.token_at(start)
+
+
+# ========== ОКНА ==========
+
+def _token_windows(tokenized: TokenizedText, first: int, last: int,
+                   chunk_size: int, overlap: int) -> Iterator[Tuple[int, int]]:
+    """Окна токенов [start, end) на отрезке [first, last)"""
+    text, offsets = tokenized.text, tokenized.offsets
+    start = first
+    while start < last:
+        end = min(start + chunk_size, last)
+        if end < last:
+            # мягкий перенос: чанк заканчивается перед последним пробелом окна
+            space = max(text.rfind(" ", offsets[start], offsets[end]),
+                        text.rfind("\n", offsets[start], offsets[end]))
+            if space > offsets[start]:
+                end = tokenized.token_at(space)
+        yield start, end
+        if end >= last:
+            break
+        start = end - overlap if end - overlap > start else end
+
+
+def _sentence_spans(text: str, start: int, end: int) -> List[Tuple[int, int]]:
+    spans = []
+    for match in SENTENCE_BREAK.finditer(text, start, end):
+        if match.start() > start:
+            spans.append((start, match.start()))
+        start = match.end()
+    if end > start:
+        spans.append((start, end))
+    return spans
+
+
+def _pack_spans(tokenized: TokenizedText, spans: List[Tuple[int, int]],
+                chunk_size: int, overlap: int) -> Iterator[Tuple[int, int]]:
+    """Склеивает предложения в чанки до chunk_size токенов; хвост предыдущего чанка идёт в перекрытие"""
+    current: List[Tuple[int, int]] = []
+    carried = 0
+
+    for start, end in spans:
+        if tokenized.count(start, end) > chunk_size:
+            # предложение длиннее чанка - режем его окнами токенов
+            if len(current) > carried:
+                yield current[0][0], current[-1][1]
+            current, carried = [], 0
+            for first, last in _token_windows(tokenized, tokenized.token_at(start), tokenized.token_at(end),
+                                              chunk_size, overlap):
+                yield tokenized.offsets[first], tokenized.offsets[last]
+            continue
+
+        # считаем по всему отрезку, чтобы учесть и пробелы между предложениями
+        if current and tokenized.count(current[0][0], end) > chunk_size:
+            yield current[0][0], current[-1][1]
+            tail_end = current[-1][1]
+            keep = [span for span in current if tokenized.count(span[0], tail_end) <= overlap]
+            while keep and tokenized.count(keep[0][0], end) > chunk_size:
+                keep.pop(0)
+            current, carried = keep, len(keep)
+
+        current.append((start, end))
+
+    if len(current) > carried:
+        yield current[0][0], current[-1][1]
+
+
+def _heading_sections(text: str) -> List[Tuple[int, int, Optional[str]]]:
+    sections = []
+    start, heading = 0, None
+    for match in HEADING.finditer(text):
+        if match.start() > start:
+            sections.append((start, match.start(), heading))
+        start, heading = match.start(), match.group().strip().lstrip("#").strip()
+    if len(text) > start:
+        sections.append((start, len(text), heading))
+    return sections
+
+
+# ========== ЧАНКИ ==========
+
+def _make_chunk(tokenized: TokenizedText, start: int, end: int) -> Optional[Dict]:
+    raw = tokenized.text[start:end]
+    text = raw.strip()
+    if not text:
+        return None
+    start += len(raw) - len(raw.lstrip())
+    return {
+        "text": text,
+        "token_count": tokenized.count(start, start + len(text)),
+        "start_offset": start,
+        "end_offset": start + len(text),
+    }
+
+
+def chunk_text(text: str, strategy: str = CHUNK_STRATEGY, chunk_size: int = 512, overlap: int = 50,
+               min_tokens: int = 0, model: str = ENCODING_MODEL) -> List[Dict]:
+    """Чанки текста в формате стадий пайплайна: chunk_uid, chunk_id, text, token_count, start/end_offset"""
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия чанкинга: {strategy}")
+
+    tokenized = TokenizedText(text, model)
+    if strategy == "token":
+        spans = ((None, tokenized.offsets[s], tokenized.offsets[e])
+                 for s, e in _token_windows(tokenized, 0, len(tokenized), chunk_size, overlap))
+    elif strategy == "sentence":
+        spans = ((None, s, e) for s, e in
+                 _pack_spans(tokenized, _sentence_spans(text, 0, len(text)), chunk_size, overlap))
+    else:
+        spans = ((heading, s, e)
+                 for start, end, heading in _heading_sections(text)
+                 for s, e in _pack_spans(tokenized, _sentence_spans(text, start, end), chunk_size, overlap))
+
+    chunks = []
+    for heading, start, end in spans:
+        chunk = _make_chunk(tokenized, start, end)
+        if chunk is None or chunk["token_count"] < min_tokens:
+            continue
+        chunk_id = len(chunks)
+        chunk = {"chunk_uid": f"chunk_{chunk_id}", "chunk_id": chunk_id, **chunk}
+        if heading:
+            chunk["heading"] = heading
+        chunks.append(chunk)
+    return chunks
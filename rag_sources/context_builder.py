@@ -0,0 +1,195 @@
+"""Сборка контекста для LLM в пределах бюджета токенов.
+
+Документы приходят уже упорядоченными (кросс-энкодер или косинус/RRF) и проходят три шага:
+
+- соседние чанки одного документа склеиваются в один фрагмент. Смещения - в тексте своего
+  документа (их ставит чанкер); у pdf/docx соседние чанки перекрываются (overlap чанкера),
+  перекрытие при склейке вырезается. Место фрагмента - место лучшего из его чанков;
+- предложения, которые уже есть в более релевантном фрагменте, выкидываются
+  (шапки страниц, одинаковые абзацы в разных версиях документа);
+- фрагменты по порядку набираются жадно, пока влезают в бюджет; не влезший
+  фрагмент обрезается по предложениям, если осталось хотя бы MIN_PARTIAL_TOKENS.
+
+Токены считает tiktoken (тот же энкодер, что в chunking), счёт кэшируется по тексту.
+"""
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from rag_sources.chunking import ENCODING_MODEL, get_encoder
+
+# Бюджет токенов на весь контекст вместе с заголовками документов
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Меньше этого остатка бюджета фрагмент не обрезаем, а пропускаем
+MIN_PARTIAL_TOKENS = 48
+# Короткие предложения ("1.", "Контакты") не дедуплицируются - совпадают случайно
+MIN_DEDUP_CHARS = 30
+# Сколько текстов помнит счётчик токенов (кэш держит сами тексты)
+TOKEN_CACHE_SIZE = 2048
+# Более короткое совпадение конца чанка с началом следующего - случайность, а не перекрытие
+MIN_OVERLAP_CHARS = 10
+
+_DOC_MARKER_RE = re.compile(r"<\[document\]>|\[document\]>")
+_SPACES_RE = re.compile(r"\s+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+
+def clean_text(text: str) -> str:
+    return _SPACES_RE.sub(" ", _DOC_MARKER_RE.sub("", text)).strip()
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def count_tokens(text: str) -> int:
+    return len(get_encoder(ENCODING_MODEL).encode(text, disallowed_special=()))
+
+
+@dataclass
+class ContextStats:
+    tokens: int = 0  # токенов в контексте вместе с заголовками
+    dropped: int = 0  # фрагментов, которые не влезли в бюджет
+
+
+def relevance(doc: Dict) -> float:
+    """Оценка, по которой документ попал на своё место: кросс-энкодера, если он отработал"""
+    return doc.get("rerank_score", doc["score"])
+
+
+def doc_header(number: int, fragment: Dict) -> str:
+    return (f"[Документ {number} | коллекция: {fragment['collection']} | "
+            f"релевантность: {fragment['score']:.3f}]")
+
+
+def _position(doc: Dict) -> Optional[Tuple[str, int, int]]:
+    """(document_id, start, end) чанка, если у payload есть смещения"""
+    payload = doc.get("metadata") or {}
+    meta = payload.get("metadata") or {}
+    start, end = meta.get("start_offset"), meta.get("end_offset")
+    if payload.get("document_id") is None or start is None or end is None:
+        return None
+    return payload["document_id"], start, end
+
+
+def _sentence_key(sentence: str) -> bytes:
+    return hashlib.blake2b(sentence.lower().encode("utf-8"), digest_size=8).digest()
+
+
+def overlap_length(head: str, tail: str) -> int:
+    """Длина самого длинного конца head, с которого начинается tail (префикс-функция)"""
+    size = min(len(head), len(tail))
+    joined = f"{tail[:size]}\0{head[len(head) - size:]}"
+    prefix = [0] * len(joined)
+    for i in range(1, len(joined)):
+        k = prefix[i - 1]
+        while k and joined[i] != joined[k]:
+            k = prefix[k - 1]
+        if joined[i] == joined[k]:
+            k += 1
+        prefix[i] = k
+    return prefix[-1] if joined else 0
+
+
+def join_overlapping(head: str, tail: str) -> str:
+    """Склеивает соседние чанки, вырезая начало tail, которое повторяет конец head"""
+    overlap = overlap_length(head, tail)
+    if overlap >= MIN_OVERLAP_CHARS:
+        return head + tail[overlap:]
+    return f"{head} {tail}"
+
+
+# ========== ШАГИ ==========
+
+def merge_adjacent(documents: List[Dict]) -> List[Dict]:
+    """Фрагменты {text, score, collection, ids}: соседние чанки документа склеены, порядок - входной"""
+    fragments = []
+    by_document: Dict[Tuple[str, str], List[Tuple[int, int, Dict]]] = {}
+    for rank, doc in enumerate(documents):
+        fragment = {"text": clean_text(doc["text"]), "score": relevance(doc),
+                    "collection": doc["collection"], "ids": [doc["id"]], "rank": rank}
+        position = _position(doc)
+        if position is None:
+            fragments.append(fragment)
+            continue
+        document_id, start, end = position
+        by_document.setdefault((doc["collection"], document_id), []).append((start, end, fragment))
+
+    for chunks in by_document.values():
+        chunks.sort(key=lambda c: c[:2])
+        run_end, current = chunks[0][1], chunks[0][2]
+        for start, end, fragment in chunks[1:]:
+            # вплотную (html) или с перекрытием (pdf/docx)
+            if start <= run_end:
+                current["text"] = join_overlapping(current["text"], fragment["text"])
+                current["score"] = max(current["score"], fragment["score"])
+                current["rank"] = min(current["rank"], fragment["rank"])
+                current["ids"].extend(fragment["ids"])
+            else:
+                fragments.append(current)
+                current = fragment
+            run_end = max(run_end, end)
+        fragments.append(current)
+
+    fragments.sort(key=lambda f: f["rank"])
+    return fragments
+
+
+def drop_repeated_sentences(fragments: List[Dict]) -> List[Dict]:
+    """Убирает предложения, уже встреченные в более релевантных фрагментах"""
+    seen = set()
+    result = []
+    for fragment in fragments:
+        kept = []
+        for sentence in _SENTENCE_RE.split(fragment["text"]):
+            if len(sentence) >= MIN_DEDUP_CHARS:
+                key = _sentence_key(sentence)
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(sentence)
+        if kept:
+            result.append(dict(fragment, text=" ".join(kept)))
+    return result
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Начало текста не длиннее max_tokens, по границе предложения, если она есть"""
+    tokens = get_encoder(ENCODING_MODEL).encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    head = get_encoder(ENCODING_MODEL).decode(tokens[:max_tokens])
+    sentences = _SENTENCE_RE.split(head)
+    if len(sentences) > 1:
+        # последнее предложение оборвано на середине
+        return " ".join(sentences[:-1])
+    return head.rstrip()
+
+
+class ContextBuilder:
+    # один экземпляр на бота и все его запросы: состояния между вызовами build нет
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+
+    def build(self, documents: List[Dict]) -> Tuple[str, ContextStats]:
+        """Контекст и его статистика; documents - в порядке релевантности"""
+        fragments = drop_repeated_sentences(merge_adjacent(documents))
+
+        parts, used, dropped = [], 0, 0
+        for fragment in fragments:
+            header = doc_header(len(parts) + 1, fragment)
+            # + перенос строки между заголовком и текстом и пустая строка между документами
+            overhead = count_tokens(header) + 2
+            remaining = self.token_budget - used - overhead
+            text = fragment["text"]
+            cost = count_tokens(text)
+            if cost > remaining:
+                if remaining < MIN_PARTIAL_TOKENS:
+                    dropped += 1
+                    continue
+                text = truncate_to_tokens(text, remaining)
+                cost = count_tokens(text)
+            parts.append(f"{header}\n{text}\n")
+            used += overhead + cost
+
+        return "\n".join(parts), ContextStats(used, dropped)
@@ -0,0 +1,161 @@
+"""Схлопывание почти одинаковых чанков между making_json_of_chunks и making_embeddings.
+
+Краулер сохраняет каждую вариацию URL (query, якоря, версии для печати) отдельной страницей,
+поэтому в all_chunks много почти одинаковых чанков. Для каждого чанка считается MinHash
+по словесным шинглам, кандидаты в дубли ищутся через LSH (полосы сигнатуры), похожие
+по оценке Жаккара объединяются. От группы остаётся один чанк с самым "чистым" URL,
+остальные URL сохраняются в metadata.aliases.
+
+    tmp_chunks_for_embeddings/all_chunks -> tmp_chunks_for_embeddings/dedup_chunks
+"""
+import os
+import re
+import zlib
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+from chunk_io import read_chunks, write_chunks
+from loguru import logger
+from minio_client import get_minio_client
+
+BUCKET = "rag-sources"
+INPUT_OBJECT = "tmp_chunks_for_embeddings/all_chunks"
+OUTPUT_OBJECT = "tmp_chunks_for_embeddings/dedup_chunks"
+
+NUM_PERM = 128
+BANDS = 16  # 16 полос по 8 строк: порог срабатывания LSH около 0.7
+SHINGLE_SIZE = 3
+# Минимальная оценка сходства по Жаккару, чтобы считать чанки дублями
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+# Сколько разных групп сравниваем внутри одной корзины LSH
+MAX_BUCKET_COMPARE = 16
+
+# Наибольшее простое меньше 2^32: сигнатура помещается в uint32, a*x + b не переполняет uint64
+PRIME = np.uint64(4294967291)
+_rng = np.random.default_rng(42)
+PERM_A = _rng.integers(1, int(PRIME), size=NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.integers(0, int(PRIME), size=NUM_PERM, dtype=np.uint64)
+
+WORD = re.compile(r"\w+")
+# Множители для свёртки хэшей соседних слов в хэш шингла
+SHINGLE_MULT = np.array([0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D], dtype=np.uint64)[:SHINGLE_SIZE]
+MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def shingles(text: str) -> np.ndarray:
+    """32-битные хэши уникальных шинглов из SHINGLE_SIZE подряд идущих слов"""
+    words = WORD.findall(text.lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+    size = min(SHINGLE_SIZE, len(words))
+    count = len(words) - size + 1
+    # переполнение uint64 здесь допустимо - нужен только перемешанный хэш
+    combined = sum(hashes[k:k + count] * SHINGLE_MULT[k] for k in range(size))
+    return np.unique(combined & MASK32)
+
+
+def minhash(text: str) -> np.ndarray:
+    hashes = shingles(text)
+    if not len(hashes):
+        return np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+    return ((np.outer(hashes, PERM_A) + PERM_B) % PRIME).min(axis=0).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Оценка коэффициента Жаккара по MinHash-сигнатурам"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def find_duplicates(signatures: np.ndarray, threshold: float = DEDUP_THRESHOLD) -> UnionFind:
+    """Группы почти одинаковых сигнатур: LSH по полосам + проверка сходства кандидатов"""
+    rows = NUM_PERM // BANDS
+    groups = UnionFind(len(signatures))
+    buckets: Dict[Tuple[int, bytes], List[int]] = {}
+
+    for i, signature in enumerate(signatures):
+        for band in range(BANDS):
+            key = (band, signature[band * rows:(band + 1) * rows].tobytes())
+            members = buckets.setdefault(key, [])
+            roots = set()
+            for j in members:
+                root = groups.find(j)
+                if root in roots or root == groups.find(i):
+                    continue
+                roots.add(root)
+                if similarity(signature, signatures[j]) >= threshold:
+                    groups.union(i, j)
+                if len(roots) >= MAX_BUCKET_COMPARE:
+                    break
+            members.append(i)
+    return groups
+
+
+def url_rank(url: str, index: int) -> Tuple:
+    """Чем меньше, тем лучше URL подходит как основной: без query/якоря, не версия для печати, короче"""
+    parts = urlsplit(url or "")
+    return bool(parts.query or parts.fragment), "print" in url.lower(), len(url), index
+
+
+# ========== СТАДИЯ ==========
+
+def dedup_chunks(chunks: Iterable[Dict], threshold: float = DEDUP_THRESHOLD):
+    """Первый проход: сигнатуры и группы. Возвращает {номер чанка: aliases} для оставляемых чанков"""
+    signatures, urls = [], []
+    for chunk in chunks:
+        signatures.append(minhash(chunk.get("text") or ""))
+        urls.append(chunk.get("source_url") or "")
+    if not signatures:
+        return {}
+
+    groups = find_duplicates(np.vstack(signatures), threshold)
+    members: Dict[int, List[int]] = {}
+    for i in range(len(urls)):
+        members.setdefault(groups.find(i), []).append(i)
+
+    logger.info(f"Чанков: {len(urls)}, уникальных после дедупликации: {len(members)}")
+    keep = {}
+    for group in members.values():
+        best = min(group, key=lambda i: url_rank(urls[i], i))
+        keep[best] = sorted({urls[i] for i in group} - {urls[best], ""})
+    return keep
+
+
+def iter_kept(chunks: Iterable[Dict], keep: Dict[int, List[str]]):
+    """Второй проход: оставляемые чанки с aliases в metadata"""
+    for i, chunk in enumerate(chunks):
+        if i not in keep:
+            continue
+        if keep[i]:
+            chunk.setdefault("metadata", {})["aliases"] = keep[i]
+        yield chunk
+
+
+def main():
+    client = get_minio_client()
+    keep = dedup_chunks(read_chunks(client, BUCKET, INPUT_OBJECT))
+    # чанки читаются заново потоком, чтобы не держать весь корпус в памяти
+    count = write_chunks(client, BUCKET, OUTPUT_OBJECT, iter_kept(read_chunks(client, BUCKET, INPUT_OBJECT), keep))
+    merged = sum(1 for aliases in keep.values() if aliases)
+    logger.success(f"Дедупликация: оставлено {count} чанков, групп с дублями: {merged}")
+
+
+if __name__ == "__main__":
+    main()
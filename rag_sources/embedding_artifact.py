@@ -0,0 +1,246 @@
+"""Бинарный артефакт эмбеддингов: матрица .npy + таблица payload в parquet.
+
+Строка i матрицы <prefix>.vectors.npy соответствует строке i таблицы
+<prefix>.payloads.parquet (столбец chunk_uid - ID точки в Qdrant) и, если есть,
+строке i <prefix>.sparse.parquet с BM25-вектором для гибридного поиска. Матрица
+читается через np.load(mmap_mode="r"), таблицы - батчами parquet по сегментам загрузки,
+поэтому загрузчику не нужно держать корпус в памяти и разбирать JSON.
+"""
+import hashlib
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+VECTORS_SUFFIX = ".vectors.npy"
+PAYLOADS_SUFFIX = ".payloads.parquet"
+SPARSE_SUFFIX = ".sparse.parquet"
+JSONL_SUFFIX = ".jsonl"
+
+PAYLOAD_COLUMNS = ("chunk_uid", "text", "type", "document_id", "source_url", "metadata")
+# Хэш остального payload точки: по нему синхронизация находит точки с прежним ID,
+# но новыми метаданными (алиасы, смещения), и перезаливает их
+PAYLOAD_HASH_FIELD = "payload_hash"
+# Поля metadata, которые чанкеры ставят заново при каждом прогоне; в хэш не входят,
+# иначе каждая синхронизация перезаливала бы всю коллекцию
+VOLATILE_METADATA_FIELDS = frozenset({"created_at"})
+
+
+def vectors_object(prefix: str) -> str:
+    return prefix + VECTORS_SUFFIX
+
+
+def payloads_object(prefix: str) -> str:
+    return prefix + PAYLOADS_SUFFIX
+
+
+def jsonl_object(prefix: str) -> str:
+    return prefix + JSONL_SUFFIX
+
+
+def sparse_object(prefix: str) -> str:
+    return prefix + SPARSE_SUFFIX
+
+
+def payload_metadata(chunk: Dict) -> Dict:
+    """metadata точки: смещения чанка в документе - по ним сборщик контекста склеивает соседние чанки"""
+    metadata = dict(chunk.get("metadata") or {})
+    if chunk.get("start_offset") is not None and chunk.get("end_offset") is not None:
+        metadata["start_offset"] = chunk["start_offset"]
+        metadata["end_offset"] = chunk["end_offset"]
+    return metadata
+
+
+def payload_hash(payload: Dict) -> str:
+    stable = {k: v for k, v in payload.items() if k != PAYLOAD_HASH_FIELD}
+    if isinstance(stable.get("metadata"), dict):
+        stable["metadata"] = {k: v for k, v in stable["metadata"].items() if k not in VOLATILE_METADATA_FIELDS}
+    data = json.dumps(stable, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def with_payload_hash(payload: Dict) -> Dict:
+    payload[PAYLOAD_HASH_FIELD] = payload_hash(payload)
+    return payload
+
+
+def _payload_schema():
+    import pyarrow as pa
+    # metadata у разных типов чанков разная, поэтому хранится JSON-строкой
+    return pa.schema([(name, pa.string()) for name in PAYLOAD_COLUMNS])
+
+
+def _sparse_schema():
+    import pyarrow as pa
+    return pa.schema([("indices", pa.list_(pa.uint32())), ("values", pa.list_(pa.float32()))])
+
+
+class EmbeddingArtifactWriter:
+    """Пишет артефакт в локальную папку батчами; размер матрицы известен заранее"""
+
+    def __init__(self, directory: str, name: str, count: int, dim: int,
+                 dtype: str = "float32", jsonl: bool = False, sparse: bool = False):
+        import pyarrow.parquet as pq
+
+        self.count = count
+        self.vectors_path = os.path.join(directory, name + VECTORS_SUFFIX)
+        self.payloads_path = os.path.join(directory, name + PAYLOADS_SUFFIX)
+        self.jsonl_path = os.path.join(directory, name + JSONL_SUFFIX) if jsonl else None
+        self.sparse_path = os.path.join(directory, name + SPARSE_SUFFIX) if sparse else None
+
+        self._vectors = np.lib.format.open_memmap(self.vectors_path, mode="w+", dtype=dtype, shape=(count, dim))
+        self._payloads = pq.ParquetWriter(self.payloads_path, _payload_schema())
+        self._jsonl = open(self.jsonl_path, "w", encoding="utf-8") if jsonl else None
+        self._sparse = pq.ParquetWriter(self.sparse_path, _sparse_schema()) if sparse else None
+        self._row = 0
+
+    def add_batch(self, payloads: List[Dict], vectors: np.ndarray,
+                  sparse: Optional[List[Tuple[List[int], List[float]]]] = None):
+        """sparse - (индексы, значения) BM25 для каждой строки, если артефакт с разреженными векторами"""
+        import pyarrow as pa
+
+        end = self._row + len(payloads)
+        self._vectors[self._row:end] = vectors
+
+        columns = {name: [] for name in PAYLOAD_COLUMNS}
+        for payload in payloads:
+            for name in PAYLOAD_COLUMNS:
+                value = payload.get(name)
+                if name == "metadata":
+                    value = json.dumps(value or {}, ensure_ascii=False)
+                columns[name].append(value)
+        self._payloads.write_table(pa.table(columns, schema=_payload_schema()))
+
+        if self._sparse is not None:
+            self._sparse.write_table(pa.table({
+                "indices": [indices for indices, _ in sparse],
+                "values": [values for _, values in sparse],
+            }, schema=_sparse_schema()))
+
+        if self._jsonl is not None:
+            for payload, vector in zip(payloads, vectors, strict=True):
+                self._jsonl.write(json.dumps(to_point(payload, vector), ensure_ascii=False) + "\n")
+
+        self._row = end
+
+    def close(self) -> List[str]:
+        if self._row != self.count:
+            raise ValueError(f"Записано {self._row} строк из {self.count}")
+
+        self._vectors.flush()
+        del self._vectors
+        self._payloads.close()
+        paths = [self.vectors_path, self.payloads_path]
+        if self._jsonl is not None:
+            self._jsonl.close()
+            paths.append(self.jsonl_path)
+        if self._sparse is not None:
+            self._sparse.close()
+            paths.append(self.sparse_path)
+        return paths
+
+
+def to_point(payload: Dict, vector) -> Dict:
+    """Запись в формате старого JSONL: id, vector, payload"""
+    return {
+        "id": payload["chunk_uid"],  # ВАЖНО, чтобы прошла загрузка в qdrant
+        "vector": np.asarray(vector, dtype=np.float32).tolist(),
+        "payload": {name: payload.get(name) for name in PAYLOAD_COLUMNS if name != "chunk_uid"},
+    }
+
+
+def upload_artifact(client, bucket: str, prefix: str, paths: List[str]):
+    """fput_object грузит большие файлы multipart-частями прямо с диска"""
+    content_types = {
+        VECTORS_SUFFIX: "application/octet-stream",
+        PAYLOADS_SUFFIX: "application/vnd.apache.parquet",
+        SPARSE_SUFFIX: "application/vnd.apache.parquet",
+        JSONL_SUFFIX: "application/json",
+    }
+    for path in paths:
+        suffix = next(s for s in content_types if path.endswith(s))
+        client.fput_object(bucket, prefix + suffix, path, content_type=content_types[suffix])
+
+
+def download_artifact(client, bucket: str, prefix: str, directory: str) -> Tuple[str, str]:
+    vectors_path = os.path.join(directory, os.path.basename(prefix) + VECTORS_SUFFIX)
+    payloads_path = os.path.join(directory, os.path.basename(prefix) + PAYLOADS_SUFFIX)
+    client.fget_object(bucket, vectors_object(prefix), vectors_path)
+    client.fget_object(bucket, payloads_object(prefix), payloads_path)
+    return vectors_path, payloads_path
+
+
+def download_sparse(client, bucket: str, prefix: str, directory: str) -> Optional[str]:
+    """BM25-векторы артефакта или None, если артефакт собран без них"""
+    path = os.path.join(directory, os.path.basename(prefix) + SPARSE_SUFFIX)
+    try:
+        client.stat_object(bucket, sparse_object(prefix))
+    except Exception:
+        return None
+    client.fget_object(bucket, sparse_object(prefix), path)
+    return path
+
+
+def open_sparse(path: str, rows: int):
+    import pyarrow.parquet as pq
+
+    sparse = pq.ParquetFile(path, memory_map=True)
+    if sparse.metadata.num_rows != rows:
+        raise ValueError(f"Размеры не совпадают: {rows} векторов, {sparse.metadata.num_rows} разреженных")
+    return sparse
+
+
+def _iter_parquet_rows(parquet_file, size: int, start_row: int = 0) -> Iterator[List[Dict]]:
+    """Строки parquet кусками по size, начиная с start_row. Файл читается батчами:
+    в памяти не больше одного куска (группы строк артефакта маленькие - по батчу кодирования)"""
+    rows = []
+    row = 0
+    for batch in parquet_file.iter_batches(batch_size=size):
+        if row + batch.num_rows <= start_row:
+            row += batch.num_rows
+            continue
+        rows.extend(batch.slice(max(start_row - row, 0)).to_pylist())
+        row += batch.num_rows
+        while len(rows) >= size:
+            yield rows[:size]
+            rows = rows[size:]
+    if rows:
+        yield rows
+
+
+def iter_sparse_segments(sparse, start_row: int = 0,
+                         size: int = 10000) -> Iterator[List[Tuple[List[int], List[float]]]]:
+    """(индексы, значения) BM25 теми же сегментами, что и iter_artifact_segments"""
+    for rows in _iter_parquet_rows(sparse, size, start_row):
+        yield [(row["indices"], row["values"]) for row in rows]
+
+
+def open_artifact(vectors_path: str, payloads_path: str):
+    """Матрица и таблица без чтения в память: mmap .npy и parquet, который читается по сегментам"""
+    import pyarrow.parquet as pq
+
+    vectors = np.load(vectors_path, mmap_mode="r")
+    payloads = pq.ParquetFile(payloads_path, memory_map=True)
+    if payloads.metadata.num_rows != len(vectors):
+        raise ValueError(f"Размеры не совпадают: {len(vectors)} векторов, {payloads.metadata.num_rows} payload")
+    return vectors, payloads
+
+
+def iter_artifact_segments(vectors, payloads, start_row: int = 0,
+                           size: int = 10000) -> Iterator[Tuple[List[str], np.ndarray, List[Dict], int]]:
+    """Отдаёт (ids, векторы float32, payload, номер строки после сегмента)"""
+    start = start_row
+    for rows in _iter_parquet_rows(payloads, size, start_row):
+        end = start + len(rows)
+
+        ids = []
+        payload_dicts = []
+        for row in rows:
+            ids.append(row.pop("chunk_uid"))
+            row["metadata"] = json.loads(row["metadata"]) if row["metadata"] else {}
+            payload_dicts.append(row)
+
+        # для float32 это срез mmap без копии, float16 приводится посегментно
+        yield ids, np.asarray(vectors[start:end], dtype=np.float32), payload_dicts, end
+        start = end
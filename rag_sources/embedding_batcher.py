@@ -0,0 +1,108 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rag_sources.metrics import Histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+QUEUE_WAIT_MS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100)
+
+_STOP = object()
+
+
+class EmbeddingBatcher:
+    """Микробатчер запросов к SentenceTransformer.
+
+    Запросы копятся не дольше max_wait_ms (или до max_batch_size) и кодируются одним
+    вызовом model.encode в фоновом потоке. Каждый вызывающий получает свой вектор через
+    concurrent.futures.Future, поэтому батчер подходит и для sync, и для async кода.
+    """
+
+    def __init__(self, model, max_batch_size: int = 32, max_wait_ms: float = 5.0,
+                 normalize_embeddings: bool = True):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.normalize_embeddings = normalize_embeddings
+
+        self.batch_size_hist = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_hist = Histogram(QUEUE_WAIT_MS_BUCKETS)
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    # ========== API ==========
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def encode(self, text: str) -> np.ndarray:
+        """Блокирующее получение вектора (для UniversityBot)"""
+        return self.submit(text).result()
+
+    async def aencode(self, text: str) -> np.ndarray:
+        """Неблокирующее получение вектора (для async кода)"""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def stats(self) -> Dict:
+        return {
+            "batch_size": self.batch_size_hist.snapshot(),
+            "queue_wait_ms": self.queue_wait_hist.snapshot(),
+        }
+
+    def close(self, timeout: Optional[float] = None):
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # ========== ФОНОВЫЙ ПОТОК ==========
+
+    def _collect_batch(self, first) -> Tuple[List[tuple], bool]:
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopped = False
+        while not stopped:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch, stopped = self._collect_batch(first)
+
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_wait_hist.observe((started - enqueued) * 1000)
+            self.batch_size_hist.observe(len(batch))
+
+            texts = [text for text, _, _ in batch]
+            try:
+                vectors = self.model.encode(
+                    texts,
+                    batch_size=len(texts),
+                    normalize_embeddings=self.normalize_embeddings,
+                    show_progress_bar=False,
+                )
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), vector in zip(batch, vectors, strict=True):
+                future.set_result(vector)
@@ -0,0 +1,150 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+_PUNCT_RE = re.compile(r"[^\w\s-]")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Нормализация запроса для ключа кэша: регистр, пунктуация, пробелы"""
+    text = _PUNCT_RE.sub(" ", text.lower())
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+class EmbeddingCache:
+    """LRU + TTL кэш эмбеддингов запросов, ограниченный суммарным размером векторов.
+
+    Ключ - имя модели + нормализованный текст запроса, поэтому "Как получить стипендию?"
+    и "как получить  стипендию" дают один и тот же вектор без повторного encode.
+    """
+
+    def __init__(self, model_name: str, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: Optional[float] = 24 * 3600, persist_path: Optional[str] = None):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if persist_path and os.path.exists(persist_path):
+            self.load(persist_path)
+
+    def key(self, text: str) -> str:
+        return f"{self.model_name}\x00{normalize_query(text)}"
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def _pop(self, key: str):
+        vector, _ = self._entries.pop(key)
+        self._bytes -= vector.nbytes
+
+    # ========== API ==========
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.key(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1], time.time()):
+                if entry is not None:
+                    self._pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, text: str, vector, stored_at: Optional[float] = None):
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        if vector.nbytes > self.max_bytes:
+            return
+
+        key = self.key(text)
+        with self._lock:
+            self._put(key, vector, stored_at or time.time())
+
+    def _put(self, key: str, vector: np.ndarray, stored_at: float):
+        if key in self._entries:
+            self._pop(key)
+        self._entries[key] = (vector, stored_at)
+        self._bytes += vector.nbytes
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._pop(oldest)
+            self.evictions += 1
+
+    def get_or_compute(self, text: str, compute: Callable[[str], np.ndarray]) -> np.ndarray:
+        vector = self.get(text)
+        if vector is None:
+            vector = compute(text)
+            self.put(text, vector)
+        return vector
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+            }
+
+    # ========== СОХРАНЕНИЕ НА ДИСК ==========
+
+    def save(self, path: Optional[str] = None):
+        """Сохраняет непросроченные записи, чтобы после рестарта кэш был тёплым"""
+        path = path or self.persist_path
+        if not path:
+            return
+
+        now = time.time()
+        with self._lock:
+            items = [(k, v, t) for k, (v, t) in self._entries.items() if not self._expired(t, now)]
+
+        keys = np.array([k for k, _, _ in items], dtype=str)
+        vectors = np.stack([v for _, v, _ in items]) if items else np.zeros((0, 0), dtype=np.float32)
+        stored_at = np.array([t for _, _, t in items], dtype=np.float64)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, keys=keys, vectors=vectors, stored_at=stored_at)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str):
+        try:
+            data = np.load(path, allow_pickle=False)
+        except (OSError, ValueError) as e:
+            print(f"⚠ Кэш эмбеддингов не загружен из {path}: {e}")
+            return
+
+        now = time.time()
+        prefix = f"{self.model_name}\x00"
+        loaded = 0
+        with self._lock:
+            # Порядок файла - от старых к новым, как в LRU
+            for key, vector, stored_at in zip(data["keys"], data["vectors"], data["stored_at"], strict=True):
+                key = str(key)
+                if not key.startswith(prefix) or self._expired(float(stored_at), now):
+                    continue
+                vector = np.array(vector, dtype=np.float32)
+                vector.setflags(write=False)
+                self._put(key, vector, float(stored_at))
+                loaded += 1
+        print(f"✓ Кэш эмбеддингов: загружено {loaded} записей из {path}")
@@ -0,0 +1,174 @@
+"""Движок пакетной генерации эмбеддингов для пайплайна.
+
+- тексты сортируются по длине, чтобы в батче было меньше паддинга;
+- отсортированные куски раздаются пулу процессов (по модели в каждом);
+- результат отдаётся потоком по мере готовности кусков, а не одним массивом в конце;
+- backend: "torch" (как раньше), "onnx" или "onnx-int8" (квантованный MiniLM через ONNX Runtime).
+"""
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# Квантованная модель в репозитории sentence-transformers на HF
+ONNX_INT8_FILE = os.getenv("ONNX_INT8_FILE", "onnx/model_qint8_avx2.onnx")
+
+
+def load_model(model_name: str, backend: str = "torch", device: str = "cpu"):
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный backend: {backend}")
+    if backend == "torch":
+        return SentenceTransformer(model_name, device=device)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device=device, backend="onnx")
+    return SentenceTransformer(model_name, device=device, backend="onnx", model_kwargs={"file_name": ONNX_INT8_FILE})
+
+
+# ========== ВОРКЕР ==========
+
+_worker_model = None
+_worker_options: Dict = {}
+
+
+def _init_worker(model_name: str, backend: str, device: str, threads: int, options: Dict):
+    global _worker_model, _worker_options
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_model = load_model(model_name, backend, device)
+    _worker_options = options
+
+
+def _encode_chunk(positions: List[int], texts: List[str]) -> Tuple[List[int], np.ndarray]:
+    vectors = _worker_model.encode(texts, show_progress_bar=False, convert_to_numpy=True, **_worker_options)
+    return positions, np.asarray(vectors, dtype=np.float32)
+
+
+# ========== ДВИЖОК ==========
+
+class EmbeddingEngine:
+    def __init__(self, model_name: str, backend: str = "torch", processes: int = 0,
+                 batch_size: int = 64, chunk_size: int = 1024, device: str = "cpu",
+                 normalize_embeddings: bool = False):
+        self.model_name = model_name
+        self.backend = backend
+        self.processes = processes
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.device = device
+        self.normalize_embeddings = normalize_embeddings
+
+        self._model = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def options(self) -> Dict:
+        return {"batch_size": self.batch_size, "normalize_embeddings": self.normalize_embeddings}
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = load_model(self.model_name, self.backend, self.device)
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            threads = max(1, (os.cpu_count() or 1) // self.processes)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                # fork с уже загруженным torch ведёт себя непредсказуемо
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.backend, self.device, threads, self.options),
+            )
+        return self._pool
+
+    def _chunks(self, texts: Sequence[str]) -> Iterator[Tuple[List[int], List[str]]]:
+        # длинные вперёд: самые тяжёлые куски стартуют первыми
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        for start in range(0, len(order), self.chunk_size):
+            positions = order[start:start + self.chunk_size]
+            yield positions, [texts[i] for i in positions]
+
+    def encode_stream(self, texts: Sequence[str]) -> Iterator[Tuple[List[int], np.ndarray]]:
+        """Отдаёт (позиции во входном списке, векторы) по мере готовности кусков"""
+        if not self.processes:
+            for positions, chunk in self._chunks(texts):
+                yield positions, np.asarray(
+                    self.model.encode(chunk, show_progress_bar=False, convert_to_numpy=True, **self.options),
+                    dtype=np.float32,
+                )
+            return
+
+        pool = self._get_pool()
+        chunks = self._chunks(texts)
+        pending = set()
+        # не больше двух кусков в очереди на процесс, чтобы не держать все тексты в pickle-буферах
+        max_pending = self.processes * 2
+
+        for positions, chunk in chunks:
+            pending.add(pool.submit(_encode_chunk, positions, chunk))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """Все векторы в исходном порядке"""
+        result = None
+        for positions, vectors in self.encode_stream(texts):
+            if result is None:
+                result = np.zeros((len(texts), vectors.shape[1]), dtype=np.float32)
+            result[positions] = vectors
+        return result if result is not None else np.zeros((0, 0), dtype=np.float32)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+# ========== ПРОВЕРКА КАЧЕСТВА ==========
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray, k: int = 10,
+                queries: Optional[Sequence[int]] = None) -> float:
+    """Доля совпадающих top-k соседей по косинусу для эталонных и проверяемых векторов.
+
+    Запросами служат сами векторы корпуса (queries - их номера); сам документ из выдачи исключается.
+    """
+    def normalize(x):
+        x = np.asarray(x, dtype=np.float32)
+        return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+    reference, candidate = normalize(reference), normalize(candidate)
+    if queries is None:
+        queries = range(len(reference))
+    queries = np.asarray(list(queries))
+    k = min(k, len(reference) - 1)
+    if k <= 0 or not len(queries):
+        return 1.0
+
+    def top_k(matrix):
+        scores = matrix[queries] @ matrix.T
+        scores[np.arange(len(queries)), queries] = -np.inf
+        return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+    expected, found = top_k(reference), top_k(candidate)
+    hits = sum(len(set(e) & set(f)) for e, f in zip(expected, found, strict=True))
+    return hits / (len(queries) * k)
@@ -0,0 +1,97 @@
+"""Хранилище уже посчитанных эмбеддингов: sha256 текста -> вектор, отдельно для каждой модели.
+
+Лежит в MinIO рядом с артефактами (embeddings/store/<модель>.hashes.npy + .vectors.npy),
+поэтому при пересборке кодируются только новые и изменившиеся тексты.
+"""
+import os
+import re
+import tempfile
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+STORE_PREFIX = "embeddings/store"
+
+
+def model_slug(model_name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", model_name)
+
+
+class EmbeddingStore:
+    def __init__(self, model_name: str, dim: int, dtype: str = "float32"):
+        self.model_name = model_name
+        self.dim = dim
+        self.dtype = dtype
+        self._rows: Dict[str, int] = {}
+        self._vectors = np.zeros((0, dim), dtype=dtype)
+        self._new: Dict[str, np.ndarray] = {}
+
+    @property
+    def prefix(self) -> str:
+        return f"{STORE_PREFIX}/{model_slug(self.model_name)}"
+
+    def __len__(self) -> int:
+        return len(self._rows) + len(self._new)
+
+    def __contains__(self, hash_: str) -> bool:
+        return hash_ in self._new or hash_ in self._rows
+
+    def get(self, hash_: str) -> Optional[np.ndarray]:
+        vector = self._new.get(hash_)
+        if vector is not None:
+            return vector
+        row = self._rows.get(hash_)
+        return None if row is None else self._vectors[row]
+
+    def missing(self, hashes: Iterable[str]) -> List[str]:
+        """Хэши, для которых эмбеддинг ещё не считался (без повторов, в исходном порядке)"""
+        return [h for h in dict.fromkeys(hashes) if h not in self]
+
+    def add(self, hashes: List[str], vectors: np.ndarray):
+        for hash_, vector in zip(hashes, vectors, strict=True):
+            self._new[hash_] = np.asarray(vector, dtype=self.dtype)
+
+    # ========== MINIO ==========
+
+    def load(self, client, bucket: str):
+        import minio.error
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            hashes_path = os.path.join(tmp_dir, "hashes.npy")
+            vectors_path = os.path.join(tmp_dir, "vectors.npy")
+            try:
+                client.fget_object(bucket, f"{self.prefix}.hashes.npy", hashes_path)
+                client.fget_object(bucket, f"{self.prefix}.vectors.npy", vectors_path)
+            except minio.error.S3Error as e:
+                if e.code != "NoSuchKey":
+                    raise
+                return self
+
+            hashes = np.load(hashes_path)
+            vectors = np.load(vectors_path)
+
+        if vectors.shape[1] != self.dim:
+            # сменилась размерность модели - старые векторы не годятся
+            return self
+        self._rows = {str(h): i for i, h in enumerate(hashes)}
+        self._vectors = vectors.astype(self.dtype, copy=False)
+        return self
+
+    def save(self, client, bucket: str, keep: Optional[Iterable[str]] = None):
+        """Сохраняет хранилище; keep - хэши текущего корпуса, остальные выбрасываются"""
+        keep = list(dict.fromkeys(keep)) if keep is not None else list(self._rows) + list(self._new)
+        keep = [h for h in keep if h in self]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            hashes_path = os.path.join(tmp_dir, "hashes.npy")
+            vectors_path = os.path.join(tmp_dir, "vectors.npy")
+
+            np.save(hashes_path, np.array(keep, dtype="U64"))
+            vectors = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=self.dtype, shape=(len(keep), self.dim))
+            for i, hash_ in enumerate(keep):
+                vectors[i] = self.get(hash_)
+            vectors.flush()
+            del vectors
+
+            client.fput_object(bucket, f"{self.prefix}.hashes.npy", hashes_path, content_type="application/octet-stream")
+            client.fput_object(bucket, f"{self.prefix}.vectors.npy", vectors_path, content_type="application/octet-stream")
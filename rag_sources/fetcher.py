@@ -0,0 +1,201 @@
+"""Асинхронная загрузка файлов по ссылкам (PDF, DOCX) в MinIO с кэшем.
+
+- объект называется по sha256 содержимого (<префикс>/<sha256><расширение>), одинаковые файлы лежат один раз;
+- манифест <префикс>/manifest.json хранит для ссылки ETag, Last-Modified и объект, поэтому повторный
+  обход идёт условными запросами и на 304 ничего не скачивает;
+- одновременные запросы ограничены на каждый хост и в целом.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import Callable, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
+MANIFEST_NAME = "manifest.json"
+# Тело ответа до стольких байт держим в памяти, дальше - во временном файле
+SPOOL_SIZE = 8 * 1024 * 1024
+RETRY_DELAY = 2.0
+
+
+@dataclass
+class FetchResult:
+    url: str
+    # объект в MinIO; при ошибке - последняя удачная копия из манифеста, если она есть
+    object_name: Optional[str]
+    sha256: Optional[str]
+    # downloaded | same_content | not_modified | failed
+    status: str
+    # сколько байт пришло по сети
+    size: int = 0
+
+
+class _RetryableStatus(Exception):
+    pass
+
+
+class Fetcher:
+    def __init__(self, client, bucket: str, prefix: str, per_host: int = 4, max_connections: int = 32,
+                 timeout: float = 60.0, retries: int = 3, verify: bool = True):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.rstrip("/")
+        self.per_host = per_host
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retries = retries
+        self.verify = verify
+
+        self.manifest: Dict[str, Dict] = {}
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def manifest_name(self) -> str:
+        return f"{self.prefix}/{MANIFEST_NAME}"
+
+    def object_name(self, sha256: str, url: str) -> str:
+        ext = os.path.splitext(urlsplit(url).path)[1].lower()
+        return f"{self.prefix}/{sha256}{ext if len(ext) <= 8 else ''}"
+
+    # ========== МАНИФЕСТ ==========
+
+    def load_manifest(self) -> Dict[str, Dict]:
+        import minio.error
+
+        try:
+            response = self.client.get_object(self.bucket, self.manifest_name)
+        except minio.error.S3Error as e:
+            if e.code != "NoSuchKey":
+                raise
+            self.manifest = {}
+            return self.manifest
+        try:
+            self.manifest = json.loads(response.read().decode("utf-8"))
+        finally:
+            response.close()
+            response.release_conn()
+        return self.manifest
+
+    def save_manifest(self):
+        data = json.dumps(self.manifest, ensure_ascii=False).encode("utf-8")
+        self.client.put_object(self.bucket, self.manifest_name, BytesIO(data), length=len(data),
+                               content_type="application/json")
+
+    def prune(self, urls: Iterable[str]) -> int:
+        """Забывает ссылки не из urls и удаляет объекты, на которые больше никто не ссылается"""
+        urls = set(urls)
+        self.manifest = {url: entry for url, entry in self.manifest.items() if url in urls}
+        live = {entry["object"] for entry in self.manifest.values()}
+        removed = 0
+        for obj in self.client.list_objects(self.bucket, prefix=self.prefix + "/", recursive=True):
+            if obj.object_name != self.manifest_name and obj.object_name not in live:
+                self.client.remove_object(self.bucket, obj.object_name)
+                removed += 1
+        return removed
+
+    # ========== ЗАГРУЗКА ==========
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    def _store(self, object_name: str, body, size: int):
+        try:
+            # тот же файл мог прийти по другой ссылке
+            self.client.stat_object(self.bucket, object_name)
+            return
+        except Exception:
+            pass
+        self.client.put_object(self.bucket, object_name, body, length=size)
+
+    async def _fetch_once(self, http: httpx.AsyncClient, url: str, entry: Optional[Dict]) -> FetchResult:
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        async with http.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and entry:
+                return FetchResult(url, entry["object"], entry["sha256"], "not_modified")
+            if response.status_code == 429 or response.status_code >= 500:
+                raise _RetryableStatus(f"HTTP {response.status_code}")
+            if response.status_code != 200:
+                print(f"[Ошибка скачивания]: {url}: HTTP {response.status_code}")
+                return FetchResult(url, None, None, "failed")
+
+            digest = hashlib.sha256()
+            size = 0
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as body:
+                async for block in response.aiter_bytes():
+                    digest.update(block)
+                    body.write(block)
+                    size += len(block)
+                sha256 = digest.hexdigest()
+                object_name = self.object_name(sha256, url)
+                same = bool(entry) and entry.get("sha256") == sha256
+                if not same:
+                    body.seek(0)
+                    await asyncio.to_thread(self._store, object_name, body, size)
+
+            self.manifest[url] = {
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "object": object_name,
+                "sha256": sha256,
+                "size": size,
+                "fetched_at": datetime.now(timezone.utc).isoformat(),
+            }
+        return FetchResult(url, object_name, sha256, "same_content" if same else "downloaded", size)
+
+    async def fetch(self, http: httpx.AsyncClient, url: str) -> FetchResult:
+        entry = self.manifest.get(url)
+        error = None
+        async with self._host_limit(url):
+            for attempt in range(1, self.retries + 1):
+                try:
+                    return await self._fetch_once(http, url, entry)
+                except (httpx.TransportError, _RetryableStatus) as e:
+                    error = e
+                    if attempt < self.retries:
+                        await asyncio.sleep(RETRY_DELAY * attempt)
+        print(f"[Ошибка скачивания]: {url}: {error}")
+        return FetchResult(url, entry and entry["object"], entry and entry["sha256"], "failed")
+
+    async def fetch_all(self, urls: Iterable[str], progress: Optional[Callable[[], None]] = None,
+                        prune: bool = True) -> Dict[str, FetchResult]:
+        """Скачивает ссылки; prune удаляет файлы ссылок, которых больше нет в списке"""
+        urls = list(dict.fromkeys(urls))
+        await asyncio.to_thread(self.load_manifest)
+
+        async def run(url):
+            result = await self.fetch(http, url)
+            if progress:
+                progress()
+            return result
+
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits, verify=self.verify,
+                                     follow_redirects=True, headers={"User-Agent": USER_AGENT}) as http:
+            results = await asyncio.gather(*(run(url) for url in urls))
+
+        removed = await asyncio.to_thread(self.prune, urls) if prune else 0
+        await asyncio.to_thread(self.save_manifest)
+
+        statuses = [r.status for r in results]
+        downloaded = sum(r.size for r in results)
+        print(f"✓ {self.prefix}: ссылок {len(results)}, скачано {statuses.count('downloaded')} "
+              f"({downloaded / 1024 / 1024:.1f} МБ), без изменений {statuses.count('not_modified')}"
+              f"+{statuses.count('same_content')}, ошибок {statuses.count('failed')}, удалено старых {removed}")
+        return {r.url: r for r in results}
@@ -1,15 +1,15 @@
 import os
-import json
 import warnings
 from pathlib import Path
 from tqdm import tqdm
-from bs4 import BeautifulSoup
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import html
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
 import re
-import io
-from html_chunking import get_html_chunks
+import lxml.html
+import trafilatura
+from chunk_ids import chunk_uid as make_chunk_uid
+from chunk_io import write_chunks
 from minio_client import get_minio_client
 
 warnings.filterwarnings("ignore")
@@ -19,70 +19,150 @@ BUCKET_SOURCE = "web-crawler"
 BUCKET_TARGET = "rag-sources"
 HTML_PREFIX = "html_pages/"
 TMP_FOLDER = "tmp_chunks/"
-OUTPUT_OBJECT = TMP_FOLDER + "html_chunks.json"
+OUTPUT_OBJECT = TMP_FOLDER + "html_chunks"
 
 # Параметры обработки
 MAX_TOKENS = 512
-ATTR_CUTOFF_LEN = 50
-CLEAN_HTML = True
 MIN_WORDS = 5
 
+# Блочные теги: текст каждого - отдельный блок, внутрь не спускаемся
+BLOCK_TAGS = {"p", "li", "h1", "h2", "h3", "h4", "h5", "h6", "tr", "dt", "dd", "pre", "blockquote",
+              "caption", "figcaption", "address"}
+HEADING_TAGS = {"h1", "h2", "h3"}
+# Строчные теги: их текст приклеивается к тексту родителя
+INLINE_TAGS = {"a", "span", "b", "strong", "i", "em", "u", "small", "sup", "sub", "abbr", "code", "font",
+               "mark", "br", "img", "label", "time", "q", "s", "cite"}
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "head", "iframe", "select", "button"}
+NAV_TAGS = {"nav", "header", "footer", "aside", "menu"}
+NAV_ATTR = re.compile(r"nav|menu|footer|header|breadcrumb|sidebar", re.IGNORECASE)
+# Страницы сохранены краулером в utf-8
+HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+
 # Проверка существования бакета
 def ensure_bucket(bucket_name: str):
     client = get_minio_client()
     if bucket_name not in [b.name for b in client.list_buckets()]:
         client.make_bucket(bucket_name)
 
-# Очистка html от тегов, мусора и спецсимволов
-def clean_html_text(html_content: str) -> str:
-    soup = BeautifulSoup(html_content, "lxml")
-    text = soup.get_text(separator="\n", strip=True)
-    text = html.unescape(text)
+# Приведение текста к аккуратному виду (и для блоков, и для основного текста trafilatura)
+def clean_line(text: str) -> str:
     text = text.replace("\xa0", " ").replace("\u200b", "").replace("\ufeff", "")
     text = re.sub(r"[–—−]", "-", text)
-    text = re.sub(r"[ \t]+", " ", text)
-    text = re.sub(r"\n\s*\n+", "\n", text)
-    return text.strip()
-
-# Извлечение ссылки из html
-def extract_source_url(html_content: str, html_file: Path) -> str:
-    soup = BeautifulSoup(html_content, "lxml")
-    og_tag = soup.find("meta", property="og:url")
-    if og_tag and og_tag.get("content") and og_tag["content"].startswith(("http", "https")):
-        return og_tag["content"]
-    canonical_tag = soup.find("link", rel="canonical")
-    if canonical_tag and canonical_tag.get("href") and canonical_tag["href"].startswith(("http", "https")):
-        return canonical_tag["href"]
-    a_tag = soup.find("a", href=True)
-    if a_tag and a_tag["href"].startswith(("http", "https")):
-        return a_tag["href"]
-    return html_file.name
+    return re.sub(r"\s+", " ", text).strip()
+
+# Извлечение ссылки из уже разобранного html
+def extract_source_url(tree, html_file: Path) -> str:
+    for value in tree.xpath('//meta[@property="og:url"]/@content') + tree.xpath('//link[@rel="canonical"]/@href'):
+        if value.startswith(("http", "https")):
+            return value
+    for href in tree.xpath("//a/@href")[:1]:
+        if href.startswith(("http", "https")):
+            return href
+    return Path(html_file).name
 
 # Быстрая оценка количества токенов
 def fast_token_count(text: str) -> int:
     return int(len(text.split()) * 1.3)
 
-# Обработка одного html: чанкинг, очистка, метаданные
-def process_html_file(html_file: Path) -> list[dict]:
+# ========== ОБХОД ДЕРЕВА ==========
+
+# Один проход по дереву: блоки текста с признаками навигации (доля текста ссылок, nav-предки)
+def iter_blocks(element, in_nav=False):
+    tag = element.tag if isinstance(element.tag, str) else ""
+    if tag in SKIP_TAGS:
+        return
+    in_nav = in_nav or tag in NAV_TAGS or bool(NAV_ATTR.search(f"{element.get('class', '')} {element.get('id', '')}"))
+
+    if tag in BLOCK_TAGS:
+        if tag == "tr":
+            parts = [clean_line(cell.text_content()) for cell in element if cell.tag in ("td", "th")]
+            parts = [p for p in parts if p]
+            text = " | ".join(parts)
+        else:
+            text = clean_line(element.text_content())
+            parts = [text]
+        if text:
+            link_chars = sum(len(clean_line(a.text_content())) for a in element.iter("a"))
+            yield {"text": text, "parts": parts, "heading": tag in HEADING_TAGS,
+                   "nav": 1.0 if in_nav else min(1.0, link_chars / len(text))}
+        return
+
+    # Контейнер: строчный текст копится в буфер, блочные и вложенные контейнеры обходятся рекурсивно
+    buffer, link_chars = [element.text or ""], 0
+
+    def flush():
+        text = clean_line("".join(buffer))
+        buffer.clear()
+        if text:
+            yield {"text": text, "parts": [text], "heading": False,
+                   "nav": 1.0 if in_nav else min(1.0, link_chars / len(text))}
+
+    for child in element:
+        child_tag = child.tag if isinstance(child.tag, str) else ""
+        if child_tag in INLINE_TAGS:
+            fragment = child.text_content()
+            buffer.append(" " if child_tag == "br" else fragment)
+            link_chars += len(clean_line(fragment)) if child_tag == "a" else sum(
+                len(clean_line(a.text_content())) for a in child.iter("a"))
+        else:
+            yield from flush()
+            link_chars = 0
+            yield from iter_blocks(child, in_nav)
+        buffer.append(child.tail or "")
+    yield from flush()
+
+# Основной текст страницы без шапки/меню/подвала; None, если trafilatura ничего не нашла
+def main_content(tree):
+    text = trafilatura.extract(tree, include_tables=True, include_comments=False, favor_recall=True)
+    return clean_line(text) if text else None
+
+# ========== ЧАНКИ ==========
+
+def _chunk_from_blocks(blocks):
+    text = "\n".join(b["text"] for b in blocks)
+    chars = sum(len(b["text"]) for b in blocks)
+    return text, sum(b["nav"] * len(b["text"]) for b in blocks) / max(chars, 1)
+
+# Блоки склеиваются до MAX_TOKENS, заголовок h1-h3 начинает новый чанк
+def build_chunks(blocks, max_tokens=MAX_TOKENS):
+    current, size = [], 0
+    for block in blocks:
+        tokens = fast_token_count(block["text"])
+        if current and (block["heading"] or size + tokens > max_tokens):
+            yield _chunk_from_blocks(current)
+            current, size = [], 0
+        if tokens > max_tokens:
+            # слишком длинный блок режем по словам
+            words = block["text"].split()
+            step = max(1, int(max_tokens / 1.3))
+            for i in range(0, len(words), step):
+                yield " ".join(words[i:i + step]), block["nav"]
+            continue
+        current.append(block)
+        size += tokens
+    if current:
+        yield _chunk_from_blocks(current)
+
+# Обработка одного html: разбор один раз, основной текст, чанкинг, метаданные
+def process_html_file(html_file) -> list[dict]:
     html_path, html_bytes = html_file
     try:
-        html_content = html_bytes.decode("utf-8", errors="ignore")
-        source_url = extract_source_url(html_content, html_path)
+        tree = lxml.html.fromstring(html_bytes, parser=HTML_PARSER)
+        source_url = extract_source_url(tree, html_path)
+        body = tree.find("body")
+        blocks = list(iter_blocks(body if body is not None else tree))
 
-        # Генерируем html чанки
-        chunks = get_html_chunks(
-            html_content,
-            max_tokens=MAX_TOKENS,
-            is_clean_html=CLEAN_HTML,
-            attr_cutoff_len=ATTR_CUTOFF_LEN
-        )
+        # trafilatura берёт то же дерево (без повторного разбора) и может его менять, поэтому после обхода
+        main = main_content(tree)
+        if main:
+            blocks = [b for b in blocks if all(part in main for part in b["parts"])]
 
         results = []
         start_offset = 0
         base_id = Path(html_path).stem[:10]
 
-        for i, chunk_html in enumerate(chunks):
-            text_only = clean_html_text(chunk_html)
+        for i, (text_only, nav_score) in enumerate(build_chunks(blocks)):
             if len(text_only.split()) < MIN_WORDS:
                 continue
 
@@ -92,9 +172,11 @@ def process_html_file(html_file: Path) -> list[dict]:
 
             results.append({
                 "chunk_id": i,
-                "chunk_uid": f"{base_id}_chunk_{i}",
+                # тот же uid, что у остальных чанкеров: источник + смещение + хэш текста
+                "chunk_uid": make_chunk_uid(source_url, start_offset, text_only),
                 "text": text_only,
                 "token_count": token_count,
+                "nav_score": round(nav_score, 3),
                 "start_offset": start_offset,
                 "end_offset": end_offset,
                 "document_id": base_id,
@@ -109,22 +191,31 @@ def process_html_file(html_file: Path) -> list[dict]:
             start_offset = end_offset
 
         return results
-    except Exception:
+    except Exception as e:
+        print(f"[WARN] {html_path}: не удалось разобрать ({e}), пропускаем", flush=True)
         return []
 
-# Загрузка json с чанками в минио
-def upload_json_to_minio(bucket, object_name, data):
-    ensure_bucket(bucket)
-    client = get_minio_client()
-    encoded = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
-    client.put_object(
-        bucket_name=bucket,
-        object_name=object_name,
-        data=io.BytesIO(encoded),
-        length=len(encoded),
-        content_type="application/json"
-    )
-    print(f"[MinIO] Загружено: {object_name}")
+# ========== ВОРКЕРЫ ==========
+
+_worker_client = None
+
+# Обработка одного объекта MinIO в процессе пула: воркер сам скачивает html по ключу.
+# Сбой скачивания, как и сбой разбора, пропускает файл, а не останавливает весь прогон
+def process_object(object_name: str) -> list[dict]:
+    global _worker_client
+    try:
+        if _worker_client is None:
+            _worker_client = get_minio_client()
+        response = _worker_client.get_object(BUCKET_SOURCE, object_name)
+        try:
+            html_bytes = response.read()
+        finally:
+            response.close()
+            response.release_conn()
+    except Exception as e:
+        print(f"[WARN] {object_name}: не удалось скачать ({e}), пропускаем", flush=True)
+        return []
+    return process_html_file((object_name, html_bytes))
 
 # Главная функция
 def main():
@@ -133,33 +224,30 @@ def main():
 
     # Список объектов HTML в бакете
     object_list = list(client.list_objects(BUCKET_SOURCE, prefix=HTML_PREFIX, recursive=True))
-    html_objects = [obj for obj in object_list if obj.object_name.endswith(".html")]
+    html_objects = [obj.object_name for obj in object_list if obj.object_name.endswith(".html")]
     print(f"[INFO] HTML файлов найдено: {len(html_objects)}")
 
-    all_chunks = []
     num_workers = max(2, os.cpu_count() // 2)
-    print(f"[INFO] Обработка HTML файлов ({num_workers} потоков)...", flush=True)
-
-    pbar = tqdm(total=len(html_objects), desc="Chunk HTML", ncols=100)
-
-    # Обёртка для параллельной обработки одного объекта MinIO
-    def process_object(obj):
-        html_bytes = client.get_object(BUCKET_SOURCE, obj.object_name).read()
-        return process_html_file((obj.object_name, html_bytes))
-
-    with ThreadPoolExecutor(max_workers=num_workers) as executor:
-        futures = {executor.submit(process_object, obj): obj for obj in html_objects}
-        for future in as_completed(futures):
-            result = future.result()
-            if result:
-                all_chunks.extend(result)
-            pbar.update(1)
-
-    pbar.close()
-    print(f"[INFO] Всего HTML чанков: {len(all_chunks)}", flush=True)
+    print(f"[INFO] Обработка HTML файлов ({num_workers} процессов)...", flush=True)
+
+    # Чанки отдаются по мере готовности; в работе не больше num_workers * 4 файлов
+    def iter_html_chunks():
+        pbar = tqdm(total=len(html_objects), desc="Chunk HTML", ncols=100)
+        objects = iter(html_objects)
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            pending = {executor.submit(process_object, name) for name in islice(objects, num_workers * 4)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+                    pbar.update(1)
+                pending |= {executor.submit(process_object, name) for name in islice(objects, len(done))}
+        pbar.close()
 
     # Сохраняем в MinIO в tmp_chunks
-    upload_json_to_minio(BUCKET_TARGET, OUTPUT_OBJECT, {"chunks": all_chunks})
+    ensure_bucket(BUCKET_TARGET)
+    count = write_chunks(client, BUCKET_TARGET, OUTPUT_OBJECT, iter_html_chunks())
+    print(f"[INFO] Всего HTML чанков: {count}", flush=True)
 
 if __name__ == "__main__":
     main()
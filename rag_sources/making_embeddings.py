@@ -1,12 +1,19 @@
-import io
-import json
-from typing import List, Dict
+import os
+import tempfile
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
 
+import numpy as np
 from tqdm import tqdm
 from loguru import logger
-from sentence_transformers import SentenceTransformer
 
+from chunk_ids import text_hash
+from chunk_io import find_chunk_object, read_chunks
+from embedding_artifact import EmbeddingArtifactWriter, payload_metadata, upload_artifact
+from embedding_engine import EmbeddingEngine
+from embedding_store import EmbeddingStore
 from minio_client import get_minio_client
+from sparse_encoder import SparseEncoder, tokenize
 
 
 # Настройки
@@ -14,26 +21,41 @@ BUCKET_SOURCE = "rag-sources"
 BUCKET_TARGET = "rag-sources"
 
 # Объекты с чанками
-SCHEDULES_CHUNKS_OBJECT = "tmp_chunks_for_embeddings/schedules_chunks.json"
-ALL_CHUNKS_OBJECT = "tmp_chunks_for_embeddings/all_chunks.json"
+SCHEDULES_CHUNKS_OBJECT = "tmp_chunks_for_embeddings/schedules_chunks"
+ALL_CHUNKS_OBJECT = "tmp_chunks_for_embeddings/all_chunks"
+# Результат dedup_chunks (без почти одинаковых чанков)
+DEDUP_CHUNKS_OBJECT = "tmp_chunks_for_embeddings/dedup_chunks"
 
-# Куда сохраняем эмбеддинги
-SCHEDULES_EMBEDDINGS_OBJECT = "embeddings/schedules_chunks.jsonl"
-ALL_EMBEDDINGS_OBJECT = "embeddings/all_chunks.jsonl"
+# Куда сохраняем эмбеддинги: <префикс>.vectors.npy + <префикс>.payloads.parquet
+SCHEDULES_EMBEDDINGS_PREFIX = "embeddings/schedules_chunks"
+ALL_EMBEDDINGS_PREFIX = "embeddings/all_chunks"
 
 MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2" # Поменять
 DEVICE = "cpu"
 BATCH_SIZE = 32
+# torch / onnx / onnx-int8 и число процессов кодирования (0 - в текущем процессе)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+EMBED_PROCESSES = int(os.getenv("EMBED_PROCESSES", "0"))
+# float16 вдвое меньше, Qdrant всё равно получает float32
+EMBED_DTYPE = os.getenv("EMBED_DTYPE", "float32")
+# Старый формат <префикс>.jsonl - только по запросу
+EXPORT_JSONL = os.getenv("EXPORT_JSONL", "0") == "1"
 
 
-# Загрузка чанков из минио
-def load_chunks(object_name: str) -> List[Dict]:
-    client = get_minio_client()
-    data = client.get_object(BUCKET_SOURCE, object_name).read()
-    parsed = json.loads(data.decode("utf-8"))
-    chunks = parsed.get("chunks", [])
-    logger.info(f"Загружено {len(chunks)} чанков из {object_name}")
-    return chunks
+# Потоковое чтение чанков из минио (NDJSON, NDJSON.zst или старый JSON)
+def load_chunks(object_name: str) -> Iterator[Dict]:
+    return unique_chunks(read_chunks(get_minio_client(), BUCKET_SOURCE, object_name))
+
+
+# dedup_chunks, если стадия дедупликации отработала после последней сборки all_chunks, иначе all_chunks
+def all_chunks_source(client) -> str:
+    dedup = find_chunk_object(client, BUCKET_SOURCE, DEDUP_CHUNKS_OBJECT)
+    source = find_chunk_object(client, BUCKET_SOURCE, ALL_CHUNKS_OBJECT)
+    if dedup and (source is None or client.stat_object(BUCKET_SOURCE, dedup).last_modified
+                  >= client.stat_object(BUCKET_SOURCE, source).last_modified):
+        return DEDUP_CHUNKS_OBJECT
+    logger.warning("dedup_chunks нет или он старше all_chunks - эмбеддинги строятся без дедупликации")
+    return ALL_CHUNKS_OBJECT
 
 
 # Формирование текста для эмбеддинга
@@ -47,10 +69,11 @@ def build_text(chunk: Dict) -> str:
             f"Неделя: {m.get('week')}",
             m.get("lesson_type"),
             m.get("subject"),
-            f"Аудитория: {m.get('room')}",
-            f"Преподаватели: {', '.join(m.get('teacher', []))}",
-            f"Группы: {', '.join(m.get('groups', []))}",
-            f"Кафедра {m.get('department')}",
+            # в таблице занятий паука пустые поля - пустые строки, а не "не указано"
+            f"Аудитория: {m.get('room')}" if m.get("room") else None,
+            f"Преподаватели: {', '.join(m.get('teacher', []))}" if m.get("teacher") else None,
+            f"Группы: {', '.join(m.get('groups', []))}" if m.get("groups") else None,
+            f"Кафедра {m.get('department')}" if m.get("department") else None,
         ]
         return ". ".join(p for p in parts if p)
     # Если другой документ
@@ -58,65 +81,115 @@ def build_text(chunk: Dict) -> str:
         return chunk.get("text") or ""
 
 
-# Генерация эмбеддингов для списка чанков и сохранение в минио
-def generate_embeddings(chunks: List[Dict], output_object: str):
+# Убираем чанки с повторяющимся uid (одинаковый текст в одном месте источника)
+def unique_chunks(chunks: Iterable[Dict]) -> Iterator[Dict]:
+    seen = set()
+    for chunk in chunks:
+        if chunk["chunk_uid"] in seen:
+            continue
+        seen.add(chunk["chunk_uid"])
+        yield chunk
+
+
+# Кодирование только тех текстов, которых ещё нет в хранилище эмбеддингов
+def encode_missing(engine: EmbeddingEngine, store: EmbeddingStore, missing: Dict[str, str]):
+    hashes = list(missing)
+
+    # Куски приходят по мере готовности, в порядке длины текста
+    with tqdm(total=len(hashes), desc="encode") as progress:
+        for positions, vectors in engine.encode_stream([missing[h] for h in hashes]):
+            store.add([hashes[i] for i in positions], vectors)
+            progress.update(len(positions))
+
+
+# Генерация эмбеддингов для набора чанков и сохранение в минио.
+# Два прохода по потоку чанков: первый собирает хэши и новые тексты, второй пишет артефакт
+def generate_embeddings(chunks_object: str, output_prefix: str,
+                        engine: EmbeddingEngine, store: EmbeddingStore) -> List[str]:
     client = get_minio_client()
-    model = SentenceTransformer(MODEL_NAME, device=DEVICE)
-
-    buffer = io.StringIO()
-
-    # Обрабатываем чанки батчами
-    for i in tqdm(range(0, len(chunks), BATCH_SIZE), desc=output_object):
-        batch = chunks[i:i + BATCH_SIZE]
-        # Тексы для эмбеддинга
-        texts = [build_text(c) for c in batch]
-        # Генерим эмбеддинги
-        vectors = model.encode(texts, show_progress_bar=False)
-
-        # Формируем структуру для jsonl
-        for chunk, vector, text in zip(batch, vectors, texts):
-            record = {
-                "id": chunk["chunk_uid"], # ВАЖНО, чтобы прошла загрузка в qdrant
-                "vector": vector.tolist(),
-                "payload": {
+
+    # Хэши текстов для эмбеддинга - ключи хранилища; в памяти держим только новые тексты
+    hashes = []
+    missing = {}
+    # заодно длины в токенах BM25 - для средней длины документа
+    total_tokens = 0
+    for chunk in load_chunks(chunks_object):
+        text = build_text(chunk)
+        hash_ = text_hash(text)
+        hashes.append(hash_)
+        total_tokens += len(tokenize(text))
+        if hash_ not in store and hash_ not in missing:
+            missing[hash_] = text
+    logger.info(f"Чанков в {chunks_object}: {len(hashes)}, новых текстов: {len(missing)}")
+    encode_missing(engine, store, missing)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        writer = EmbeddingArtifactWriter(
+            tmp_dir, os.path.basename(output_prefix), len(hashes), store.dim,
+            dtype=EMBED_DTYPE, jsonl=EXPORT_JSONL, sparse=True,
+        )
+        # BM25-векторы для гибридного поиска: IDF считает Qdrant, здесь только tf и длина документа
+        sparse_encoder = SparseEncoder(avgdl=total_tokens / max(len(hashes), 1))
+
+        # Собираем артефакт батчами из хранилища
+        chunks = load_chunks(chunks_object)
+        for i in tqdm(range(0, len(hashes), BATCH_SIZE), desc=output_prefix):
+            batch = list(islice(chunks, BATCH_SIZE))
+            vectors = np.stack([store.get(h) for h in hashes[i:i + BATCH_SIZE]])
+
+            texts = [build_text(chunk) for chunk in batch]
+
+            # Строки таблицы payload, chunk_uid станет ID точки в qdrant
+            writer.add_batch([
+                {
+                    "chunk_uid": chunk["chunk_uid"],
                     "text": text,
                     "type": chunk.get("type"),
                     "document_id": chunk.get("document_id"),
                     "source_url": chunk.get("source_url"),
-                    "metadata": chunk.get("metadata", {})
+                    "metadata": payload_metadata(chunk),
                 }
-            }
-            buffer.write(json.dumps(record, ensure_ascii=False) + "\n")
-
-    # Конвертируем буфер в байты для загрузки в минио
-    data = buffer.getvalue().encode("utf-8")
-
-    # Сохраняем результат в минио
-    client.put_object(
-        bucket_name=BUCKET_TARGET,
-        object_name=output_object,
-        data=io.BytesIO(data),
-        length=len(data),
-        content_type="application/json"
-    )
+                for chunk, text in zip(batch, texts, strict=True)
+            ], vectors, sparse=[sparse_encoder.encode_document(text) for text in texts])
 
-    logger.success(f"Эмбеддинги сохранены: {output_object}")
+        # Сохраняем результат в минио (большие файлы уходят multipart-частями)
+        upload_artifact(client, BUCKET_TARGET, output_prefix, writer.close())
 
+    logger.success(f"Эмбеддинги сохранены: {output_prefix}")
+    return hashes
 
-# Главная функция, загружает все чанки и генерит для них эмбеддинги
+
+# Главная функция, загружает все чанки и генерит эмбеддинги только для новых текстов
 def main():
+    client = get_minio_client()
+    engine = EmbeddingEngine(
+        MODEL_NAME, backend=EMBED_BACKEND, processes=EMBED_PROCESSES,
+        batch_size=BATCH_SIZE, device=DEVICE,
+    )
+    # Квантованные векторы отличаются от исходных - храним их отдельно
+    store_model = MODEL_NAME if EMBED_BACKEND == "torch" else f"{MODEL_NAME}@{EMBED_BACKEND}"
+    store = EmbeddingStore(store_model, engine.dim, dtype=EMBED_DTYPE)
+    store.load(client, BUCKET_TARGET)
+    logger.info(f"В хранилище эмбеддингов: {len(store)} текстов")
+
     # Эмбеддинги чанков расписания
-    generate_embeddings(
-        load_chunks(SCHEDULES_CHUNKS_OBJECT),
-        SCHEDULES_EMBEDDINGS_OBJECT
+    used_hashes = generate_embeddings(
+        SCHEDULES_CHUNKS_OBJECT,
+        SCHEDULES_EMBEDDINGS_PREFIX,
+        engine, store,
     )
 
     # Эмбеддинги остальных чанков
-    generate_embeddings(
-        load_chunks(ALL_CHUNKS_OBJECT),
-        ALL_EMBEDDINGS_OBJECT
+    used_hashes += generate_embeddings(
+        all_chunks_source(client),
+        ALL_EMBEDDINGS_PREFIX,
+        engine, store,
     )
 
+    # Тексы, которых больше нет в корпусе, из хранилища выбрасываем
+    store.save(client, BUCKET_TARGET, keep=used_hashes)
+    engine.close()
+
 
 if __name__ == "__main__":
     main()
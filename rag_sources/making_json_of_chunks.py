@@ -1,11 +1,10 @@
-import io
-import json
 import re
-import uuid
 from datetime import datetime, timezone
 from bs4 import BeautifulSoup
+from chunk_ids import chunk_uid as make_chunk_uid, text_hash
+from chunk_io import find_chunk_object, read_chunks, write_chunks
+from chunking import count_tokens
 from minio_client import get_minio_client
-import tiktoken
 from loguru import logger
 
 # Настройки
@@ -13,13 +12,15 @@ BUCKET = "rag-sources" #
 TMP_CHUNKS_PREFIX = "tmp_chunks"  # исходные PDF/HTML/DOCX
 TMP_JSON_PREFIX = "tmp_chunks_for_embeddings"  # куда сохраняем объединённый JSON
 
-# Используем токенизацию, совместимую с GPT
-ENC = tiktoken.encoding_for_model("gpt-3.5-turbo")
 MIN_TOKENS = 50
+# Порог доли навигации (nav_score из html_to_chunks), выше - чанк считаем меню/шапкой
+NAV_SCORE_MAX = 0.5
+# Эти стадии уже посчитали токены тем же энкодером (chunking), повторно не кодируем
+COUNTED_TYPES = ("pdf", "docx")
 
-# Список файлов чанков, которые обрабатываем
-CHUNK_FILES = {"pdf_chunks.json", "docx_chunks.json", "html_chunks.json"}
-SCHEDULES_FILE = "schedules_chunks.json"
+# Наборы чанков, которые обрабатываем (базовые имена, формат определяет chunk_io)
+CHUNK_FILES = ("pdf_chunks", "docx_chunks", "html_chunks")
+SCHEDULES_FILE = "schedules_chunks"
 
 client = get_minio_client()
 
@@ -33,10 +34,16 @@ def clean_text(text: str) -> str:
 
 # Подсчет токенов для фильтрации слишком коротких чанокв (мб вообще не нужна)
 def tokenize(text: str) -> int:
-    return len(ENC.encode(text))
+    return count_tokens(text)
 
-# Удаляем приблуду из html
-def looks_like_navigation(html_fragment: str) -> bool:
+# Удаляем приблуду из html: новые чанки несут nav_score, посчитанный при разборе страницы,
+# старые без него разбираем заново
+def looks_like_navigation(chunk: dict) -> bool:
+    if "nav_score" in chunk:
+        return len(chunk.get("text", "").split()) < 5 or chunk["nav_score"] > NAV_SCORE_MAX
+    return looks_like_navigation_html(chunk.get("raw_html", chunk.get("text", "")))
+
+def looks_like_navigation_html(html_fragment: str) -> bool:
     soup = BeautifulSoup(html_fragment, "lxml")
     text = soup.get_text(separator=" ", strip=True)
     if len(text.split()) < 5:
@@ -55,7 +62,9 @@ def normalize_chunk(chunk: dict, source_url: str, doc_type: str, chunk_id: int,
     if not text:
         return None, offset
 
-    token_count = tokenize(text)
+    token_count = chunk.get("token_count") if doc_type in COUNTED_TYPES else None
+    if token_count is None:
+        token_count = tokenize(text)
     start_offset = offset
     end_offset = offset + len(text)
     offset = end_offset
@@ -65,19 +74,22 @@ def normalize_chunk(chunk: dict, source_url: str, doc_type: str, chunk_id: int,
         return None, offset
     # Доп проверка для html на приблуду
     if doc_type == "html":
-        raw_html = chunk.get("raw_html", chunk.get("text", ""))
-        if looks_like_navigation(raw_html):
+        if looks_like_navigation(chunk):
             return None, offset
 
-    # Генерируем уникальный uid чанка
-    chunk_uid = str(uuid.uuid4())
+    # uid чанка детерминирован: источник + позиция в своём документе + хэш текста,
+    # поэтому при пересборке неизменившиеся чанки сохраняют ID точки в Qdrant
+    doc_offset = chunk.get("start_offset", start_offset)
     normalized = {
         "chunk_id": chunk_id,
-        "chunk_uid": chunk_uid,
+        "chunk_uid": make_chunk_uid(source_url, doc_offset, text),
         "text": text,
+        "text_hash": text_hash(text),
         "token_count": token_count,
-        "start_offset": start_offset,
-        "end_offset": end_offset,
+        # смещения в тексте своего документа от чанкера (у pdf/docx соседние чанки перекрываются);
+        # по ним context_builder склеивает соседние чанки. Без них чанк не склеивается
+        "start_offset": chunk.get("start_offset"),
+        "end_offset": chunk.get("end_offset"),
         "document_id": source_url,
         "source_url": source_url,
         "type": doc_type,
@@ -88,46 +100,31 @@ def normalize_chunk(chunk: dict, source_url: str, doc_type: str, chunk_id: int,
     }
     return normalized, offset
 
-# Сохранение словаря в минио в виде json
-def upload_json_to_minio(object_name: str, data: dict):
-    json_bytes = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
-    client.put_object(
-        bucket_name=BUCKET,
-        object_name=f"{TMP_JSON_PREFIX}/{object_name}",
-        data=io.BytesIO(json_bytes),
-        length=len(json_bytes),
-        content_type="application/json"
-    )
-    logger.info(f"[MinIO] JSON загружен: {BUCKET}/{TMP_JSON_PREFIX}/{object_name}")
-
-# Объединение и нормализация чанков
-def merge_and_normalize_chunks():
-    all_chunks = []
+# Нормализованные чанки всех наборов потоком
+def iter_normalized_chunks():
     chunk_id_global = 0
 
-    objects = client.list_objects(BUCKET, prefix=f"{TMP_CHUNKS_PREFIX}/", recursive=True)
-    for obj in objects:
-        file_name = obj.object_name.split("/")[-1]
-        if file_name not in CHUNK_FILES:
+    for file_name in CHUNK_FILES:
+        base = f"{TMP_CHUNKS_PREFIX}/{file_name}"
+        if find_chunk_object(client, BUCKET, base) is None:
             continue
 
         logger.info(f"Обрабатываем {file_name}...")
-        data_bytes = client.get_object(BUCKET, obj.object_name).read()
-        data_json = json.loads(data_bytes)
-        chunks = data_json.get("chunks", data_json if isinstance(data_json, list) else [])
         offset = 0
 
         doc_type = "pdf" if "pdf" in file_name else "docx" if "docx" in file_name else "html"
 
-        for ch in chunks:
+        for ch in read_chunks(client, BUCKET, base):
             source_url = ch.get("source_url") or ch.get("document_id") or file_name
             normalized, offset = normalize_chunk(ch, source_url, doc_type, chunk_id_global, offset)
             if normalized:
-                all_chunks.append(normalized)
+                yield normalized
                 chunk_id_global += 1
 
-    upload_json_to_minio("all_chunks.json", {"chunks": all_chunks})
-    logger.success(f"Объединение PDF/HTML/DOCX завершено. Всего чанков: {len(all_chunks)}")
+# Объединение и нормализация чанков
+def merge_and_normalize_chunks():
+    count = write_chunks(client, BUCKET, f"{TMP_JSON_PREFIX}/all_chunks", iter_normalized_chunks())
+    logger.success(f"Объединение PDF/HTML/DOCX завершено. Всего чанков: {count}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,269 @@
+"""Извлечение текста из PDF для pdf_to_chunks.
+
+- воркеры получают только ключ объекта и сами скачивают PDF во временный файл, родитель байты не держит;
+- pdfminer читает документ постранично, OCR делается только для страниц без текста или с мусором;
+- OCR идёт в отдельном пуле: DPI страницы ограничен бюджетом в мегапикселях, на документ есть таймаут;
+- результат кэшируется в MinIO по sha256 содержимого, поэтому неизменившиеся PDF повторно не разбираются.
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from io import BytesIO
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from chunking import normalize_text
+from minio_client import get_minio_client
+
+# Кэш текста: <префикс>/v<версия>/<sha256>.json; версия поднимается при изменении логики извлечения
+CACHE_PREFIX = "pdf_text_cache"
+EXTRACTOR_VERSION = 1
+
+TEXT_WORKERS = int(os.getenv("PDF_TEXT_WORKERS", "4"))
+OCR_WORKERS = int(os.getenv("PDF_OCR_WORKERS", "2"))
+OCR_DPI = int(os.getenv("PDF_OCR_DPI", "200"))
+# Бюджет на страницу: для больших форматов DPI снижается, чтобы картинка не превышала столько мегапикселей
+OCR_MAX_MEGAPIXELS = float(os.getenv("PDF_OCR_MAX_MEGAPIXELS", "12"))
+OCR_MIN_DPI = 72
+OCR_MAX_PAGES = int(os.getenv("PDF_OCR_MAX_PAGES", "50"))
+# Таймаут на весь OCR одного документа, секунды
+OCR_TIMEOUT = float(os.getenv("PDF_OCR_TIMEOUT", "300"))
+
+# Имя объекта из fetcher: <sha256>.pdf - хэш известен без скачивания
+SHA256_NAME = re.compile(r"[0-9a-f]{64}")
+CID_PATTERN = re.compile(r"\(cid:\d+\)")
+ALLOWED_CHARS = frozenset(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+    "АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ"
+    "абвгдеёжзийклмнопрстуфхцчшщъыьэюя"
+    "0123456789 .,;:-–—()[]\"'«»?!%\n\t"
+)
+
+
+# Функция проверки, является ли текст мусорным (битые шрифты, cid-коды)
+def looks_like_garbage(text: str) -> bool:
+    if not text:
+        return True
+    garbage_ratio = sum(ch not in ALLOWED_CHARS for ch in text) / max(len(text), 1)
+    if garbage_ratio > 0.3:
+        return True
+    return bool(CID_PATTERN.search(text))
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_dpi(width_pt: float, height_pt: float) -> int:
+    """DPI для OCR страницы в пределах бюджета пикселей (размеры страницы в пунктах)"""
+    square_inches = max(width_pt / 72, 1e-3) * max(height_pt / 72, 1e-3)
+    budget_dpi = math.sqrt(OCR_MAX_MEGAPIXELS * 1e6 / square_inches)
+    return int(max(OCR_MIN_DPI, min(OCR_DPI, budget_dpi)))
+
+
+# ========== КЭШ ==========
+
+def cache_object_name(sha256: str) -> str:
+    return f"{CACHE_PREFIX}/v{EXTRACTOR_VERSION}/{sha256}.json"
+
+
+def load_cached(client, bucket: str, sha256: str) -> Optional[List[str]]:
+    import minio.error
+
+    try:
+        response = client.get_object(bucket, cache_object_name(sha256))
+    except minio.error.S3Error as e:
+        if e.code != "NoSuchKey":
+            raise
+        return None
+    try:
+        return json.loads(response.read().decode("utf-8"))["pages"]
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def save_cached(client, bucket: str, sha256: str, pages: List[str]):
+    data = json.dumps({"sha256": sha256, "pages": pages}, ensure_ascii=False).encode("utf-8")
+    client.put_object(bucket, cache_object_name(sha256), BytesIO(data), length=len(data),
+                      content_type="application/json")
+
+
+# ========== ВОРКЕРЫ ==========
+
+_worker_client = None
+
+
+def _client():
+    global _worker_client
+    if _worker_client is None:
+        _worker_client = get_minio_client()
+    return _worker_client
+
+
+def extract_pages_text(path: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """Текст каждой страницы через pdfminer и список (номер страницы, DPI) для OCR"""
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTFigure, LTImage, LTTextContainer
+
+    def walk(elements):
+        for el in elements:
+            yield el
+            if isinstance(el, LTFigure):
+                yield from walk(el)
+
+    pages, ocr_pages = [], []
+    for number, layout in enumerate(extract_pages(path)):
+        parts, has_image = [], False
+        for el in walk(layout):
+            if isinstance(el, LTTextContainer):
+                parts.append(el.get_text().strip())
+            elif isinstance(el, (LTFigure, LTImage)):
+                has_image = True
+        text = normalize_text("\n".join(parts), keep_lines=True)
+        # пустая страница без картинок - просто пустая, сканы и битые шрифты отправляем в OCR
+        if (text and looks_like_garbage(text)) or (not text and has_image):
+            ocr_pages.append((number, page_dpi(layout.width, layout.height)))
+        pages.append(text)
+    return pages, ocr_pages
+
+
+def _extract_worker(bucket: str, object_name: str, tmp_dir: str) -> Dict:
+    client = _client()
+    name_hash = os.path.basename(object_name).split(".")[0]
+    if SHA256_NAME.fullmatch(name_hash):
+        cached = load_cached(client, bucket, name_hash)
+        if cached is not None:
+            return {"sha256": name_hash, "pages": cached, "ocr": [], "cached": True}
+
+    path = os.path.join(tmp_dir, hashlib.sha1(object_name.encode()).hexdigest() + ".pdf")
+    client.fget_object(bucket, object_name, path)
+    sha256 = file_sha256(path)
+
+    cached = load_cached(client, bucket, sha256)
+    if cached is not None:
+        os.remove(path)
+        return {"sha256": sha256, "pages": cached, "ocr": [], "cached": True}
+
+    try:
+        pages, ocr_pages = extract_pages_text(path)
+    except Exception as e:
+        print(f"[Ошибка PDF] {object_name}: {e}")
+        pages, ocr_pages = [], []
+    return {"sha256": sha256, "path": path, "pages": pages, "ocr": ocr_pages[:OCR_MAX_PAGES], "cached": False}
+
+
+def _ocr_worker(path: str, pages: List[Tuple[int, int]], timeout: float) -> Tuple[Dict[int, str], bool]:
+    """OCR выбранных страниц; возвращает {номер: текст} и признак, что успели все страницы"""
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    deadline = time.monotonic() + timeout
+    result = {}
+    for number, dpi in pages:
+        if deadline - time.monotonic() <= 0:
+            return result, False
+        try:
+            images = convert_from_path(path, dpi=dpi, first_page=number + 1, last_page=number + 1,
+                                       timeout=max(1, int(deadline - time.monotonic())))
+            if not images:
+                continue
+            text = pytesseract.image_to_string(images[0], config="--psm 6",
+                                               timeout=max(1, deadline - time.monotonic()))
+        except Exception as e:
+            # таймаут pdftoppm/tesseract или битая страница
+            if deadline - time.monotonic() <= 0:
+                return result, False
+            print(f"[Ошибка OCR] {path}, страница {number + 1}: {e}")
+            continue
+        result[number] = normalize_text(text, keep_lines=True)
+    return result, True
+
+
+# ========== ПАЙПЛАЙН ==========
+
+def _finish(client, bucket: str, extracted: Dict, ocr_text: Dict[int, str], complete: bool, stats: Counter) -> str:
+    pages = list(extracted["pages"])
+    for number, text in ocr_text.items():
+        if text:
+            pages[number] = text
+
+    if extracted.get("path"):
+        os.remove(extracted["path"])
+    if extracted["cached"]:
+        stats["cached"] += 1
+    elif complete:
+        # документ с прерванным OCR не кэшируем, чтобы в следующий раз попробовать снова
+        save_cached(client, bucket, extracted["sha256"], pages)
+    else:
+        stats["ocr_timeout"] += 1
+    if ocr_text:
+        stats["ocr"] += 1
+    return "\n\n".join(page for page in pages if page)
+
+
+def extract_pdfs(bucket: str, items: Iterable[Tuple[str, str]], text_workers: int = TEXT_WORKERS,
+                 ocr_workers: int = OCR_WORKERS) -> Iterator[Tuple[str, str, str]]:
+    """По парам (ключ, объект PDF в bucket) отдаёт (ключ, объект, текст) по мере готовности"""
+    items = iter(items)
+    client = get_minio_client()
+    tmp_dir = tempfile.mkdtemp(prefix="pdf_extract_")
+    stats = Counter()
+    # future -> (ключ, объект, результат pdfminer для OCR-задач или None для задач извлечения)
+    pending = {}
+
+    try:
+        with ProcessPoolExecutor(max_workers=text_workers) as text_pool, \
+                ProcessPoolExecutor(max_workers=ocr_workers) as ocr_pool:
+
+            def submit_next():
+                for key, object_name in items:
+                    pending[text_pool.submit(_extract_worker, bucket, object_name, tmp_dir)] = (key, object_name, None)
+                    return
+
+            # в очереди не больше двух документов на процесс
+            for _ in range(text_workers * 2):
+                submit_next()
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, object_name, extracted = pending.pop(future)
+                    stats["total"] += extracted is None
+
+                    if extracted is None:
+                        submit_next()
+                        try:
+                            extracted = future.result()
+                        except Exception as e:
+                            print(f"[Ошибка PDF] {object_name}: {e}")
+                            yield key, object_name, ""
+                            continue
+                        if extracted["ocr"]:
+                            ocr_future = ocr_pool.submit(_ocr_worker, extracted["path"], extracted["ocr"], OCR_TIMEOUT)
+                            pending[ocr_future] = (key, object_name, extracted)
+                            continue
+                        ocr_text, complete = {}, True
+                    else:
+                        try:
+                            ocr_text, complete = future.result()
+                        except Exception as e:
+                            print(f"[Ошибка OCR] {object_name}: {e}")
+                            ocr_text, complete = {}, False
+
+                    yield key, object_name, _finish(client, bucket, extracted, ocr_text, complete, stats)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"✓ PDF обработано: {stats['total']}, из кэша: {stats['cached']}, с OCR: {stats['ocr']}, "
+          f"OCR не уложился в таймаут: {stats['ocr_timeout']}")
@@ -2,20 +2,61 @@ import telegram
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 import os
-from rag_sources.qdrant_search import UniversityBot, LLMGenerator
-import asyncio
+from rag_sources.answer_cache import (
+    CollectionVersionWatcher,
+    InMemoryAnswerStore,
+    PostgresAnswerStore,
+    SemanticAnswerCache,
+)
+from rag_sources.async_university_bot import AsyncUniversityBot
+from rag_sources.embedding_cache import EmbeddingCache
+from rag_sources.qdrant_search import EMBED_MODEL
+from rag_sources.reranker import Reranker
+from rag_sources.schedule_index import ScheduleIndex
 
 # Настройки
 QDRANT_URL = "http://212.192.220.24:6333"
 QDRANT_API_KEY = "pii5z%cE1"
 TELEGRAM_TOKEN = "8477777035:AAFyXdqYx3M2UKSo3Brqbc8TvmZV2aYwKIY"
 CAILA_API_KEY = "1000097868.198240.pKeMJ9397Eh0C2Ish703JfH2InBrylvoVg5cKHX1"
-
-# Инициализируем RAG бота
-bot_rag = UniversityBot(
+# Окно сбора запросов в один батч эмбеддингов (мс)
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+# Кэш эмбеддингов запросов: кнопки меню шлют одни и те же вопросы
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "embedding_cache.npz")
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "64"))
+EMBED_CACHE_TTL_HOURS = float(os.getenv("EMBED_CACHE_TTL_HOURS", "24"))
+# Кэш ответов LLM: без DSN - в памяти процесса, с DSN - общий в Postgres
+ANSWER_CACHE_DSN = os.getenv("ANSWER_CACHE_DSN")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+# Переранжирование кандидатов кросс-энкодером (модель грузится только при включении)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+
+# Загружаем индекс расписания; если не вышло - фильтры расписания пойдут через Qdrant
+try:
+    schedule_index = ScheduleIndex.from_minio()
+except Exception as e:
+    print(f"⚠ Индекс расписания не загружен: {e}")
+    schedule_index = None
+
+# Инициализируем RAG бота (асинхронный, чтобы долгий ответ LLM не блокировал остальных)
+bot_rag = AsyncUniversityBot(
     qdrant_url=QDRANT_URL,
     api_key=QDRANT_API_KEY,
     llm_api_key=CAILA_API_KEY,
+    schedule_index=schedule_index,
+    batch_window_ms=EMBED_BATCH_WINDOW_MS,
+    embedding_cache=EmbeddingCache(
+        EMBED_MODEL,
+        max_bytes=EMBED_CACHE_MAX_MB * 1024 * 1024,
+        ttl_seconds=EMBED_CACHE_TTL_HOURS * 3600,
+        persist_path=EMBED_CACHE_PATH or None,
+    ),
+    answer_cache=SemanticAnswerCache(
+        store=PostgresAnswerStore(ANSWER_CACHE_DSN) if ANSWER_CACHE_DSN else InMemoryAnswerStore(),
+        version_watcher=CollectionVersionWatcher(),
+        threshold=ANSWER_CACHE_THRESHOLD,
+    ),
+    reranker=Reranker() if RERANK_ENABLED else None,
 )
 
 # Храним состояние пользователя
@@ -416,7 +457,7 @@ async def process_query_callback(query, question: str):
     """Обрабатывает запрос из callback"""
     try:
         print(f"🔍 Обработка запроса из callback: {question}")
-        result = bot_rag.process_query(question, use_llm_for_general=True)
+        result = await bot_rag.aprocess_query(question, use_llm_for_general=True)
         response_text = result.get("formatted_results", "Не удалось получить ответ")
 
         print(f"📤 Получен ответ длиной {len(response_text)} символов")
@@ -473,7 +514,7 @@ async def handle_message(update: telegram.Update, context: ContextTypes.DEFAULT_
             del user_states[user_id]
 
     try:
-        result = bot_rag.process_query(question, use_llm_for_general=True)
+        result = await bot_rag.aprocess_query(question, use_llm_for_general=True)
         response_text = result.get("formatted_results", "Не удалось получить ответ")
 
         print(f"📤 Тип ответа: {result.get('type')}, символов: {len(response_text)}")
@@ -527,7 +568,7 @@ async def test_bot():
     for query in test_queries:
         print(f"\nТестовый запрос: '{query}'")
         try:
-            result = bot_rag.process_query(query, use_llm_for_general=True)
+            result = await bot_rag.aprocess_query(query, use_llm_for_general=True)
             print(f"  Результат: {result.get('type')}, найдено: {result.get('results_count')}")
             if result.get('formatted_results'):
                 print(f"  Ответ: {result['formatted_results'][:100]}...")
@@ -535,23 +576,38 @@ async def test_bot():
             print(f"  Ошибка: {e}")
 
 
-if __name__ == "__main__":
+# Проверки перед запуском выполняем в том же event loop, что и polling:
+# асинхронные клиенты Qdrant и LLM привязаны к нему
+async def post_init(application):
+    await bot_rag.check_collections()
+
     # Тестируем работу бота перед запуском
     print("=== ПРЕДВАРИТЕЛЬНОЕ ТЕСТИРОВАНИЕ ===")
-
-    # Запускаем тест синхронно
-    import asyncio
-
     try:
-        asyncio.run(test_bot())
+        await test_bot()
     except Exception as e:
         print(f"⚠️ Ошибка при тестировании: {e}")
 
+
+async def post_shutdown(application):
+    print(f"📊 Кэш эмбеддингов: {bot_rag.embedding_cache.stats()}")
+    print(f"📊 Кэш ответов: {bot_rag.answer_cache.stats()}")
+    await bot_rag.close()
+
+
+if __name__ == "__main__":
     # Запуск телеграм бота с Inline-меню
     print("\n=== ЗАПУСК TELEGRAM БОТА С ИНТЕРАКТИВНЫМ МЕНЮ ===")
 
-    # Создаем приложение
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    # Создаем приложение; апдейты разных пользователей обрабатываются параллельно
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(64)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Добавляем обработчики в правильном порядке
     app.add_handler(CommandHandler("start", start))
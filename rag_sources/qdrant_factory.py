@@ -0,0 +1,190 @@
+import abc
+import asyncio
+import inspect
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Callable, Dict, Optional
+
+import httpx
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
+
+# Адрес и ключ - только из окружения; ключ не нужен локальному Qdrant без авторизации
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+QDRANT_TRANSPORT = os.getenv("QDRANT_TRANSPORT", "rest")
+
+# Таймауты отдельных операций (секунды); передаются только методам с параметром timeout
+DEFAULT_OPERATION_TIMEOUTS = {
+    "search": 10,
+    "search_batch": 15,
+    "query_points": 10,
+    "query_batch_points": 15,
+    "recommend": 10,
+    "retrieve": 10,
+    "count": 10,
+    "scroll": 30,
+}
+
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+
+@dataclass
+class QdrantClientOptions:
+    transport: str = QDRANT_TRANSPORT  # "rest" или "grpc"
+    timeout: int = 30  # общий таймаут клиента (в т.ч. upsert)
+    operation_timeouts: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_OPERATION_TIMEOUTS))
+    grpc_port: int = 6334
+    max_connections: int = 20
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    retries: int = 3
+    backoff_base: float = 0.2
+    backoff_max: float = 5.0
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Ошибки, после которых имеет смысл повторить запрос"""
+    if isinstance(error, (httpx.TransportError, ResponseHandlingException)):
+        return True
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code in RETRYABLE_STATUS_CODES
+
+    try:
+        import grpc
+    except ImportError:
+        return False
+    if isinstance(error, grpc.RpcError):
+        return error.code() in (
+            grpc.StatusCode.UNAVAILABLE,
+            grpc.StatusCode.DEADLINE_EXCEEDED,
+            grpc.StatusCode.RESOURCE_EXHAUSTED,
+        )
+    return False
+
+
+def backoff_delay(attempt: int, options: QdrantClientOptions) -> float:
+    """Экспоненциальная задержка с полным джиттером"""
+    return random.uniform(0, min(options.backoff_max, options.backoff_base * 2 ** attempt))
+
+
+def _accepts_timeout(method: Callable) -> bool:
+    try:
+        return "timeout" in inspect.signature(method).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+class _RetryingClient(abc.ABC):
+    """Обёртка над клиентом Qdrant: таймауты операций и повторы при сбоях сети"""
+
+    def __init__(self, client, options: QdrantClientOptions):
+        self._client = client
+        self._options = options
+        self._wrapped: Dict[str, Callable] = {}
+
+    @property
+    def client(self):
+        return self._client
+
+    @property
+    def options(self) -> QdrantClientOptions:
+        return self._options
+
+    def __getattr__(self, name: str):
+        wrapped = self._wrapped.get(name)
+        if wrapped is not None:
+            return wrapped
+
+        attr = getattr(self._client, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        timeout = self._options.operation_timeouts.get(name)
+        if timeout is not None and not _accepts_timeout(attr):
+            timeout = None
+
+        wrapped = self._wrap(attr, timeout)
+        self._wrapped[name] = wrapped
+        return wrapped
+
+    @abc.abstractmethod
+    def _wrap(self, method: Callable, timeout: Optional[int]) -> Callable:
+        """Обёртка метода клиента: таймаут операции и повтор временных ошибок"""
+
+
+class RetryingQdrantClient(_RetryingClient):
+    def _wrap(self, method: Callable, timeout: Optional[int]) -> Callable:
+        options = self._options
+
+        @wraps(method)
+        def call(*args, **kwargs):
+            if timeout is not None:
+                kwargs.setdefault("timeout", timeout)
+            for attempt in range(options.retries + 1):
+                try:
+                    return method(*args, **kwargs)
+                except Exception as e:
+                    if attempt == options.retries or not is_transient_error(e):
+                        raise
+                    time.sleep(backoff_delay(attempt, options))
+
+        return call
+
+
+class AsyncRetryingQdrantClient(_RetryingClient):
+    def _wrap(self, method: Callable, timeout: Optional[int]) -> Callable:
+        if not inspect.iscoroutinefunction(method):
+            return method
+        options = self._options
+
+        @wraps(method)
+        async def call(*args, **kwargs):
+            if timeout is not None:
+                kwargs.setdefault("timeout", timeout)
+            for attempt in range(options.retries + 1):
+                try:
+                    return await method(*args, **kwargs)
+                except Exception as e:
+                    if attempt == options.retries or not is_transient_error(e):
+                        raise
+                    await asyncio.sleep(backoff_delay(attempt, options))
+
+        return call
+
+
+def _client_kwargs(url: Optional[str], api_key: Optional[str], options: QdrantClientOptions) -> dict:
+    url = url or QDRANT_URL
+    if not url:
+        raise ValueError("Адрес Qdrant не задан: укажите переменную окружения QDRANT_URL")
+    if options.transport not in ("rest", "grpc"):
+        raise ValueError(f"Неизвестный транспорт Qdrant: {options.transport}")
+
+    return dict(
+        url=url,
+        api_key=api_key or QDRANT_API_KEY,
+        timeout=options.timeout,
+        prefer_grpc=options.transport == "grpc",
+        grpc_port=options.grpc_port,
+        # По умолчанию qdrant-client отключает keep-alive для REST
+        limits=httpx.Limits(
+            max_connections=options.max_connections,
+            max_keepalive_connections=options.max_keepalive_connections,
+            keepalive_expiry=options.keepalive_expiry,
+        ),
+    )
+
+
+def create_qdrant_client(url: Optional[str] = None, api_key: Optional[str] = None,
+                         options: Optional[QdrantClientOptions] = None) -> RetryingQdrantClient:
+    options = options or QdrantClientOptions()
+    return RetryingQdrantClient(QdrantClient(**_client_kwargs(url, api_key, options)), options)
+
+
+def create_async_qdrant_client(url: Optional[str] = None, api_key: Optional[str] = None,
+                               options: Optional[QdrantClientOptions] = None) -> AsyncRetryingQdrantClient:
+    options = options or QdrantClientOptions()
+    return AsyncRetryingQdrantClient(AsyncQdrantClient(**_client_kwargs(url, api_key, options)), options)
@@ -1,12 +1,34 @@
-from qdrant_client import QdrantClient, models
+from qdrant_client import models
 from qdrant_client.models import Filter, FieldCondition, MatchAny, MatchText
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any, Set, Optional
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Iterable, List, Dict, Any, Set, Optional, Tuple
+import hashlib
+import heapq
+import math
 import re
 import json
 import os
+import httpx
 import requests
 
+from rag_sources.context_builder import ContextBuilder
+from rag_sources.embedding_batcher import EmbeddingBatcher
+from rag_sources.embedding_cache import EmbeddingCache
+from rag_sources.qdrant_factory import QdrantClientOptions, create_qdrant_client
+from rag_sources.query_analyzer import QueryAnalyzer
+from rag_sources.reranker import Reranker
+from rag_sources.schedule_index import DAY_ORDER, SCHEDULE_DOC_PREFIXES, TIME_ORDER, ScheduleIndex
+from rag_sources.sparse_encoder import DENSE_VECTOR, RETRIEVAL_MODE, RETRIEVAL_MODES, SPARSE_VECTOR, SparseEncoder
+
+EMBED_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# Сколько кандидатов берёт каждая ветка (dense и BM25) перед слиянием RRF в гибридном режиме
+HYBRID_PREFETCH = int(os.getenv("HYBRID_PREFETCH", "50"))
+
+# Префиксы ответов LLMGenerator при ошибках - такие ответы не кэшируются
+LLM_ERROR_PREFIXES = ("Ошибка API", "Ошибка запроса", "Не удалось получить ответ")
+
 DOC_PREFIX = {
     "group": "groups_",
     "room": "classrooms_",
@@ -29,21 +51,207 @@ def extract_metadata(payload: dict) -> dict:
     return result
 
 
+def lessons_from_points(points, with_score: bool = False) -> List[Dict]:
+    """Превращает точки schedules_embeddings в список занятий без дублей"""
+    lessons = []
+    seen_keys = set()
+
+    for point in points:
+        payload = point.payload or {}
+        doc_id = payload.get('document_id', '')
+
+        if not doc_id.startswith(SCHEDULE_DOC_PREFIXES):
+            continue
+
+        metadata = extract_metadata(payload)
+
+        day = metadata.get("day", "")
+        time = metadata.get("time", "")
+        subject = metadata.get("subject", "")
+        week = metadata.get("week", "не указано")
+
+        key = f"{day}|{time}|{subject}|{week}"
+
+        if key not in seen_keys:
+            seen_keys.add(key)
+            lesson = {
+                "day": day,
+                "time": time,
+                "subject": subject,
+                "week": week,
+                "room": metadata.get("room", ""),
+                "teacher": metadata.get("teacher", []),
+                "groups": metadata.get("groups", []),
+            }
+            if with_score:
+                lesson["score"] = float(point.score)
+            lessons.append(lesson)
+
+    # Сортировка
+    lessons.sort(key=lambda x: (
+        DAY_ORDER.get(x["day"], 99),
+        TIME_ORDER.get(x["time"], 99),
+        -x.get("score", 0)
+    ))
+
+    return lessons
+
+
+def text_digest(text: str) -> bytes:
+    """Короткий хэш текста для дедупликации без хранения самих строк"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def merge_documents(results: Iterable[Tuple[str, list]], top_k: int) -> List[Dict]:
+    """Объединяет выдачу нескольких коллекций: без повторов текста, по убыванию score.
+
+    Точки проходят потоком через min-кучу размера top_k, в словари документов
+    превращаются только победители.
+    """
+    heap: List[Tuple[float, int, str, Any]] = []
+    seen_digests: Set[bytes] = set()
+    order = 0
+
+    for coll, points in results:
+        for item in points:
+            text = item.payload.get("text", "")
+            if not text:
+                continue
+
+            digest = text_digest(text)
+            if digest in seen_digests:
+                continue
+            seen_digests.add(digest)
+
+            # order - при равном score выигрывает ранее встреченная точка
+            entry = (float(item.score), -order, coll, item)
+            order += 1
+            if len(heap) < top_k:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+
+    merged = []
+    for score, _, coll, item in sorted(heap, key=lambda e: e[:2], reverse=True):
+        merged.append({
+            "id": item.id,
+            "score": score,
+            "text": item.payload["text"],
+            "collection": coll,
+            "metadata": {
+                k: v for k, v in item.payload.items() if k != "text"
+            },
+        })
+    return merged
+
+
 class UniversityBot:
-    def __init__(self, qdrant_url: str, api_key: str, llm_api_key: str = None):
-        embed_model = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-        print("Loading embedding model...")
-        self.model = SentenceTransformer(embed_model, device="cpu")
-        print("Model loaded")
-        self.qdrant = QdrantClient(url=qdrant_url, api_key=api_key, timeout=30, prefer_grpc=False)
-        print("Qdrant client initialized")
+    def __init__(self, qdrant_url: str, api_key: str, llm_api_key: str = None,
+                 schedule_index: Optional[ScheduleIndex] = None,
+                 batch_window_ms: Optional[float] = None,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 collection_timeout: float = 5.0,
+                 qdrant_options: Optional[QdrantClientOptions] = None,
+                 retrieval_mode: str = RETRIEVAL_MODE,
+                 reranker: Optional[Reranker] = None,
+                 context_builder: Optional[ContextBuilder] = None,
+                 model=None, qdrant=None):
+        # Общая инициализация для UniversityBot и AsyncUniversityBot; различия - в
+        # _create_qdrant, _init_executors и _check_collections
+        if model is None:
+            print("Loading embedding model...")
+            model = SentenceTransformer(EMBED_MODEL, device="cpu")
+            print("Model loaded")
+        self.model = model
+        self._init_batcher(batch_window_ms)
+        self.embedding_cache = embedding_cache
+        self.qdrant = qdrant or self._create_qdrant(qdrant_url, api_key, qdrant_options)
         self.text_collection = "text_embeddings"
         self.schedule_collection = "schedules_embeddings"
+        self._init_retrieval(retrieval_mode)
+        # Кросс-энкодер: из широкой выдачи по косинусу в LLM идут несколько лучших
+        self.reranker = reranker
+        self.context_builder = context_builder or ContextBuilder()
+
+        # Коллекции опрашиваются параллельно; медленная отбрасывается по таймауту
+        self.collection_timeout = collection_timeout
+        self._init_executors()
+
+        # Структурированный индекс расписания; без него фильтры идут через scroll в Qdrant
+        self.schedule_index = schedule_index
+        if schedule_index is not None:
+            print(f"✓ Индекс расписания: {len(schedule_index)} занятий")
+        # Группы, аудитории и фамилии в запросе сверяются со справочниками индекса
+        self.query_analyzer = QueryAnalyzer(schedule_index)
 
         # Проверяем коллекции
         self._check_collections()
 
         # Инициализация LLM для общих вопросов
+        self._init_llm(llm_api_key)
+
+    def _create_qdrant(self, qdrant_url: str, api_key: str, qdrant_options: Optional[QdrantClientOptions]):
+        qdrant = create_qdrant_client(qdrant_url, api_key, qdrant_options)
+        print(f"Qdrant client initialized ({qdrant.options.transport})")
+        return qdrant
+
+    def _init_executors(self):
+        # по потоку на коллекцию: запрос не ждёт в очереди пула, пока тикает его таймаут
+        collections = [self.text_collection, self.schedule_collection]
+        self._search_executor = ThreadPoolExecutor(max_workers=len(collections), thread_name_prefix="qdrant-search")
+
+    def _init_batcher(self, batch_window_ms: Optional[float]):
+        # Одновременные запросы кодируются одним батчем, если задано окно ожидания
+        self.batcher = None
+        if batch_window_ms is not None:
+            self.batcher = EmbeddingBatcher(self.model, max_wait_ms=batch_window_ms)
+
+    def _init_retrieval(self, retrieval_mode: str):
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Неизвестный режим поиска: {retrieval_mode}")
+        self.retrieval_mode = retrieval_mode
+        print(f"Режим поиска: {retrieval_mode}")
+
+    def _query_params(self, query: str, query_vector: List[float], limit: int) -> Dict[str, Any]:
+        """Аргументы query_points: dense-вектор или гибрид dense + BM25 со слиянием RRF за один запрос"""
+        if self.retrieval_mode != "hybrid":
+            return {"query": query_vector, "limit": limit, "with_payload": True}
+
+        prefetch_limit = max(limit, HYBRID_PREFETCH)
+        prefetch = [models.Prefetch(query=query_vector, using=DENSE_VECTOR, limit=prefetch_limit)]
+        indices, values = SparseEncoder.encode_query(query)
+        if indices:
+            prefetch.append(models.Prefetch(
+                query=models.SparseVector(indices=indices, values=values),
+                using=SPARSE_VECTOR,
+                limit=prefetch_limit,
+            ))
+        return {
+            "prefetch": prefetch,
+            "query": models.FusionQuery(fusion=models.Fusion.RRF),
+            "limit": limit,
+            "with_payload": True,
+        }
+
+    def _candidate_count(self, top_k: int) -> int:
+        return max(top_k, self.reranker.candidates) if self.reranker is not None else top_k
+
+    def _encode_query(self, query: str) -> List[float]:
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(query)
+            if cached is not None:
+                return cached.tolist()
+
+        if self.batcher is not None:
+            vector = self.batcher.encode(query)
+        else:
+            vector = self.model.encode(query, normalize_embeddings=True)
+
+        if self.embedding_cache is not None:
+            self.embedding_cache.put(query, vector)
+        return vector.tolist()
+
+    def _init_llm(self, llm_api_key: Optional[str]):
         if llm_api_key:
             self.llm = LLMGenerator(
                 provider="caila",
@@ -76,148 +284,36 @@ class UniversityBot:
     # ========== ФУНКЦИИ ДЛЯ РАСПИСАНИЯ ==========
 
     def detect_query_type(self, query: str) -> Dict[str, Any]:
-        """Определяет тип запроса: расписание или общий вопрос"""
-        original_query = query
-        query_lower = query.lower().strip()
-
-        analysis = {
-            "type": "general",
-            "is_schedule": False,
-            "groups": [],
-            "rooms": [],
-            "teachers": [],
-            "days": [],
-            "times": [],
-            "original_query": original_query,
-        }
-
-        # 1. Проверяем явные признаки расписания
-        schedule_keywords = ["расписание", "пара", "пары", "аудитория", "ауд",
-                             "лекция", "занятие", "семинар", "практика"]
-        has_schedule_kw = any(kw in query_lower for kw in schedule_keywords)
-
-        # 2. Ищем конкретные сущности расписания
-        # Группы
-        group_matches = re.findall(r'\b\d{3,4}[а-ямк]?\b', query_lower)
-        if group_matches:
-            analysis["groups"] = list(set(group_matches))
-
-        # Аудитории (номера с дефисом)
-        room_matches = re.findall(r'\b\d+-\d+\b', query)
-        if room_matches:
-            analysis["rooms"] = room_matches
-
-        # Дни недели
-        days = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота"]
-        for day in days:
-            if day in query_lower:
-                analysis["days"].append(day.capitalize())
-
-        # Пары
-        for i in range(1, 7):
-            if f"{i} пара" in query_lower or f"{i}-я пара" in query_lower:
-                analysis["times"].append(f"{i} пара")
-
-        # 3. Преподаватели
-        if has_schedule_kw or analysis["groups"] or analysis["rooms"] or analysis["days"] or analysis["times"]:
-            words = original_query.split()
-            for word in words:
-                clean_word = re.sub(r'[.,!?;:]', '', word)
-                if (len(clean_word) > 2 and
-                        clean_word[0].isupper() and
-                        not clean_word.isdigit() and
-                        clean_word.lower() not in days and
-                        clean_word.lower() not in schedule_keywords):
-                    analysis["teachers"].append(clean_word)
-
-        analysis["teachers"] = list(set(analysis["teachers"]))
-
-        # 4. Определяем тип запроса
-        has_schedule_entities = any([
-            analysis["groups"],
-            analysis["rooms"],
-            analysis["days"],
-            analysis["times"],
-            analysis["teachers"],
-        ])
-
-        if has_schedule_kw or has_schedule_entities:
-            analysis["is_schedule"] = True
-            analysis["type"] = "schedule"
-        else:
-            analysis["type"] = "general"
-
-        return analysis
+        """Определяет тип запроса: расписание или общий вопрос (см. query_analyzer)"""
+        return self.query_analyzer.analyze(query)
 
     def search_schedule_flexible(self, query: str, criteria: Dict[str, Any], limit=1000):
         """Поиск расписания"""
         # Если есть конкретные критерии - используем фильтры
         if any([criteria["groups"], criteria["rooms"], criteria["teachers"],
                 criteria["days"], criteria["times"]]):
+            if self.schedule_index is not None:
+                if self.schedule_index.sync_stale:
+                    self.schedule_index.apply_delta(self.schedule_index.fetch_deltas())
+                return self.schedule_index.search(criteria, limit)
             return self._search_schedule_with_filters(criteria, limit)
 
         # Если нет конкретных критериев, но запрос явно о расписании
-        query_vector = self.model.encode(query, normalize_embeddings=True).tolist()
+        query_vector = self._encode_query(query)
 
         try:
-            results = self.qdrant.search(
+            results = self.qdrant.query_points(
                 collection_name=self.schedule_collection,
-                query_vector=query_vector,
-                limit=limit,
-                with_payload=True,
+                **self._query_params(query, query_vector, limit),
             )
 
-            lessons = []
-            seen_keys = set()
-
-            for point in results:
-                payload = point.payload or {}
-                doc_id = payload.get('document_id', '')
-
-                if not doc_id.startswith(('groups_', 'classrooms_', 'teachers_')):
-                    continue
-
-                metadata = extract_metadata(payload)
-
-                day = metadata.get("day", "")
-                time = metadata.get("time", "")
-                subject = metadata.get("subject", "")
-                week = metadata.get("week", "не указано")
-
-                key = f"{day}|{time}|{subject}|{week}"
-
-                if key not in seen_keys:
-                    seen_keys.add(key)
-                    lessons.append({
-                        "day": day,
-                        "time": time,
-                        "subject": subject,
-                        "week": week,
-                        "room": metadata.get("room", ""),
-                        "teacher": metadata.get("teacher", []),
-                        "groups": metadata.get("groups", []),
-                        "score": float(point.score),
-                    })
-
-            # Сортировка
-            day_order = {"Понедельник": 1, "Вторник": 2, "Среда": 3,
-                         "Четверг": 4, "Пятница": 5, "Суббота": 6}
-            time_order = {"1 пара": 1, "2 пара": 2, "3 пара": 3,
-                          "4 пара": 4, "5 пара": 5, "6 пара": 6}
-
-            lessons.sort(key=lambda x: (
-                day_order.get(x["day"], 99),
-                time_order.get(x["time"], 99),
-                -x.get("score", 0)
-            ))
-
-            return lessons
+            return lessons_from_points(results.points, with_score=True)
 
         except Exception:
             return []
 
-    def _search_schedule_with_filters(self, criteria: Dict[str, Any], limit=1000):
-        """Поиск расписания с фильтрами"""
+    def _build_schedule_filter(self, criteria: Dict[str, Any]) -> Optional[Filter]:
+        """Собирает фильтр Qdrant по критериям расписания"""
         filters = []
 
         if criteria.get("groups"):
@@ -265,9 +361,15 @@ class UniversityBot:
                 )
 
         if not filters:
-            return []
+            return None
 
-        filter_ = Filter(must=filters)
+        return Filter(must=filters)
+
+    def _search_schedule_with_filters(self, criteria: Dict[str, Any], limit=1000):
+        """Поиск расписания с фильтрами через scroll в Qdrant (если индекс расписания не загружен)"""
+        filter_ = self._build_schedule_filter(criteria)
+        if filter_ is None:
+            return []
 
         try:
             all_points = []
@@ -297,47 +399,7 @@ class UniversityBot:
                 except Exception:
                     break
 
-            # Обработка результатов
-            lessons = []
-            seen_keys = set()
-
-            for point in all_points:
-                payload = point.payload or {}
-                doc_id = payload.get('document_id', '')
-
-                if not doc_id.startswith(('groups_', 'classrooms_', 'teachers_')):
-                    continue
-
-                metadata = extract_metadata(payload)
-
-                day = metadata.get("day", "")
-                time = metadata.get("time", "")
-                subject = metadata.get("subject", "")
-                week = metadata.get("week", "не указано")
-
-                key = f"{day}|{time}|{subject}|{week}"
-
-                if key not in seen_keys:
-                    seen_keys.add(key)
-                    lessons.append({
-                        "day": day,
-                        "time": time,
-                        "subject": subject,
-                        "week": week,
-                        "room": metadata.get("room", ""),
-                        "teacher": metadata.get("teacher", []),
-                        "groups": metadata.get("groups", []),
-                    })
-
-            # Сортировка
-            day_order = {"Понедельник": 1, "Вторник": 2, "Среда": 3,
-                         "Четверг": 4, "Пятница": 5, "Саббота": 6}
-            time_order = {"1 пара": 1, "2 пара": 2, "3 пара": 3,
-                          "4 пара": 4, "5 пара": 5, "6 пара": 6}
-
-            lessons.sort(key=lambda x: (day_order.get(x["day"], 99), time_order.get(x["time"], 99)))
-
-            return lessons
+            return lessons_from_points(all_points)
 
         except Exception:
             return []
@@ -398,58 +460,38 @@ class UniversityBot:
     # ========== ФУНКЦИИ ДЛЯ ОБЩИХ ВОПРОСОВ (старая работающая версия) ==========
 
     def search_documents(self, query: str, top_k: int = 10) -> List[Dict]:
-        """Поиск документов (старая работающая версия)"""
-        query_vector = self.model.encode(query, normalize_embeddings=True).tolist()
-
-        all_results = []
-        seen_texts: Set[str] = set()
+        """Поиск документов одновременно в обеих коллекциях"""
+        query_vector = self._encode_query(query)
+        params = self._query_params(query, query_vector, top_k)
+
+        # future.cancel() не останавливает уже идущий поиск - его обрывает сам Qdrant по timeout
+        futures = {
+            coll: self._search_executor.submit(
+                self.qdrant.query_points, collection_name=coll, timeout=math.ceil(self.collection_timeout), **params
+            )
+            for coll in [self.text_collection, self.schedule_collection]
+        }
+        wait(futures.values(), timeout=self.collection_timeout)
 
-        # Ищем в обеих коллекциях
-        for coll in [self.text_collection, self.schedule_collection]:
+        results = []
+        for coll, future in futures.items():
+            if not future.done():
+                future.cancel()
+                print(f"⚠ Коллекция '{coll}' не ответила за {self.collection_timeout} с, пропускаем")
+                continue
             try:
-                results = self.qdrant.search(
-                    collection_name=coll,
-                    query_vector=query_vector,
-                    limit=top_k,
-                    with_payload=True,
-                )
-
-                for item in results:
-                    text = item.payload.get("text", "")
-                    if not text or text in seen_texts:
-                        continue
-
-                    seen_texts.add(text)
-                    all_results.append({
-                        "id": item.id,
-                        "score": float(item.score),
-                        "text": text,
-                        "collection": coll,
-                        "metadata": {
-                            k: v for k, v in item.payload.items() if k != "text"
-                        },
-                    })
+                results.append((coll, future.result().points))
             except Exception as e:
                 print(f"Ошибка поиска в коллекции '{coll}': {e}")
-                continue
 
-        all_results.sort(key=lambda x: x["score"], reverse=True)
-        return all_results[:top_k]
+        return merge_documents(results, top_k)
 
     def build_context(self, documents: List[Dict]) -> str:
-        """Строит контекст из документов (старая работающая версия)"""
-        context_parts = []
-
-        for i, doc in enumerate(documents):
-            clean_text = re.sub(r"<\[document\]>|\[document\]>", "", doc["text"])
-            clean_text = re.sub(r"\s+", " ", clean_text).strip()
-
-            context_parts.append(
-                f"[Документ {i + 1} | коллекция: {doc['collection']} | "
-                f"релевантность: {doc['score']:.3f}]\n{clean_text}\n"
-            )
-
-        return "\n".join(context_parts)
+        """Контекст для LLM в пределах бюджета токенов (см. context_builder)"""
+        context, stats = self.context_builder.build(documents)
+        if stats.dropped:
+            print(f"⚠ Контекст {stats.tokens} токенов, не влезло фрагментов: {stats.dropped}")
+        return context
 
     # ========== ОСНОВНОЙ МЕТОД ОБРАБОТКИ ==========
 
@@ -461,66 +503,74 @@ class UniversityBot:
         # ОБРАБОТКА ЗАПРОСОВ РАСПИСАНИЯ
         if analysis["type"] == "schedule":
             lessons = self.search_schedule_flexible(query, analysis, limit=300)
-            formatted_results = self.format_schedule_from_lessons(lessons)
+            return self._schedule_response(query, lessons)
+
+        # ОБРАБОТКА ОБЩИХ ВОПРОСОВ (старая логика)
+        # Используем старый подход из UniversityRAGBot
+        docs = self.search_documents(query, top_k=self._candidate_count(8))
+        if self.reranker is not None:
+            docs = self.reranker.rerank(query, docs)
 
-            if lessons:
-                message = f"Найдено {len(lessons)} занятий"
-            else:
-                message = "Расписание по вашему запросу не найдено"
+        # Если есть LLM и разрешено его использование
+        llm_answer = None
+        if docs and use_llm_for_general and self.has_llm:
+            context = self.build_context(docs)
+            llm_answer = self.llm.generate_answer(query, context)
 
+        return self._general_response(query, docs, llm_answer)
+
+    def _schedule_response(self, query: str, lessons: List[Dict]) -> Dict[str, Any]:
+        formatted_results = self.format_schedule_from_lessons(lessons)
+
+        if lessons:
+            message = f"Найдено {len(lessons)} занятий"
+        else:
+            message = "Расписание по вашему запросу не найдено"
+
+        return {
+            "query": query,
+            "type": "schedule",
+            "results_count": len(lessons),
+            "formatted_results": formatted_results,
+            "message": message,
+        }
+
+    def _general_response(self, query: str, docs: List[Dict], llm_answer: Optional[str] = None) -> Dict[str, Any]:
+        if not docs:
             return {
                 "query": query,
-                "type": "schedule",
-                "results_count": len(lessons),
-                "formatted_results": formatted_results,
-                "message": message,
+                "type": "general",
+                "results_count": 0,
+                "formatted_results": "Информация по вашему запросу не найдена.",
+                "message": "Ничего не найдено",
             }
 
-        # ОБРАБОТКА ОБЩИХ ВОПРОСОВ (старая логика)
-        else:
-            # Используем старый подход из UniversityRAGBot
-            docs = self.search_documents(query, top_k=8)
-
-            if not docs:
-                return {
-                    "query": query,
-                    "type": "general",
-                    "results_count": 0,
-                    "formatted_results": "Информация по вашему запросу не найдена.",
-                    "message": "Ничего не найдено",
-                }
-
-            # Если есть LLM и разрешено его использование
-            if use_llm_for_general and self.has_llm:
-                context = self.build_context(docs)
-                llm_answer = self.llm.generate_answer(query, context)
-
-                return {
-                    "query": query,
-                    "type": "general_llm",
-                    "results_count": len(docs),
-                    "formatted_results": f"🤖 {llm_answer}\n\n📚 Использовано источников: {len(docs)}",
-                    "message": f"Ответ сгенерирован на основе {len(docs)} документов",
-                }
-
-            # Без LLM - просто показываем найденные документы
-            else:
-                output = ["📚 **Найдена информация:**", "=" * 60]
-                for i, doc in enumerate(docs[:5], 1):
-                    text = doc["text"]
-                    preview = text[:300] + "..." if len(text) > 300 else text
-                    output.append(f"\n{i}. [релевантность: {doc['score']:.3f}]")
-                    output.append(f"   {preview}")
-
-                formatted_response = "\n".join(output)
-
-                return {
-                    "query": query,
-                    "type": "general",
-                    "results_count": len(docs),
-                    "formatted_results": formatted_response,
-                    "message": f"Найдено {len(docs)} документов",
-                }
+        if llm_answer is not None:
+            return {
+                "query": query,
+                "type": "general_llm",
+                "results_count": len(docs),
+                "formatted_results": f"🤖 {llm_answer}\n\n📚 Использовано источников: {len(docs)}",
+                "message": f"Ответ сгенерирован на основе {len(docs)} документов",
+            }
+
+        # Без LLM - просто показываем найденные документы
+        output = ["📚 **Найдена информация:**", "=" * 60]
+        for i, doc in enumerate(docs[:5], 1):
+            text = doc["text"]
+            preview = text[:300] + "..." if len(text) > 300 else text
+            output.append(f"\n{i}. [релевантность: {doc['score']:.3f}]")
+            output.append(f"   {preview}")
+
+        formatted_response = "\n".join(output)
+
+        return {
+            "query": query,
+            "type": "general",
+            "results_count": len(docs),
+            "formatted_results": formatted_response,
+            "message": f"Найдено {len(docs)} документов",
+        }
 
 
 class LLMGenerator:
@@ -530,6 +580,8 @@ class LLMGenerator:
             api_key: Optional[str] = None,
             model: str = "gpt-4o-mini",
             temperature: float = 0.1,
+            max_connections: int = 20,
+            async_client: Optional[httpx.AsyncClient] = None,
     ):
         if provider != "caila":
             raise ValueError(f"Неизвестный провайдер: {provider}")
@@ -549,7 +601,11 @@ class LLMGenerator:
             f"{self.author}/model/{self.service}/predict-with-config"
         )
 
-    def generate_answer(self, question: str, context: str) -> str:
+        # Общий пул соединений для асинхронных запросов (keep-alive между вопросами)
+        self.max_connections = max_connections
+        self._async_client = async_client
+
+    def _build_request(self, question: str, context: str) -> Tuple[Dict[str, str], bytes]:
         """Старый работающий промпт из UniversityRAGBot"""
         prompt = f"""
 Ты — помощник университетского бота.
@@ -592,8 +648,26 @@ class LLMGenerator:
             },
         }
 
+        return headers, json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+    @staticmethod
+    def _parse_response(status_code: int, text: str, data_loader) -> str:
+        if status_code != 200:
+            return f"Ошибка API {status_code}: {text}"
+
+        data = data_loader()
+
+        if "choices" in data:
+            return data["choices"][0]["message"]["content"]
+
+        if "data" in data and "choices" in data["data"]:
+            return data["data"]["choices"][0]["message"]["content"]
+
+        return f"Не удалось получить ответ от ИИ"
+
+    def generate_answer(self, question: str, context: str) -> str:
         try:
-            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            headers, body = self._build_request(question, context)
 
             response = requests.post(
                 self.base_url,
@@ -606,18 +680,35 @@ class LLMGenerator:
                 },
             )
 
-            if response.status_code != 200:
-                return f"Ошибка API {response.status_code}: {response.text}"
+            return self._parse_response(response.status_code, response.text, response.json)
 
-            data = response.json()
-
-            if "choices" in data:
-                return data["choices"][0]["message"]["content"]
+        except Exception as e:
+            return f"Ошибка запроса: {repr(e)}"
 
-            if "data" in data and "choices" in data["data"]:
-                return data["data"]["choices"][0]["message"]["content"]
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=60,
+                trust_env=False,  # как proxies=None у requests
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._async_client
 
-            return f"Не удалось получить ответ от ИИ"
+    async def agenerate_answer(self, question: str, context: str) -> str:
+        """Асинхронная генерация ответа через общий httpx.AsyncClient"""
+        try:
+            headers, body = self._build_request(question, context)
+            response = await self.async_client.post(self.base_url, headers=headers, content=body)
+            return self._parse_response(response.status_code, response.text, response.json)
 
         except Exception as e:
-            return f"Ошибка запроса: {repr(e)}"
\ No newline at end of file
+            return f"Ошибка запроса: {repr(e)}"
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
@@ -0,0 +1,245 @@
+"""Разбор запроса к боту: расписание или общий вопрос, и сущности расписания.
+
+Запрос проходит один раз одним скомпилированным регулярным выражением: ключевые слова,
+дни (в любом падеже, "сегодня"/"завтра"), пары ("2 пара", "вторая пара", "1-2 пары"), номера и слова.
+Номера и слова сверяются со справочниками из ScheduleIndex - реальными группами, аудиториями
+и фамилиями преподавателей. Справочники - это сами постинги индекса, поэтому дельты
+расписания видны сразу. Без индекса работают только шаблоны, с меньшей уверенностью.
+
+У каждой сущности есть уверенность; в критерии поиска попадают сущности не ниже
+ENTITY_MIN_CONFIDENCE.
+"""
+import re
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from rag_sources.schedule_index import ScheduleIndex, normalize_group, room_keys
+from rag_sources.sparse_encoder import STOPWORDS
+
+# Порог уверенности для критериев поиска и признака "расписание"
+ENTITY_MIN_CONFIDENCE = 0.5
+
+WEEKDAYS = ("Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье")
+DAY_STEMS = {"понедельник": 0, "вторник": 1, "сред": 2, "четверг": 3, "пятниц": 4, "суббот": 5, "воскресень": 6}
+RELATIVE_DAYS = {"сегодня": 0, "завтра": 1, "послезавтра": 2}
+PAIR_WORDS = {"перв": 1, "втор": 2, "трет": 3, "четверт": 4, "пят": 5, "шест": 6, "седьм": 7, "восьм": 8}
+
+# Ключевые слова: (уверенность, что за ними ждём)
+KEYWORDS = {
+    "расписани": (0.9, None),
+    "пар": (0.9, None),
+    "аудитори": (0.9, "room"),
+    "ауд": (0.9, "room"),
+    "групп": (0.3, "group"),
+    "преподавател": (0.3, "teacher"),
+    "препод": (0.3, "teacher"),
+    # "практику пройти" и "лекции по праву" - чаще общие вопросы
+    "лекци": (0.4, None),
+    "заняти": (0.4, None),
+    "семинар": (0.4, None),
+    "практик": (0.4, None),
+}
+# Окончания фамилий в косвенных падежах: "у Иванова" -> "иванов", "у Петровой" -> "петрова"
+SURNAME_ENDINGS = ("ой", "ым", "ом", "ую", "а", "у", "е")
+
+# Порядок важен: "пятница" - день, а не "пятая" пара; "1-2 пары" - пары, а не аудитория;
+# "52-17" - аудитория, а не код
+_QUERY_RE = re.compile(
+    r"(?P<day>(?P<day_stem>понедельник|вторник|сред(?=[аеуы]\b|ой\b)|четверг|пятниц|суббот|воскресень)[а-яё]*"
+    r"|(?P<relative>послезавтра|завтра|сегодня)\b)"
+    r"|(?P<pair_range>(?P<range_from>[1-8])\s*[-–]\s*(?P<range_to>[1-8])(?:\s*-?\s*(?:я|ая|ой|ую|й))?\s+пар[аыуеой]*\b)"
+    r"|(?P<pair>(?:(?P<pair_num>[1-8])(?:\s*-?\s*(?:я|ая|ой|ую|й))?"
+    r"|(?P<pair_word>перв|втор|трет|четв[её]рт|пят|шест|седьм|восьм)[а-яё]*)\s+пар[аыуеой]*\b)"
+    r"|(?P<keyword>(?P<kw_stem>расписани|аудитори|групп|преподавател|препод|лекци|заняти|семинар|практик)[а-яё]*"
+    r"|(?P<kw_short>пар[аыуеой]?|ауд)\b\.?)"
+    r"|(?P<room>\d+[а-яё]?[-–]\d+[а-яё]?)\b"
+    r"|(?P<code>[a-zа-яё]*-?\d[\w-]*)"
+    r"|(?P<word>[a-zа-яё]+(?:-[a-zа-яё]+)*)"
+)
+# Код группы: 4318, м412, пм-101, 4136к
+_GROUP_PATTERN_RE = re.compile(r"(?:[a-zа-яё]{1,3}-?)?\d{3,4}[a-zа-яё]?")
+
+
+@dataclass
+class Entity:
+    kind: str  # keyword / group / room / teacher / day / time
+    value: str
+    text: str
+    confidence: float
+    start: int = 0
+    end: int = 0
+
+
+class QueryAnalyzer:
+    def __init__(self, schedule_index: Optional[ScheduleIndex] = None,
+                 min_confidence: float = ENTITY_MIN_CONFIDENCE):
+        self.schedule_index = schedule_index
+        self.min_confidence = min_confidence
+
+    # ========== СПРАВОЧНИКИ ==========
+
+    def _known_group(self, code: str) -> bool:
+        return self.schedule_index is not None and normalize_group(code) in self.schedule_index.by_group
+
+    def _known_room(self, text: str) -> bool:
+        return self.schedule_index is not None and any(
+            key in self.schedule_index.by_room for key in room_keys(text))
+
+    def _known_surname(self, word: str) -> Optional[str]:
+        """Фамилия из справочника для слова (с учётом падежных окончаний)"""
+        if self.schedule_index is None:
+            return None
+        teachers = self.schedule_index.by_teacher
+        word = word.replace("ё", "е")
+        if word in teachers:
+            return word
+        for ending in SURNAME_ENDINGS:
+            if not word.endswith(ending) or len(word) - len(ending) < 3:
+                continue
+            stem = word[:-len(ending)]
+            for surname in (stem, stem + "а"):
+                if surname in teachers:
+                    return surname
+        return None
+
+    # ========== РАЗБОР ==========
+
+    def _number(self, code: str, text: str, expect: Optional[str]) -> Optional[Entity]:
+        if expect == "room" and self._known_room(code):
+            return Entity("room", text, text, 0.95)
+        if self._known_group(code):
+            return Entity("group", normalize_group(code), text, 0.95)
+        if self._known_room(code):
+            return Entity("room", text, text, 0.7)
+        if _GROUP_PATTERN_RE.fullmatch(code) or expect == "group":
+            if expect == "group":
+                confidence = 0.8
+            else:
+                # номер, которого нет в расписании - скорее год или сумма
+                confidence = 0.6 if self.schedule_index is None else 0.35
+            return Entity("group", normalize_group(code), text, confidence)
+        return None
+
+    def _word(self, word: str, text: str, expect: Optional[str], first: bool) -> Optional[Entity]:
+        surname = self._known_surname(word)
+        if surname is not None:
+            return Entity("teacher", surname.capitalize(), text, 0.9 if surname == word else 0.75)
+        if expect == "teacher":
+            return Entity("teacher", text.capitalize(), text, 0.7)
+        if self.schedule_index is None and text[0].isupper():
+            # без справочника - как раньше: слово с заглавной буквы; первое слово предложения - вряд ли
+            return Entity("teacher", text, text, 0.3 if first else 0.55)
+        return None
+
+    @staticmethod
+    def _day(match, text: str, today: date) -> Entity:
+        if match.group("relative"):
+            weekday = (today.weekday() + RELATIVE_DAYS[match.group("relative")]) % 7
+        else:
+            weekday = DAY_STEMS[match.group("day_stem")]
+        return Entity("day", WEEKDAYS[weekday], text, 0.95)
+
+    @staticmethod
+    def _pair(match, text: str) -> Entity:
+        if match.group("pair_num"):
+            number = int(match.group("pair_num"))
+        else:
+            number = PAIR_WORDS[match.group("pair_word").replace("ё", "е")]
+        return Entity("time", f"{number} пара", text, 0.95)
+
+    @staticmethod
+    def _pair_range(match, text: str) -> List[Entity]:
+        """"1-2 пары" - каждая пара диапазона"""
+        first, last = sorted((int(match.group("range_from")), int(match.group("range_to"))))
+        return [Entity("time", f"{number} пара", text, 0.95) for number in range(first, last + 1)]
+
+    def entities(self, query: str, today: Optional[date] = None) -> List[Entity]:
+        """Все сущности запроса за один проход"""
+        today = today or date.today()
+        # регулярка без IGNORECASE по запросу в нижнем регистре заметно быстрее;
+        # исходный регистр нужен для текста сущностей и заглавных букв фамилий
+        lowered = query.lower()
+        if len(lowered) != len(query):
+            query = lowered
+        found = []
+        expect = None
+        for match in _QUERY_RE.finditer(lowered):
+            kind = match.lastgroup
+            start, end = match.span()
+            text = query[start:end]
+            if kind == "day":
+                entity = self._day(match, text, today)
+            elif kind == "pair":
+                entity = self._pair(match, text)
+            elif kind == "pair_range":
+                for entity in self._pair_range(match, text):
+                    entity.start, entity.end = start, end
+                    found.append(entity)
+                expect = None
+                continue
+            elif kind == "keyword":
+                stem = match.group("kw_stem") or match.group("kw_short").rstrip(".")
+                stem = "пар" if stem.startswith("пар") else stem
+                confidence, expect = KEYWORDS[stem]
+                found.append(Entity("keyword", stem, text, confidence, start, end))
+                continue
+            elif kind == "room":
+                if self._known_room(match.group(0)):
+                    confidence = 0.95
+                elif expect == "room":
+                    confidence = 0.8
+                else:
+                    # со справочником неизвестный "N-M" - скорее годы ("2024-2025") или диапазон
+                    confidence = 0.75 if self.schedule_index is None else 0.35
+                entity = Entity("room", text, text, confidence)
+            elif kind == "code":
+                entity = self._number(match.group(0), text, expect)
+            else:
+                word = match.group(0)
+                if len(word) < 3 or word in STOPWORDS:
+                    continue
+                entity = self._word(word, text, expect, first=start == 0)
+
+            # ожидание держится, пока идут сущности нужного типа ("группы 4318, 4319");
+            # преподаватель один - дальше имя и отчество
+            if entity is None or entity.kind != expect or expect == "teacher":
+                expect = None
+            if entity is not None:
+                entity.start, entity.end = start, end
+                found.append(entity)
+        return found
+
+    def analyze(self, query: str, today: Optional[date] = None) -> Dict[str, Any]:
+        """Тип запроса и критерии в формате detect_query_type"""
+        entities = self.entities(query, today)
+
+        # фамилия без других признаков расписания - скорее обычное слово ("Как получить Мороз?")
+        context = any(e.confidence >= self.min_confidence for e in entities if e.kind != "teacher")
+        if not context:
+            for entity in entities:
+                if entity.kind == "teacher":
+                    entity.confidence /= 2
+
+        analysis = {
+            "type": "general",
+            "is_schedule": False,
+            "groups": [],
+            "rooms": [],
+            "teachers": [],
+            "days": [],
+            "times": [],
+            "original_query": query,
+            "entities": entities,
+        }
+        fields = {"group": "groups", "room": "rooms", "teacher": "teachers", "day": "days", "time": "times"}
+        for entity in entities:
+            if entity.confidence < self.min_confidence:
+                continue
+            if entity.kind != "keyword" and entity.value not in analysis[fields[entity.kind]]:
+                analysis[fields[entity.kind]].append(entity.value)
+            analysis["is_schedule"] = True
+
+        if analysis["is_schedule"]:
+            analysis["type"] = "schedule"
+        return analysis
@@ -0,0 +1,152 @@
+"""Переранжирование кандидатов кросс-энкодером перед LLM.
+
+Косинус MiniLM берёт из коллекций top-N (RERANK_CANDIDATES), кросс-энкодер оценивает пары
+(запрос, текст) батчами на CPU, в промпт идут только RERANK_TOP_K лучших. У запроса жёсткий
+бюджет времени: дедлайн ставит вызывающий код до постановки задачи в очередь пула, так что
+ожидание свободного потока тоже съедает бюджет. По средней цене одного документа заранее
+видно, сколько кандидатов успеем оценить; пока цена неизвестна, первым идёт маленький
+пробный батч. Не успеваем оценить хотя бы RERANK_TOP_K - остаётся порядок по косинусу.
+Оценки кэшируются по (хэш запроса, документ): кнопки меню шлют одни и те же вопросы.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from rag_sources.embedding_cache import normalize_query
+
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+# Сколько кандидатов берём из Qdrant и сколько лучших отдаём в LLM
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "4"))
+RERANK_BATCH = int(os.getenv("RERANK_BATCH", "16"))
+# Батч до первой оценки цены документа: модель ещё не измерена, рискуем немногим
+RERANK_PROBE_BATCH = int(os.getenv("RERANK_PROBE_BATCH", "4"))
+# Бюджет на переранжирование одного запроса (мс)
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+# Длина пары в токенах: длинные чанки обрезаются, цена батча предсказуема
+RERANK_MAX_LENGTH = 256
+
+
+def query_hash(query: str) -> bytes:
+    return hashlib.blake2b(normalize_query(query).encode("utf-8"), digest_size=16).digest()
+
+
+def doc_key(doc: Dict) -> Tuple:
+    # текст в ключе: чанк с тем же ID, но новым текстом после пересборки оценивается заново
+    text_hash = hashlib.blake2b(doc["text"].encode("utf-8"), digest_size=8).digest()
+    return doc.get("collection"), str(doc["id"]), text_hash
+
+
+class Reranker:
+    def __init__(self, model=None, model_name: str = RERANK_MODEL,
+                 candidates: int = RERANK_CANDIDATES, top_k: int = RERANK_TOP_K,
+                 batch_size: int = RERANK_BATCH, budget_ms: float = RERANK_BUDGET_MS,
+                 cache_size: int = RERANK_CACHE_SIZE, probe_batch: int = RERANK_PROBE_BATCH):
+        if model is None:
+            from sentence_transformers import CrossEncoder
+            print("Loading rerank model...")
+            model = CrossEncoder(model_name, device="cpu", max_length=RERANK_MAX_LENGTH)
+            print("Rerank model loaded")
+        self.model = model
+        self.candidates = candidates
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.probe_batch = probe_batch
+        self.budget_ms = budget_ms
+
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Скользящая оценка цены одного документа (мс); до первого батча не знаем - пробуем
+        self.doc_cost_ms: Optional[float] = None
+
+        self.reranked = 0
+        self.skipped = 0
+        self.cache_hits = 0
+
+    # ========== КЭШ ==========
+
+    def _cached(self, keys: List[Tuple]) -> Dict[Tuple, float]:
+        with self._lock:
+            found = {}
+            for key in keys:
+                score = self._cache.get(key)
+                if score is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = score
+            self.cache_hits += len(found)
+            return found
+
+    def _store(self, scores: Dict[Tuple, float]):
+        with self._lock:
+            for key, score in scores.items():
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ========== ОЦЕНКА ==========
+
+    def _update_cost(self, elapsed_ms: float, count: int):
+        cost = elapsed_ms / count
+        self.doc_cost_ms = cost if self.doc_cost_ms is None else 0.8 * self.doc_cost_ms + 0.2 * cost
+
+    def _affordable(self, remaining_ms: float) -> int:
+        if remaining_ms <= 0:
+            return 0
+        if self.doc_cost_ms is None:
+            return self.probe_batch
+        return int(remaining_ms / self.doc_cost_ms)
+
+    def deadline(self) -> float:
+        """Момент (time.perf_counter), к которому переранжирование должно закончиться"""
+        return time.perf_counter() + self.budget_ms / 1000
+
+    def rerank(self, query: str, docs: List[Dict], top_k: Optional[int] = None,
+               deadline: Optional[float] = None) -> List[Dict]:
+        """Лучшие top_k документов по кросс-энкодеру; docs - в порядке косинуса.
+
+        deadline - из self.deadline(), взятый до постановки в очередь пула; без него бюджет
+        отсчитывается от начала вызова.
+        """
+        top_k = top_k or self.top_k
+        if len(docs) <= 1:
+            return docs[:top_k]
+
+        deadline = deadline or self.deadline()
+        qhash = query_hash(query)
+        keys = [(qhash,) + doc_key(doc) for doc in docs]
+        scores = self._cached(keys)
+
+        # кандидаты без оценки - по порядку косинуса, пока укладываемся в бюджет
+        missing = [i for i, key in enumerate(keys) if key not in scores]
+        fresh = {}
+        while missing:
+            remaining_ms = (deadline - time.perf_counter()) * 1000
+            count = min(self.batch_size, len(missing), self._affordable(remaining_ms))
+            if count <= 0:
+                break
+            batch, missing = missing[:count], missing[count:]
+            batch_started = time.perf_counter()
+            values = self.model.predict([(query, docs[i]["text"]) for i in batch], batch_size=count,
+                                        show_progress_bar=False)
+            self._update_cost((time.perf_counter() - batch_started) * 1000, count)
+            fresh.update((keys[i], float(v)) for i, v in zip(batch, values, strict=True))
+
+        self._store(fresh)
+        scores.update(fresh)
+
+        # оценённые - это префикс выдачи по косинусу (плюс кэш), переранжировать можно только их
+        scored = [i for i, key in enumerate(keys) if key in scores]
+        if len(scored) < min(top_k, len(docs)):
+            self.skipped += 1
+            print(f"⚠ Переранжирование не уложилось в {self.budget_ms:.0f} мс, порядок по косинусу")
+            return docs[:top_k]
+
+        self.reranked += 1
+        best = sorted(scored, key=lambda i: scores[keys[i]], reverse=True)[:top_k]
+        return [dict(docs[i], rerank_score=scores[keys[i]]) for i in best]
@@ -0,0 +1,178 @@
+"""Применение дельт расписания от паука guap_rasp без полной пересборки.
+
+Паук публикует schedules/delta/v<версия> (added / removed / modified) и манифест с текущей версией.
+Стадия берёт все дельты новее уже применённой и:
+
+- удаляет из коллекции расписания точки прежних версий занятий и загружает новые
+  (эмбеддинги считаются только для них);
+- пересобирает tmp_chunks_for_embeddings/schedules_chunks из таблицы занятий - без эмбеддингов, это быстро;
+- записывает применённую версию: по ней ScheduleIndex в ботах догружает те же дельты в память.
+
+Повторное применение дельт безопасно (ID точек зависят только от текста занятия), поэтому
+без сохранённой версии дельты просто проигрываются с первой.
+
+    cd rag_sources && python schedule_delta.py
+    python schedule_delta.py --mark-applied   # после полной пересборки: текущая версия уже в Qdrant
+"""
+import argparse
+import json
+from datetime import datetime, timezone
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from answer_cache import publish_collection_version
+from chunk_io import find_chunk_object, read_chunks, write_chunks
+from embedding_artifact import payload_metadata, with_payload_hash
+from loguru import logger
+from making_embeddings import (
+    BATCH_SIZE,
+    BUCKET_TARGET,
+    DEVICE,
+    EMBED_BACKEND,
+    MODEL_NAME,
+    SCHEDULES_CHUNKS_OBJECT,
+    build_text,
+)
+from minio_client import get_minio_client
+from qdrant_client.models import PointIdsList, PointStruct, SparseVector
+from qdrant_factory import QdrantClientOptions, create_qdrant_client
+from schedule_index import DELTA_BUCKET, DELTA_PREFIX, DELTA_STATE_OBJECT, read_delta_version
+from sparse_encoder import DENSE_VECTOR, RETRIEVAL_MODE, SPARSE_VECTOR, SparseEncoder, tokenize
+from txt_to_chunks import iter_lesson_chunks, lesson_chunk
+
+SCHEDULE_MANIFEST_OBJECT = "schedules/manifest.json"
+SCHEDULE_COLLECTION = "schedules_embeddings"
+UPSERT_BATCH = 256
+
+
+def read_manifest(client) -> Dict:
+    try:
+        response = client.get_object(DELTA_BUCKET, SCHEDULE_MANIFEST_OBJECT)
+    except Exception:
+        return {}
+    try:
+        return json.loads(response.read())
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def save_state(client, version: int):
+    data = json.dumps({"version": version, "applied_at": datetime.now(timezone.utc).isoformat()}).encode("utf-8")
+    client.put_object(BUCKET_TARGET, DELTA_STATE_OBJECT, BytesIO(data), length=len(data),
+                      content_type="application/json")
+
+
+def read_deltas(client, start: int, end: int) -> Iterable[Dict]:
+    """Записи дельт версий start..end по порядку"""
+    for version in range(start, end + 1):
+        base = f"{DELTA_PREFIX}{version:06d}"
+        if find_chunk_object(client, DELTA_BUCKET, base) is None:
+            raise FileNotFoundError(f"{DELTA_BUCKET}/{base}: дельты нет, нужна полная пересборка расписания")
+        yield from read_chunks(client, DELTA_BUCKET, base)
+
+
+def net_changes(records: Iterable[Dict]) -> Tuple[Dict[str, Dict], Set[str]]:
+    """Итог нескольких дельт: {chunk_uid: чанк} для загрузки и chunk_uid для удаления"""
+    upserts: Dict[str, Dict] = {}
+    deletes: Set[str] = set()
+    for record in records:
+        if record.get("previous"):
+            uid = lesson_chunk(0, record["previous"])["chunk_uid"]
+            upserts.pop(uid, None)
+            deletes.add(uid)
+        if record.get("lesson"):
+            chunk = lesson_chunk(0, record["lesson"])
+            deletes.discard(chunk["chunk_uid"])
+            upserts[chunk["chunk_uid"]] = chunk
+    return upserts, deletes
+
+
+def to_points(chunks: List[Dict], texts: List[str], vectors,
+              sparse_encoder: Optional[SparseEncoder] = None) -> List[PointStruct]:
+    """Точки коллекции расписания. С sparse_encoder (RETRIEVAL_MODE=hybrid) - именованные
+    векторы dense + bm25, как у коллекций, которые создаёт parser/qdrnt.py"""
+    points = []
+    for chunk, text, vector in zip(chunks, texts, vectors, strict=True):
+        point_vector = vector.tolist()
+        if sparse_encoder is not None:
+            indices, values = sparse_encoder.encode_document(text)
+            point_vector = {DENSE_VECTOR: point_vector, SPARSE_VECTOR: SparseVector(indices=indices, values=values)}
+        # payload (и его хэш) как в артефакте making_embeddings, ID точки - chunk_uid;
+        # иначе следующая полная синхронизация сочтёт точки изменившимися
+        points.append(PointStruct(id=chunk["chunk_uid"], vector=point_vector, payload=with_payload_hash({
+            "text": text,
+            "type": chunk.get("type"),
+            "document_id": chunk.get("document_id"),
+            "source_url": chunk.get("source_url"),
+            "metadata": payload_metadata(chunk),
+        })))
+    return points
+
+
+def embed_points(chunks: List[Dict], sparse_encoder: Optional[SparseEncoder] = None) -> List[PointStruct]:
+    from embedding_engine import EmbeddingEngine
+
+    engine = EmbeddingEngine(MODEL_NAME, backend=EMBED_BACKEND, batch_size=BATCH_SIZE, device=DEVICE)
+    try:
+        texts = [build_text(chunk) for chunk in chunks]
+        vectors = engine.encode(texts)
+    finally:
+        engine.close()
+    return to_points(chunks, texts, vectors, sparse_encoder)
+
+
+def schedule_sparse_encoder(client) -> SparseEncoder:
+    """BM25 с той же средней длиной документа, что и при полной сборке (по всей таблице занятий)"""
+    total = count = 0
+    for chunk in iter_lesson_chunks(client):
+        total += len(tokenize(build_text(chunk)))
+        count += 1
+    return SparseEncoder(avgdl=total / max(count, 1))
+
+
+def apply_to_qdrant(upserts: Dict[str, Dict], deletes: Set[str], sparse_encoder: Optional[SparseEncoder] = None):
+    qdrant = create_qdrant_client(options=QdrantClientOptions(timeout=120))
+    deletes = list(deletes)
+    for i in range(0, len(deletes), 1000):
+        qdrant.delete(collection_name=SCHEDULE_COLLECTION,
+                      points_selector=PointIdsList(points=deletes[i:i + 1000]), wait=True)
+
+    points = embed_points(list(upserts.values()), sparse_encoder) if upserts else []
+    for i in range(0, len(points), UPSERT_BATCH):
+        qdrant.upsert(collection_name=SCHEDULE_COLLECTION, points=points[i:i + UPSERT_BATCH], wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mark-applied", action="store_true",
+                        help="только записать текущую версию как применённую (после полной пересборки)")
+    args = parser.parse_args()
+
+    client = get_minio_client()
+    target = read_manifest(client).get("version", 0)
+    applied = read_delta_version(client, BUCKET_TARGET)
+
+    if args.mark_applied:
+        save_state(client, target)
+        logger.success(f"Версия расписания v{target} отмечена как применённая")
+        return
+    if applied >= target:
+        logger.info(f"Расписание актуально (v{applied})")
+        return
+
+    upserts, deletes = net_changes(read_deltas(client, applied + 1, target))
+    logger.info(f"Дельты v{applied + 1}..v{target}: загрузить {len(upserts)}, удалить {len(deletes)}")
+    sparse_encoder = schedule_sparse_encoder(client) if RETRIEVAL_MODE == "hybrid" and upserts else None
+    apply_to_qdrant(upserts, deletes, sparse_encoder)
+
+    # чанки для ScheduleIndex и следующей полной сборки эмбеддингов - из новой таблицы
+    write_chunks(client, BUCKET_TARGET, SCHEDULES_CHUNKS_OBJECT, iter_lesson_chunks(client))
+    save_state(client, target)
+    # закэшированные ответы LLM по старому расписанию больше не годятся
+    publish_collection_version(client, BUCKET_TARGET)
+    logger.success(f"Расписание обновлено до v{target}")
+
+
+if __name__ == "__main__":
+    main()
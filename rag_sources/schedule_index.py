@@ -0,0 +1,284 @@
+import json
+import re
+import sys
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# Откуда берём чанки расписания (результат txt_to_chunks.py)
+SCHEDULE_BUCKET = "rag-sources"
+SCHEDULE_CHUNKS_OBJECT = "tmp_chunks_for_embeddings/schedules_chunks"
+# Дельты расписания от паука guap_rasp и версия, до которой их применил schedule_delta.py
+DELTA_BUCKET = "web-crawler"
+DELTA_PREFIX = "schedules/delta/v"
+DELTA_STATE_OBJECT = "tmp_chunks_for_embeddings/schedule_delta_state.json"
+
+# Источники занятий: сводная таблица паука (lessons) и старые txt-файлы
+# (кафедры не берём, как и в поиске по Qdrant)
+SCHEDULE_DOC_PREFIXES = ("lessons", "groups_", "classrooms_", "teachers_")
+
+DAY_ORDER = {"Понедельник": 1, "Вторник": 2, "Среда": 3,
+             "Четверг": 4, "Пятница": 5, "Суббота": 6, "Воскресенье": 7}
+TIME_ORDER = {"1 пара": 1, "2 пара": 2, "3 пара": 3,
+              "4 пара": 4, "5 пара": 5, "6 пара": 6}
+
+_ROOM_PREFIX_RE = re.compile(r"^(ауд\.?|аудитория|ауд)\s*")
+_ROOM_TOKEN_RE = re.compile(r"[0-9а-яёa-z]+(?:[-–][0-9а-яёa-z]+)*")
+_SURNAME_RE = re.compile(r"[а-яёa-z]+(?:-[а-яёa-z]+)*")
+_PUNCT_RE = re.compile(r"[.,!?;:]")
+
+
+def read_delta_version(client, bucket: str = SCHEDULE_BUCKET) -> int:
+    """До какой версии дельты расписания применены (0 - не применялись)"""
+    try:
+        response = client.get_object(bucket, DELTA_STATE_OBJECT)
+    except Exception:
+        return 0
+    try:
+        return json.loads(response.read()).get("version", 0)
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def normalize_group(group: str) -> str:
+    return group.strip(",. ").lower()
+
+
+def room_keys(room: str) -> Set[str]:
+    """Ключи аудитории: номера вида 52-17 в исходном виде и без дефиса"""
+    value = _ROOM_PREFIX_RE.sub("", room.lower().strip())
+    keys = set()
+    for token in _ROOM_TOKEN_RE.findall(value):
+        if not any(ch.isdigit() for ch in token):
+            continue
+        token = token.replace("–", "-")
+        keys.add(token)
+        if "-" in token:
+            keys.add(token.replace("-", ""))
+    return keys
+
+
+def teacher_surname(teacher: str) -> Optional[str]:
+    """Фамилия преподавателя в нижнем регистре ("Иванов И.И. - доцент" -> "иванов")"""
+    match = _SURNAME_RE.search(_PUNCT_RE.sub("", teacher.lower()))
+    return match.group(0) if match else None
+
+
+class ScheduleIndex:
+    """In-memory индекс расписания с инвертированными индексами по группе, аудитории,
+    фамилии преподавателя, дню и паре. Фильтрованный запрос - пересечение множеств."""
+
+    def __init__(self):
+        # удалённые дельтой занятия - None, чтобы id остальных не сдвигались
+        self.lessons: List[Optional[Dict[str, Any]]] = []
+        self.by_group: Dict[str, Set[int]] = {}
+        self.by_room: Dict[str, Set[int]] = {}
+        self.by_teacher: Dict[str, Set[int]] = {}
+        self.by_day: Dict[str, Set[int]] = {}
+        self.by_time: Dict[str, Set[int]] = {}
+        self._row_ids: Dict[tuple, int] = {}
+        self._removed = 0
+        # версия дельт расписания, которые уже есть в индексе
+        self.version = 0
+        self.sync_interval = 60.0
+        self._synced_at: Optional[float] = None
+
+    # ========== ЗАГРУЗКА ==========
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[Dict[str, Any]]) -> "ScheduleIndex":
+        index = cls()
+        for chunk in chunks:
+            index.add_chunk(chunk)
+        return index
+
+    @classmethod
+    def from_file(cls, path: str) -> "ScheduleIndex":
+        from rag_sources.chunk_io import read_chunks_file
+        return cls.from_chunks(read_chunks_file(path))
+
+    @classmethod
+    def from_minio(cls, bucket: str = SCHEDULE_BUCKET, object_name: str = SCHEDULE_CHUNKS_OBJECT, client=None) -> "ScheduleIndex":
+        if client is None:
+            from rag_sources.minio_client import get_minio_client
+            client = get_minio_client()
+        from rag_sources.chunk_io import read_chunks
+        # версию читаем до чанков: дельты новее неё доедут через sync
+        version = read_delta_version(client)
+        index = cls.from_chunks(read_chunks(client, bucket, object_name))
+        index.version = version
+        index._synced_at = time.monotonic()
+        return index
+
+    def add_chunk(self, chunk: Dict[str, Any]) -> Optional[int]:
+        """Добавляет чанк расписания в индекс, возвращает id занятия"""
+        doc_id = chunk.get("document_id") or ""
+        if not doc_id.startswith(SCHEDULE_DOC_PREFIXES):
+            return None
+
+        metadata = chunk.get("metadata") or {}
+        if isinstance(metadata, str):
+            try:
+                metadata = json.loads(metadata)
+            except ValueError:
+                metadata = {}
+        return self.add_lesson(metadata)
+
+    @staticmethod
+    def _lesson_row(metadata: Dict[str, Any]):
+        teachers = [t for t in metadata.get("teacher", []) if isinstance(t, str)]
+        groups = [g for g in metadata.get("groups", []) if g]
+        lesson = {
+            "day": sys.intern(metadata.get("day", "")),
+            "time": sys.intern(metadata.get("time", "")),
+            "subject": metadata.get("subject", ""),
+            "week": sys.intern(metadata.get("week", "не указано")),
+            "room": metadata.get("room", ""),
+            "teacher": teachers,
+            "groups": groups,
+        }
+        row_key = (lesson["day"], lesson["time"], lesson["week"], lesson["subject"],
+                   lesson["room"], tuple(teachers), tuple(groups))
+        return lesson, row_key
+
+    def _postings(self, lesson: Dict[str, Any]):
+        """(индекс, ключ) для всех постингов, в которые входит занятие"""
+        for group in lesson["groups"]:
+            yield self.by_group, normalize_group(group)
+        for key in room_keys(lesson["room"]):
+            yield self.by_room, key
+        for teacher in lesson["teacher"]:
+            surname = teacher_surname(teacher)
+            if surname:
+                yield self.by_teacher, surname
+        yield self.by_day, lesson["day"].lower()
+        yield self.by_time, lesson["time"].lower()
+
+    def add_lesson(self, metadata: Dict[str, Any]) -> int:
+        lesson, row_key = self._lesson_row(metadata)
+
+        # Одно и то же занятие приходит из файлов группы, преподавателя и аудитории
+        lesson_id = self._row_ids.get(row_key)
+        if lesson_id is not None:
+            return lesson_id
+
+        lesson_id = len(self.lessons)
+        self._row_ids[row_key] = lesson_id
+        self.lessons.append(lesson)
+
+        for index, key in self._postings(lesson):
+            index.setdefault(key, set()).add(lesson_id)
+        return lesson_id
+
+    def remove_lesson(self, metadata: Dict[str, Any]) -> bool:
+        """Убирает занятие из индекса; id остальных занятий не меняются"""
+        _, row_key = self._lesson_row(metadata)
+        lesson_id = self._row_ids.pop(row_key, None)
+        if lesson_id is None:
+            return False
+
+        for index, key in self._postings(self.lessons[lesson_id]):
+            posting = index.get(key)
+            if posting is not None:
+                posting.discard(lesson_id)
+                if not posting:
+                    del index[key]
+        self.lessons[lesson_id] = None
+        self._removed += 1
+        return True
+
+    # ========== ДЕЛЬТЫ ==========
+
+    def apply_delta(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Применяет записи дельты (added / removed / modified) по порядку версий, возвращает их число"""
+        count, version = 0, self.version
+        for record in records:
+            if record["version"] <= self.version:
+                continue
+            if record["op"] in ("removed", "modified"):
+                self.remove_lesson(record["previous"])
+            if record["op"] in ("added", "modified"):
+                self.add_lesson(record["lesson"])
+            version = max(version, record["version"])
+            count += 1
+        self.version = version
+        return count
+
+    @property
+    def sync_stale(self) -> bool:
+        return self._synced_at is None or time.monotonic() - self._synced_at >= self.sync_interval
+
+    def fetch_deltas(self, client=None) -> List[Dict[str, Any]]:
+        """Записи дельт новее индекса, уже применённые к Qdrant (ошибки не пробрасываются)"""
+        self._synced_at = time.monotonic()
+        try:
+            if client is None:
+                from rag_sources.minio_client import get_minio_client
+                client = get_minio_client()
+            from rag_sources.chunk_io import read_chunks
+
+            records = []
+            for version in range(self.version + 1, read_delta_version(client) + 1):
+                records.extend(read_chunks(client, DELTA_BUCKET, f"{DELTA_PREFIX}{version:06d}"))
+            return records
+        except Exception as e:
+            print(f"⚠ Дельты расписания не прочитаны: {e}")
+            return []
+
+    def __len__(self) -> int:
+        return len(self.lessons) - self._removed
+
+    # ========== ПОИСК ==========
+
+    def _candidates(self, criteria: Dict[str, Any]) -> Optional[List[Set[int]]]:
+        """Постинги для каждого условия; None - если какое-то условие заведомо пустое"""
+        postings = []
+
+        for group in criteria.get("groups") or []:
+            postings.append(self.by_group.get(normalize_group(group), set()))
+
+        for room in criteria.get("rooms") or []:
+            matched = set()
+            for key in room_keys(room):
+                matched |= self.by_room.get(key, set())
+            postings.append(matched)
+
+        for teacher in criteria.get("teachers") or []:
+            surname = teacher_surname(teacher)
+            postings.append(self.by_teacher.get(surname, set()) if surname else set())
+
+        for day in criteria.get("days") or []:
+            postings.append(self.by_day.get(day.lower(), set()))
+
+        for pair_time in criteria.get("times") or []:
+            postings.append(self.by_time.get(pair_time.lower(), set()))
+
+        if any(not p for p in postings):
+            return None
+        return postings
+
+    def search(self, criteria: Dict[str, Any], limit: int = 1000) -> List[Dict[str, Any]]:
+        """Поиск занятий по группам/аудиториям/преподавателям/дням/парам (все условия через И)"""
+        postings = self._candidates(criteria)
+        if not postings:
+            return []
+
+        postings.sort(key=len)
+        ids = set(postings[0])
+        for posting in postings[1:]:
+            ids &= posting
+            if not ids:
+                return []
+
+        lessons = []
+        seen_keys = set()
+        for lesson_id in sorted(ids):
+            lesson = self.lessons[lesson_id]
+            key = (lesson["day"], lesson["time"], lesson["subject"], lesson["week"])
+            if key in seen_keys:
+                continue
+            seen_keys.add(key)
+            lessons.append(dict(lesson))
+
+        lessons.sort(key=lambda x: (DAY_ORDER.get(x["day"], 99), TIME_ORDER.get(x["time"], 99)))
+        return lessons[:limit]
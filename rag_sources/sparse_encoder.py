@@ -0,0 +1,92 @@
+"""Разреженные BM25-векторы для гибридного поиска в Qdrant.
+
+Плотная MiniLM плохо различает точные токены: номера групп ("4318"), аудиторий ("52-17"),
+фамилии. Для каждого чанка при сборке эмбеддингов считается BM25-вектор: индекс - хэш токена,
+значение - насыщенная частота tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)).
+IDF считает сам Qdrant (sparse-вектор с Modifier.IDF), поэтому пересчитывать корпус при
+добавлении чанков не нужно. Вектор запроса - просто частоты его токенов.
+"""
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# dense - коллекции с одним безымянным вектором (как раньше);
+# hybrid - именованные dense + bm25, запрос сливает обе выдачи через RRF
+RETRIEVAL_MODES = ("dense", "hybrid")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+# Имена векторов в коллекциях гибридного режима
+DENSE_VECTOR = "dense"
+SPARSE_VECTOR = "bm25"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Обрезка слов до префикса - грубый стемминг: "расписание"/"расписания" -> "распис"
+STEM_PREFIX = 6
+
+# Слова, номера и коды с дефисом/точкой внутри ("52-17", "б.морская")
+TOKEN_RE = re.compile(r"\w+(?:[-.]\w+)*")
+STOPWORDS = frozenset(
+    "и в во на с со к ко о об от до по за из у для не ни а но или же ли бы то что как это "
+    "где когда какой какая какие который мне меня я ты вы мы он она они его ее их".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower().replace("ё", "е")):
+        if token in STOPWORDS:
+            continue
+        if any(ch.isdigit() for ch in token):
+            # "52-17" ищут и как "5217"
+            tokens.append(token)
+            if "-" in token or "." in token:
+                tokens.append(re.sub(r"[-.]", "", token))
+        elif len(token) > 1:
+            tokens.append(token[:STEM_PREFIX])
+    return tokens
+
+
+def token_index(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def _sparse(weights: Dict[int, float]) -> Tuple[List[int], List[float]]:
+    indices = sorted(weights)
+    return indices, [weights[i] for i in indices]
+
+
+class SparseEncoder:
+    def __init__(self, avgdl: Optional[float] = None, k1: float = BM25_K1, b: float = BM25_B):
+        self.avgdl = avgdl
+        self.k1 = k1
+        self.b = b
+
+    def fit(self, texts: Iterable[str]) -> "SparseEncoder":
+        """Средняя длина документа по корпусу (в токенах)"""
+        total = count = 0
+        for text in texts:
+            total += len(tokenize(text))
+            count += 1
+        self.avgdl = total / count if count else 1.0
+        return self
+
+    def encode_document(self, text: str) -> Tuple[List[int], List[float]]:
+        tokens = tokenize(text)
+        avgdl = self.avgdl or max(len(tokens), 1)
+        norm = self.k1 * (1 - self.b + self.b * len(tokens) / avgdl)
+        weights: Dict[int, float] = {}
+        for token, tf in Counter(tokens).items():
+            index = token_index(token)
+            # при коллизии хэшей веса складываются
+            weights[index] = weights.get(index, 0.0) + tf * (self.k1 + 1) / (tf + norm)
+        return _sparse(weights)
+
+    @staticmethod
+    def encode_query(text: str) -> Tuple[List[int], List[float]]:
+        weights: Dict[int, float] = {}
+        for token, tf in Counter(tokenize(text)).items():
+            index = token_index(token)
+            weights[index] = weights.get(index, 0.0) + float(tf)
+        return _sparse(weights)
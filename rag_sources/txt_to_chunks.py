@@ -1,16 +1,19 @@
-import io
-import json
 import re
-import uuid
+from collections import Counter
 from pathlib import Path
 from tqdm import tqdm
+from chunk_ids import chunk_uid as make_chunk_uid, text_hash
+from chunk_io import find_chunk_object, read_chunks, write_chunks
 from minio_client import get_minio_client
 
 # ========= НАСТРОЙКИ =========
 BUCKET_SOURCE = "web-crawler"
 BUCKET_TARGET = "rag-sources"
 TXT_PREFIX = "schedules/"
-OUTPUT_OBJECT = "tmp_chunks_for_embeddings/schedules_chunks.json"
+# Сводная таблица занятий от паука guap_rasp; если её нет - разбираем старые txt регулярками
+LESSONS_OBJECT = "schedules/lessons"
+LESSONS_DOCUMENT_ID = "lessons"
+OUTPUT_OBJECT = "tmp_chunks_for_embeddings/schedules_chunks"
 
 
 # ========= ВСПОМОГАТЕЛЬНЫЕ =========
@@ -218,24 +221,45 @@ def chunk_by_pairs(text: str):
     return chunks
 
 
-# ========= ЗАГРУЗКА В MINIO =========
-def upload_json_to_minio(bucket, object_name, data):
-    client = get_minio_client()
-    encoded = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
-    client.put_object(
-        bucket_name=bucket,
-        object_name=object_name,
-        data=io.BytesIO(encoded),
-        length=len(encoded),
-        content_type="application/json"
-    )
-    print(f"[MinIO] Загружено: {object_name}", flush=True)
+# ========= ТАБЛИЦА ЗАНЯТИЙ =========
+def lesson_text(lesson: dict) -> str:
+    parts = [
+        lesson.get("day"),
+        (lesson.get("time") or "") + (f" ({lesson['time_range']})" if lesson.get("time_range") else ""),
+        f"Неделя: {lesson['week']}" if lesson.get("week") else None,
+        lesson.get("lesson_type"),
+        lesson.get("subject"),
+        f"Аудитория: {lesson['room']}" if lesson.get("room") else None,
+        f"Преподаватели: {', '.join(lesson['teacher'])}" if lesson.get("teacher") else None,
+        f"Группы: {', '.join(lesson['groups'])}" if lesson.get("groups") else None,
+        f"Кафедра {lesson['department']}" if lesson.get("department") else None,
+    ]
+    return ". ".join(p for p in parts if p) + "."
+
+
+def lesson_chunk(chunk_id: int, lesson: dict) -> dict:
+    text = lesson_text(lesson)
+    return {
+        "chunk_id": chunk_id,
+        # текст содержит ключ занятия (день, пара, неделя, предмет, аудитория), поэтому uid уникален
+        "chunk_uid": make_chunk_uid(LESSONS_DOCUMENT_ID, 0, text),
+        "text": text,
+        "text_hash": text_hash(text),
+        "document_id": LESSONS_DOCUMENT_ID,
+        "source_url": None,
+        "type": "schedule",
+        "metadata": {"source": "schedule", **lesson, "full_text": text},
+    }
+
+
+def iter_lesson_chunks(client):
+    print(f"[INFO] Читаем {BUCKET_SOURCE}/{LESSONS_OBJECT}", flush=True)
+    for chunk_id, lesson in enumerate(read_chunks(client, BUCKET_SOURCE, LESSONS_OBJECT)):
+        yield lesson_chunk(chunk_id, lesson)
 
 
 # ========= PIPELINE =========
-def process_txt_from_minio():
-    client = get_minio_client()
-    all_chunks = []
+def iter_txt_chunks(client):
     global_id = 0
 
     print(f"[INFO] Читаем {BUCKET_SOURCE}/{TXT_PREFIX}", flush=True)
@@ -252,10 +276,10 @@ def process_txt_from_minio():
 
         pairs = chunk_by_pairs(text)
         source_file = Path(obj.object_name).name
+        # номер повтора одинаковой пары в файле - вместо смещения для uid
+        seen = Counter()
 
         for pair in pairs:
-            chunk_uid = str(uuid.uuid4())
-
             embedding_text = (
                 f"{pair['day']}. {pair['time']}. {pair['week']}. "
                 f"{pair['lesson_type']}. {pair['subject']}. "
@@ -264,11 +288,14 @@ def process_txt_from_minio():
                 f"Группы: {', '.join(pair['groups'])}. "
                 f"Кафедра {pair['department']}."
             )
+            occurrence = seen[embedding_text]
+            seen[embedding_text] += 1
 
-            all_chunks.append({
+            yield {
                 "chunk_id": global_id,
-                "chunk_uid": chunk_uid,
+                "chunk_uid": make_chunk_uid(source_file, occurrence, embedding_text),
                 "text": embedding_text,
+                "text_hash": text_hash(embedding_text),
                 "document_id": source_file,
                 "source_url": None,
                 "type": "schedule",
@@ -285,17 +312,20 @@ def process_txt_from_minio():
                     "department": pair["department"],
                     "full_text": pair["full_text"]
                 }
-            })
+            }
 
             global_id += 1
 
-    upload_json_to_minio(
-        BUCKET_TARGET,
-        OUTPUT_OBJECT,
-        {"chunks": all_chunks}
-    )
 
-    print(f"[INFO] Всего чанков расписания: {len(all_chunks)}", flush=True)
+def process_txt_from_minio():
+    client = get_minio_client()
+    if find_chunk_object(client, BUCKET_SOURCE, LESSONS_OBJECT):
+        chunks = iter_lesson_chunks(client)
+    else:
+        print("[WARN] Таблицы занятий нет, разбираем txt-файлы расписаний", flush=True)
+        chunks = iter_txt_chunks(client)
+    count = write_chunks(client, BUCKET_TARGET, OUTPUT_OBJECT, chunks)
+    print(f"[INFO] Всего чанков расписания: {count}", flush=True)
 
 
 if __name__ == "__main__":
@@ -12,7 +12,9 @@ from core.agents.sgr_agent import SGRAgent
 from core.tools import (
     ClarificationTool,
     FinalAnswerTool,
+    RagTool,
     ReasoningTool,
+    ScheduleTool,
     WebSearchTool,
 )
 from dao.chat_history_dao import chat_history_dao
@@ -98,6 +100,13 @@ class AgentService:
                 OutOfDomainTool,
             ]
 
+            # University knowledge base and timetable from Qdrant
+            if CONFIG.retrieval.enabled:
+                tools.extend([RagTool, ScheduleTool])
+                log.info("RagTool and ScheduleTool enabled")
+            else:
+                log.info("RagTool and ScheduleTool disabled (retrieval.enabled is false)")
+
             # Add WebSearchTool only if Tavily API key is configured
             if has_search_api:
                 tools.append(WebSearchTool)
@@ -1,9 +1,12 @@
 from core.services.prompt_loader import PromptLoader
 from core.services.registry import AgentRegistry, ToolRegistry
+from core.services.retrieval import RetrievalService, get_retrieval_service
 from core.services.tavily_search import TavilySearchService
 
 __all__ = [
     "TavilySearchService",
+    "RetrievalService",
+    "get_retrieval_service",
     "ToolRegistry",
     "AgentRegistry",
     "PromptLoader",
@@ -0,0 +1,215 @@
+"""Retrieval over the university knowledge base built by rag_sources.
+
+Text chunks live in the text collection, lessons in the schedule collection. Lessons are
+looked up by payload filters (no embeddings needed), text chunks by vector similarity.
+"""
+
+import asyncio
+import weakref
+
+from openai import AsyncOpenAI
+from qdrant_client import models
+
+from core.models import ResearchContext, SourceData
+from rag_sources.qdrant_factory import QdrantClientOptions, create_async_qdrant_client
+from rag_sources.schedule_index import DAY_ORDER, SCHEDULE_DOC_PREFIXES, TIME_ORDER, teacher_surname
+from utils.config import CONFIG, ConfigEmbeddings, ConfigQdrant, ConfigRetrieval
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Named dense vector of hybrid collections (rag_sources/sparse_encoder.py)
+DENSE_VECTOR = "dense"
+SCROLL_PAGE = 256
+
+
+class RetrievalService:
+    def __init__(self, qdrant_config: ConfigQdrant, embeddings_config: ConfigEmbeddings, config: ConfigRetrieval):
+        # same pooled, retrying client as the data pipeline (rag_sources/qdrant_factory.py)
+        self._qdrant = create_async_qdrant_client(
+            url=qdrant_config.url,
+            api_key=qdrant_config.api_key or None,
+            options=QdrantClientOptions(timeout=config.timeout),
+        )
+        self._embeddings = AsyncOpenAI(
+            api_key=embeddings_config.api_key,
+            base_url=embeddings_config.base_url,
+            timeout=config.timeout,
+        )
+        self._embeddings_model = embeddings_config.model
+        self._config = config
+        # collection -> (vector name or None, vector size)
+        self._vectors: dict[str, tuple[str | None, int]] = {}
+
+    async def _vector_params(self, collection: str) -> tuple[str | None, int]:
+        if collection not in self._vectors:
+            info = await self._qdrant.get_collection(collection)
+            vectors = info.config.params.vectors
+            if isinstance(vectors, dict):
+                name = DENSE_VECTOR if DENSE_VECTOR in vectors else next(iter(vectors))
+                self._vectors[collection] = (name, vectors[name].size)
+            else:
+                self._vectors[collection] = (None, vectors.size)
+        return self._vectors[collection]
+
+    async def _embed(self, text: str) -> list[float]:
+        response = await self._embeddings.embeddings.create(model=self._embeddings_model, input=text)
+        return response.data[0].embedding
+
+    async def search_documents(self, query: str, top_k: int | None = None) -> list[dict]:
+        """Text chunks closest to the query: {id, score, text, url, document_id}."""
+        collection = self._config.text_collection
+        top_k = top_k or self._config.top_k
+        logger.info(f"📚 Knowledge base search: '{query}' (top_k={top_k})")
+
+        (using, size), vector = await asyncio.gather(self._vector_params(collection), self._embed(query))
+        if len(vector) != size:
+            logger.error(
+                f"❌ Embedding model '{self._embeddings_model}' returns {len(vector)}-dim vectors, "
+                f"collection '{collection}' expects {size}"
+            )
+            return []
+
+        response = await self._qdrant.query_points(
+            collection_name=collection,
+            query=vector,
+            using=using,
+            limit=top_k,
+            with_payload=True,
+        )
+        documents = []
+        for point in response.points:
+            payload = point.payload or {}
+            documents.append(
+                {
+                    "id": str(point.id),
+                    "score": point.score,
+                    "text": payload.get("text", ""),
+                    "url": payload.get("source_url") or f"qdrant://{collection}/{point.id}",
+                    "document_id": payload.get("document_id") or "",
+                }
+            )
+        return documents
+
+    @staticmethod
+    def register_source(context: ResearchContext, url: str, title: str, content: str) -> SourceData:
+        """Add a citation to the research context; an already cited url keeps its number."""
+        source = context.sources.get(url)
+        if source is None:
+            source = SourceData(number=len(context.sources) + 1, title=title, url=url, snippet=content[:300])
+            context.sources[url] = source
+        if content not in source.full_content:
+            source.full_content = f"{source.full_content}\n\n{content}".strip()
+            source.char_count = len(source.full_content)
+        return source
+
+    @staticmethod
+    def _schedule_filter(
+        group: str | None, teacher: str | None, room: str | None, day: str | None, pair: int | None
+    ) -> models.Filter | None:
+        conditions = []
+        if group:
+            group = group.strip()
+            conditions.append(
+                models.FieldCondition(
+                    key="metadata.groups", match=models.MatchAny(any=list({group, group.upper(), group.lower()}))
+                )
+            )
+        surname = teacher_surname(teacher) if teacher else None
+        if surname:
+            # "Иванов И.И." -> "Иванов": initials are written differently across pages.
+            # Without a full-text index MatchText is a substring match ("Иванов" in "Иванова"),
+            # so search_schedule re-checks the surname token
+            conditions.append(
+                models.FieldCondition(key="metadata.teacher", match=models.MatchText(text=surname.capitalize()))
+            )
+        if room:
+            room = room.strip().lower()
+            patterns = {room, room.replace("-", "")}
+            conditions.append(
+                models.Filter(
+                    should=[
+                        models.FieldCondition(key="metadata.room", match=models.MatchText(text=pattern))
+                        for pattern in patterns
+                    ]
+                )
+            )
+        if day:
+            conditions.append(
+                models.FieldCondition(key="metadata.day", match=models.MatchText(text=day.strip().capitalize()))
+            )
+        if pair:
+            conditions.append(models.FieldCondition(key="metadata.time", match=models.MatchText(text=f"{pair} пара")))
+        return models.Filter(must=conditions) if conditions else None
+
+    async def search_schedule(
+        self,
+        group: str | None = None,
+        teacher: str | None = None,
+        room: str | None = None,
+        day: str | None = None,
+        pair: int | None = None,
+    ) -> list[dict]:
+        """Lessons matching all given criteria, ordered by day and pair."""
+        scroll_filter = self._schedule_filter(group, teacher, room, day, pair)
+        if scroll_filter is None:
+            return []
+        logger.info(f"📅 Schedule search: group={group} teacher={teacher} room={room} day={day} pair={pair}")
+
+        surname = teacher_surname(teacher) if teacher else None
+        lessons: dict[tuple, dict] = {}
+        offset = None
+        scanned = 0
+        while scanned < self._config.schedule_limit:
+            points, offset = await self._qdrant.scroll(
+                collection_name=self._config.schedule_collection,
+                scroll_filter=scroll_filter,
+                limit=SCROLL_PAGE,
+                offset=offset,
+                with_payload=True,
+            )
+            scanned += len(points)
+            for point in points:
+                payload = point.payload or {}
+                if not (payload.get("document_id") or "").startswith(SCHEDULE_DOC_PREFIXES):
+                    continue
+                meta = payload.get("metadata") or {}
+                if surname and not any(teacher_surname(name) == surname for name in meta.get("teacher") or []):
+                    continue
+                # the same lesson is indexed from group, room and teacher pages
+                key = (meta.get("day"), meta.get("time"), meta.get("week"), meta.get("subject"), meta.get("room"))
+                lesson = lessons.setdefault(
+                    key,
+                    {
+                        "day": meta.get("day", ""),
+                        "time": meta.get("time", ""),
+                        "week": meta.get("week", ""),
+                        "subject": meta.get("subject", ""),
+                        "room": meta.get("room", ""),
+                        "teacher": list(meta.get("teacher") or []),
+                        "groups": list(meta.get("groups") or []),
+                        "url": payload.get("source_url") or next(iter(meta.get("sources") or []), ""),
+                    },
+                )
+                for field in ("teacher", "groups"):
+                    lesson[field] += [value for value in meta.get(field) or [] if value not in lesson[field]]
+            if not points or offset is None:
+                break
+
+        return sorted(
+            lessons.values(),
+            key=lambda lesson: (DAY_ORDER.get(lesson["day"], 99), TIME_ORDER.get(lesson["time"], 99)),
+        )
+
+
+# httpx connection pools are bound to the event loop they were opened in, and the REST
+# server and the Telegram bot run in different loops: one pooled service per loop
+_services: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, RetrievalService]" = weakref.WeakKeyDictionary()
+
+
+def get_retrieval_service() -> RetrievalService:
+    loop = asyncio.get_running_loop()
+    service = _services.get(loop)
+    if service is None:
+        service = _services[loop] = RetrievalService(CONFIG.qdrant, CONFIG.embeddings, CONFIG.retrieval)
+    return service
@@ -9,7 +9,9 @@ from core.tools.create_report_tool import CreateReportTool
 from core.tools.extract_page_content_tool import ExtractPageContentTool
 from core.tools.final_answer_tool import FinalAnswerTool
 from core.tools.generate_plan_tool import GeneratePlanTool
+from core.tools.rag_tool import RagTool
 from core.tools.reasoning_tool import ReasoningTool
+from core.tools.schedule_tool import ScheduleTool
 from core.tools.web_search_tool import WebSearchTool
 from core.tools.out_of_domain_tool import OutOfDomainTool
 
@@ -43,6 +45,8 @@ __all__ = [
     "FinalAnswerTool",
     "ReasoningTool",
     "OutOfDomainTool",
+    "RagTool",
+    "ScheduleTool",
     # Tool lists
     "NextStepToolStub",
     "NextStepToolsBuilder",
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from pydantic import Field
+
+from core.base_tool import BaseTool
+from core.models import SearchResult
+from core.services.retrieval import get_retrieval_service
+from utils.logger import get_logger
+
+if TYPE_CHECKING:
+    from core.agent_definition import AgentConfig
+    from core.models import ResearchContext
+
+logger = get_logger(__name__)
+
+
+class RagTool(BaseTool):
+    """Search the university knowledge base (official university web pages indexed locally).
+    Use this tool FIRST for any question about the university: admission, departments, study programs,
+    scholarships, dormitories, documents, contacts, rules and news.
+    Returns: Numbered sources with URLs and the relevant text fragments
+    Best for: Answering university questions in one call, without web search
+
+    Usage:
+        - Formulate the query in Russian, as a short question or key phrase
+        - Cite the returned sources by their numbers
+        - For lessons, rooms and teachers' timetables use ScheduleTool instead
+        - Use WebSearchTool only if the knowledge base has no answer
+    """
+
+    reasoning: str = Field(description="Why this search is needed and what to expect")
+    query: str = Field(description="Search query in Russian")
+    max_results: int = Field(description="Maximum number of fragments to retrieve", default=5, ge=1, le=10)
+
+    async def __call__(self, context: ResearchContext, config: AgentConfig, **_) -> str:
+        """Search the text collection and register found fragments as sources."""
+
+        logger.info(f"📚 Knowledge base query: '{self.query}'")
+        service = get_retrieval_service()
+        try:
+            documents = await service.search_documents(self.query, top_k=self.max_results)
+        except Exception as e:
+            logger.error(f"❌ Knowledge base search failed: {e}", exc_info=True)
+            return f"Knowledge base is unavailable: {e}"
+
+        if not documents:
+            return f"Knowledge base query: {self.query}\n\nNothing found."
+
+        citations = []
+        formatted_result = f"Knowledge base query: {self.query}\n\n"
+        for document in documents:
+            title = document["document_id"] or document["url"]
+            source = service.register_source(context, document["url"], title, document["text"])
+            if source not in citations:
+                citations.append(source)
+            formatted_result += f"{str(source)}\n{document['text']}\n\n"
+
+        context.searches.append(
+            SearchResult(query=self.query, answer=None, citations=citations, timestamp=datetime.now())
+        )
+        logger.debug(formatted_result)
+        return formatted_result
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from pydantic import Field
+
+from core.base_tool import BaseTool
+from core.models import SearchResult
+from core.services.retrieval import get_retrieval_service
+from utils.logger import get_logger
+
+if TYPE_CHECKING:
+    from core.agent_definition import AgentConfig
+    from core.models import ResearchContext
+
+logger = get_logger(__name__)
+
+
+class ScheduleTool(BaseTool):
+    """Look up the university timetable: lessons of a group, a teacher or in a room.
+    Use this tool for any question about classes: when and where a group studies, what is in a room,
+    when a teacher has lessons, what is on a given day or pair.
+    At least one of group, teacher or room is required; day and pair narrow the result.
+    Returns: Lessons (day, pair, week, subject, room, teachers, groups) with the timetable page URLs
+
+    Usage:
+        - group: group code as written by the user, e.g. "4318" or "М412"
+        - teacher: surname only, e.g. "Иванов"
+        - room: room number, e.g. "52-17"
+        - day: weekday in Russian, e.g. "Понедельник"; resolve "today"/"tomorrow" to a weekday first
+        - pair: pair number 1-8
+    """
+
+    reasoning: str = Field(description="Why the timetable is needed and what to expect")
+    group: str | None = Field(default=None, description="Student group code")
+    teacher: str | None = Field(default=None, description="Teacher surname")
+    room: str | None = Field(default=None, description="Room number")
+    day: str | None = Field(default=None, description="Weekday in Russian")
+    pair: int | None = Field(default=None, ge=1, le=8, description="Pair number")
+
+    @staticmethod
+    def _format_lesson(lesson: dict) -> str:
+        line = f"{lesson['day']}, {lesson['time']}"
+        if lesson["week"]:
+            line += f" ({lesson['week']})"
+        line += f": {lesson['subject']}"
+        if lesson["room"]:
+            line += f", ауд. {lesson['room']}"
+        if lesson["teacher"]:
+            line += f", {', '.join(lesson['teacher'])}"
+        if lesson["groups"]:
+            line += f", группы: {', '.join(lesson['groups'])}"
+        return line
+
+    async def __call__(self, context: ResearchContext, config: AgentConfig, **_) -> str:
+        """Filter the schedule collection and register timetable pages as sources."""
+
+        criteria = {"group": self.group, "teacher": self.teacher, "room": self.room}
+        described = ", ".join(f"{name}={value}" for name, value in criteria.items() if value)
+        if not described:
+            return "Specify a group, a teacher or a room to look up the timetable."
+        if self.day:
+            described += f", day={self.day}"
+        if self.pair:
+            described += f", pair={self.pair}"
+
+        service = get_retrieval_service()
+        try:
+            lessons = await service.search_schedule(self.group, self.teacher, self.room, self.day, self.pair)
+        except Exception as e:
+            logger.error(f"❌ Schedule search failed: {e}", exc_info=True)
+            return f"Timetable is unavailable: {e}"
+
+        if not lessons:
+            return f"Timetable query: {described}\n\nNo lessons found."
+
+        # one citation per timetable page, lessons are listed under it
+        by_url: dict[str, list[str]] = {}
+        for lesson in lessons:
+            by_url.setdefault(lesson["url"] or "schedule", []).append(self._format_lesson(lesson))
+
+        citations = []
+        formatted_result = f"Timetable query: {described}\n\n"
+        for url, lines in by_url.items():
+            content = "\n".join(lines)
+            source = service.register_source(context, url, f"Расписание ({described})", content)
+            citations.append(source)
+            formatted_result += f"{str(source)}\n{content}\n\n"
+
+        context.searches.append(
+            SearchResult(query=f"schedule: {described}", answer=None, citations=citations, timestamp=datetime.now())
+        )
+        logger.debug(formatted_result)
+        return formatted_result
@@ -1,3 +1,9 @@
+import sys
+from pathlib import Path
+
+# schedule constants are shared with the data pipeline (rag_sources/schedule_index.py)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
 from utils.config import CONFIG  # noqa: F401
 
 if __name__ == "__main__":
@@ -70,8 +70,7 @@ class ConfigGPT:
 
 @dataclass
 class ConfigQdrant:
-    host: str
-    port: int
+    url: str
     api_key: str
 
 
@@ -82,6 +81,16 @@ class ConfigEmbeddings:
     api_key: str
 
 
+@dataclass
+class ConfigRetrieval:
+    enabled: bool
+    text_collection: str
+    schedule_collection: str
+    top_k: int
+    schedule_limit: int
+    timeout: int
+
+
 @dataclass
 class ConfigOpenAI:
     base_url: str
@@ -147,6 +156,7 @@ class Config:
     gpt: ConfigGPT
     qdrant: ConfigQdrant
     embeddings: ConfigEmbeddings
+    retrieval: ConfigRetrieval
     openai: ConfigOpenAI
     prompts: ConfigPrompts
     execution: ConfigExecution
@@ -0,0 +1,99 @@
+import json
+
+import pytest
+
+from rag_sources import chunk_io
+from rag_sources.chunk_io import find_chunk_object, read_chunks, read_chunks_file, write_chunks
+
+BUCKET = "rag-sources"
+BASE = "tmp_chunks/pdf_chunks"
+
+
+class Response:
+    def __init__(self, data):
+        self._data = data
+
+    def stream(self, size):
+        for i in range(0, len(self._data), size):
+            yield self._data[i:i + size]
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class MemoryMinio:
+    """Бакеты MinIO в словаре: put_object читает поток, как multipart-загрузка"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, bucket, name, data, length, part_size=None, content_type=None):
+        parts = []
+        while block := data.read(part_size):
+            parts.append(block)
+        self.objects[(bucket, name)] = b"".join(parts)
+
+    def get_object(self, bucket, name):
+        return Response(self.objects[(bucket, name)])
+
+    def stat_object(self, bucket, name):
+        if (bucket, name) not in self.objects:
+            raise FileNotFoundError(name)
+
+    def remove_object(self, bucket, name):
+        self.objects.pop((bucket, name), None)
+
+
+def chunks(count):
+    return ({"chunk_id": i, "text": f"Чанк {i}\nс переносом строки", "metadata": {"page": i}} for i in range(count))
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # несколько блоков и частей, чтобы строки резались на границах
+    monkeypatch.setattr(chunk_io, "READ_SIZE", 64)
+    monkeypatch.setattr(chunk_io, "PART_SIZE", 100)
+
+
+def test_ndjson_round_trip(small_blocks):
+    client = MemoryMinio()
+
+    assert write_chunks(client, BUCKET, BASE, chunks(50), compression="") == 50
+
+    assert find_chunk_object(client, BUCKET, BASE) == BASE + ".ndjson"
+    assert list(read_chunks(client, BUCKET, BASE)) == list(chunks(50))
+
+
+def test_zstd_round_trip_replaces_other_formats(small_blocks):
+    pytest.importorskip("zstandard")
+    client = MemoryMinio()
+    write_chunks(client, BUCKET, BASE, chunks(3), compression="")
+
+    write_chunks(client, BUCKET, BASE, chunks(50), compression="zstd")
+
+    assert set(client.objects) == {(BUCKET, BASE + ".ndjson.zst")}
+    assert list(read_chunks(client, BUCKET, BASE + ".ndjson.zst")) == list(chunks(50))
+
+
+def test_legacy_json_is_readable(tmp_path):
+    client = MemoryMinio()
+    client.objects[(BUCKET, BASE + ".json")] = json.dumps({"chunks": list(chunks(2))}).encode("utf-8")
+    assert list(read_chunks(client, BUCKET, BASE)) == list(chunks(2))
+
+    path = tmp_path / "chunks.ndjson"
+    path.write_bytes(b"".join(json.dumps(c, ensure_ascii=False).encode("utf-8") + b"\n\n" for c in chunks(3)))
+    assert list(read_chunks_file(str(path))) == list(chunks(3))
+
+
+def test_missing_object():
+    with pytest.raises(FileNotFoundError):
+        list(read_chunks(MemoryMinio(), BUCKET, BASE))
+
+
+def test_empty_set(small_blocks):
+    client = MemoryMinio()
+    assert write_chunks(client, BUCKET, BASE, iter(()), compression="") == 0
+    assert list(read_chunks(client, BUCKET, BASE)) == []
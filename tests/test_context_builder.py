@@ -0,0 +1,116 @@
+import pytest
+
+from rag_sources import context_builder
+from rag_sources.context_builder import ContextBuilder, join_overlapping, merge_adjacent
+
+
+class WordEncoder:
+    """Токен - слово: бюджеты в тестах считаются в словах"""
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    monkeypatch.setattr(context_builder, "get_encoder", lambda model: WordEncoder())
+    context_builder.count_tokens.cache_clear()
+    yield
+    context_builder.count_tokens.cache_clear()
+
+
+def doc(doc_id, text, score, document_id=None, start=None, end=None, **extra):
+    metadata = {}
+    if start is not None:
+        metadata = {"start_offset": start, "end_offset": end}
+    return dict({"id": doc_id, "text": text, "score": score, "collection": "text_embeddings",
+                 "metadata": {"document_id": document_id, "metadata": metadata}}, **extra)
+
+
+def test_input_order_wins_over_cosine_score():
+    # кросс-энкодер поставил второй по косинусу документ первым
+    docs = [doc("b", "Общежитие.", 0.5, rerank_score=7.5), doc("a", "Приём.", 0.9, rerank_score=1.2)]
+
+    fragments = merge_adjacent(docs)
+
+    assert [f["ids"] for f in fragments] == [["b"], ["a"]]
+    assert fragments[0]["score"] == 7.5
+    context, _ = ContextBuilder(token_budget=1000).build(docs)
+    assert context.index("релевантность: 7.500") < context.index("Приём.")
+
+
+def test_merged_fragment_takes_place_of_best_chunk():
+    docs = [
+        doc("x", "Другой документ.", 0.7),
+        doc("p2", "вторая часть.", 0.6, "doc", 10, 23),
+        doc("p1", "первая часть", 0.8, "doc", 0, 12),
+    ]
+
+    fragments = merge_adjacent(docs)
+
+    assert [f["ids"] for f in fragments] == [["x"], ["p1", "p2"]]
+    assert fragments[1]["text"] == "первая часть вторая часть."
+
+
+def test_overlap_of_pdf_chunks_is_not_repeated():
+    head = "Стипендия назначается по итогам сессии. Размер зависит от оценок"
+    tail = "Размер зависит от оценок и участия в научной работе."
+    docs = [doc("1", head, 0.9, "pdf", 0, 64), doc("2", tail, 0.8, "pdf", 40, 92)]
+
+    (fragment,) = merge_adjacent(docs)
+
+    assert fragment["text"] == ("Стипендия назначается по итогам сессии. "
+                                "Размер зависит от оценок и участия в научной работе.")
+
+
+def test_join_without_overlap_and_gap_between_chunks():
+    assert join_overlapping("Первый абзац.", "Второй абзац.") == "Первый абзац. Второй абзац."
+    docs = [doc("1", "Первый.", 0.9, "doc", 0, 7), doc("2", "Далеко.", 0.8, "doc", 100, 107)]
+    assert len(merge_adjacent(docs)) == 2
+
+
+def test_repeated_sentences_are_dropped_from_less_relevant_fragments():
+    header = "Санкт-Петербургский государственный университет аэрокосмического приборостроения."
+    docs = [doc("1", f"{header} Приём документов.", 0.9), doc("2", f"{header} Общежитие.", 0.8)]
+
+    context, _ = ContextBuilder(token_budget=1000).build(docs)
+
+    assert context.count(header) == 1
+    assert "Общежитие." in context
+
+
+def test_budget_truncates_then_drops():
+    long_text = " ".join(f"Предложение {i}." for i in range(40))
+    docs = [doc("1", long_text, 0.9), doc("2", "Не влезет.", 0.8)]
+    builder = ContextBuilder(token_budget=60)
+
+    context, stats = builder.build(docs)
+
+    assert stats.tokens <= 60
+    assert stats.dropped == 1
+    assert "Не влезет." not in context
+    assert context.rstrip().endswith(".")
+
+
+def test_build_has_no_shared_state():
+    builder = ContextBuilder(token_budget=1000)
+    first = builder.build([doc("1", "Приём документов.", 0.9)])
+    builder.build([doc("2", "Общежитие.", 0.9)])
+    assert builder.build([doc("1", "Приём документов.", 0.9)]) == first
+
+
+def test_normalized_chunks_keep_offsets_within_their_document():
+    from making_json_of_chunks import normalize_chunk
+
+    text = "Стипендия назначается по итогам сессии. " * 10
+    first = {"text": text, "token_count": 80, "start_offset": 0, "end_offset": 400}
+    second = {"text": text, "token_count": 80, "start_offset": 350, "end_offset": 750}
+
+    normalized, offset = normalize_chunk(first, "https://guap.ru/a.pdf", "pdf", 0, 5000)
+    following, _ = normalize_chunk(second, "https://guap.ru/a.pdf", "pdf", 1, offset)
+
+    assert (normalized["start_offset"], normalized["end_offset"]) == (0, 400)
+    assert (following["start_offset"], following["end_offset"]) == (350, 750)
@@ -0,0 +1,42 @@
+from dedup_chunks import dedup_chunks, iter_kept, minhash, similarity
+
+PAGE = ("Приём документов на бакалавриат начинается 20 июня и заканчивается 25 июля. "
+        "Документы можно подать лично в приёмной комиссии или через портал госуслуг. "
+        "Для поступления нужны паспорт, аттестат и результаты ЕГЭ по трём предметам.")
+OTHER = ("Общежитие предоставляется иногородним студентам очной формы обучения. "
+         "Заселение проходит в конце августа по графику, который публикует студгородок.")
+
+
+def chunk(text, url):
+    return {"text": text, "source_url": url, "metadata": {}}
+
+
+def test_minhash_similarity_of_near_duplicates():
+    assert similarity(minhash(PAGE), minhash(PAGE + " Контакты")) > 0.85
+    assert similarity(minhash(PAGE), minhash(OTHER)) < 0.2
+
+
+def test_group_keeps_clean_url_and_collects_aliases():
+    chunks = [
+        chunk(PAGE, "https://guap.ru/priem?print=1"),
+        chunk(PAGE, "https://guap.ru/priem#docs"),
+        chunk(PAGE, "https://guap.ru/priem"),
+        chunk(OTHER, "https://guap.ru/dorm"),
+    ]
+    keep = dedup_chunks(chunks)
+
+    assert keep == {2: ["https://guap.ru/priem#docs", "https://guap.ru/priem?print=1"], 3: []}
+
+
+def test_iter_kept_writes_aliases_into_metadata():
+    chunks = [chunk(PAGE, "https://guap.ru/priem/print"), chunk(PAGE, "https://guap.ru/priem"),
+              chunk(OTHER, "https://guap.ru/dorm")]
+    kept = list(iter_kept(chunks, dedup_chunks(chunks)))
+
+    assert [c["source_url"] for c in kept] == ["https://guap.ru/priem", "https://guap.ru/dorm"]
+    assert kept[0]["metadata"]["aliases"] == ["https://guap.ru/priem/print"]
+    assert "aliases" not in kept[1]["metadata"]
+
+
+def test_empty_input():
+    assert dedup_chunks([]) == {}
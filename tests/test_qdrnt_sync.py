@@ -0,0 +1,195 @@
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+
+from rag_sources import qdrant_factory
+from rag_sources.embedding_artifact import (
+    PAYLOAD_HASH_FIELD,
+    EmbeddingArtifactWriter,
+    iter_artifact_segments,
+    open_artifact,
+    payload_hash,
+    payload_metadata,
+)
+
+DIM = 384
+PREFIX = "embeddings/all_chunks"
+COLLECTION = "text_embeddings"
+
+
+class LocalMinio:
+    """Minio, который отдаёт объекты из локальной папки"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fget_object(self, bucket, name, path):
+        shutil.copy(os.path.join(self.directory, os.path.basename(name)), path)
+
+    def stat_object(self, bucket, name):
+        if not os.path.exists(os.path.join(self.directory, os.path.basename(name))):
+            raise FileNotFoundError(name)
+
+
+def write_artifact(directory, chunks):
+    writer = EmbeddingArtifactWriter(str(directory), os.path.basename(PREFIX), len(chunks), DIM)
+    vectors = np.random.default_rng(0).random((len(chunks), DIM), dtype=np.float32)
+    writer.add_batch(chunks, vectors)
+    writer.close()
+
+
+def chunk(text, **metadata):
+    uid = str(uuid.uuid5(uuid.NAMESPACE_URL, text))
+    return {"chunk_uid": uid, "text": text, "type": "html", "document_id": "doc",
+            "source_url": "https://guap.ru/doc", "metadata": metadata}
+
+
+@pytest.fixture
+def qdrnt(monkeypatch, tmp_path):
+    # parser.qdrnt создаёт клиент при импорте; qdrant_factory мог быть импортирован раньше
+    # (через core.services.retrieval), так что адрес подменяем в самом модуле, а не в окружении
+    monkeypatch.setattr(qdrant_factory, "QDRANT_URL", "http://localhost:6333")
+    from parser import qdrnt
+
+    monkeypatch.setattr(qdrnt, "client", QdrantClient(":memory:"))
+    monkeypatch.setattr(qdrnt, "minio_client", LocalMinio(str(tmp_path)))
+    monkeypatch.setattr(qdrnt, "hybrid", False)
+    monkeypatch.setattr(qdrnt, "parallel", 1)
+    return qdrnt
+
+
+def artifact_rows(chunks):
+    """Строки payload, как их пишет making_embeddings"""
+    return [{"chunk_uid": c["chunk_uid"], "text": c["text"], "type": c["type"], "document_id": c["document_id"],
+             "source_url": c["source_url"], "metadata": payload_metadata(c)} for c in chunks]
+
+
+def counting_upload(qdrnt, monkeypatch):
+    uploaded = []
+    upload = qdrnt.client.upload_collection
+
+    def upload_collection(**kwargs):
+        uploaded.extend(kwargs["ids"])
+        return upload(**kwargs)
+
+    monkeypatch.setattr(qdrnt.client, "upload_collection", upload_collection)
+    return uploaded
+
+
+def payloads(qdrnt):
+    points, _ = qdrnt.client.scroll(COLLECTION, limit=100, with_payload=True)
+    return {str(p.id): p.payload for p in points}
+
+
+def test_payload_hash_ignores_key_order_and_own_field():
+    payload = {"text": "a", "metadata": {"x": 1, "y": 2}}
+    reordered = {"metadata": {"y": 2, "x": 1}, "text": "a", PAYLOAD_HASH_FIELD: "old"}
+    assert payload_hash(payload) == payload_hash(reordered)
+    assert payload_hash(payload) != payload_hash({"text": "a", "metadata": {"x": 1, "y": 3}})
+
+
+def test_sync_reupserts_changed_payload_with_same_id(qdrnt, tmp_path):
+    first, second = chunk("Приём документов"), chunk("Общежитие")
+    write_artifact(tmp_path, [first, second])
+    qdrnt.to_qdrnt_artifact("bucket", PREFIX, COLLECTION)
+    assert set(payloads(qdrnt)) == {first["chunk_uid"], second["chunk_uid"]}
+
+    # тот же текст (и ID), но у первого чанка появились алиасы и смещения
+    changed = chunk("Приём документов", aliases=["https://guap.ru/doc?print=1"], start_offset=0, end_offset=16)
+    write_artifact(tmp_path, [changed, second])
+    qdrnt.to_qdrnt_artifact("bucket", PREFIX, COLLECTION)
+
+    stored = payloads(qdrnt)
+    assert stored[first["chunk_uid"]]["metadata"]["aliases"] == ["https://guap.ru/doc?print=1"]
+    assert stored[first["chunk_uid"]]["metadata"]["start_offset"] == 0
+
+
+def test_sync_skips_unchanged_and_deletes_vanished(qdrnt, tmp_path, monkeypatch):
+    first, second = chunk("Приём документов"), chunk("Общежитие")
+    write_artifact(tmp_path, [first, second])
+    qdrnt.to_qdrnt_artifact("bucket", PREFIX, COLLECTION)
+
+    uploaded = counting_upload(qdrnt, monkeypatch)
+    write_artifact(tmp_path, [first])
+    qdrnt.to_qdrnt_artifact("bucket", PREFIX, COLLECTION)
+
+    assert uploaded == []
+    assert set(payloads(qdrnt)) == {first["chunk_uid"]}
+
+
+def test_points_without_hash_are_reupserted(qdrnt, tmp_path):
+    first = chunk("Приём документов")
+    write_artifact(tmp_path, [first])
+    qdrnt.to_qdrnt_artifact("bucket", PREFIX, COLLECTION)
+    # точка, залитая до появления хэша
+    qdrnt.client.delete_payload(COLLECTION, keys=[PAYLOAD_HASH_FIELD], points=[first["chunk_uid"]])
+
+    qdrnt.to_qdrnt_artifact("bucket", PREFIX, COLLECTION)
+
+    assert payloads(qdrnt)[first["chunk_uid"]][PAYLOAD_HASH_FIELD]
+
+
+def test_rerun_on_same_input_uploads_nothing(qdrnt, tmp_path, monkeypatch):
+    from making_json_of_chunks import normalize_chunk
+
+    text = "Стипендия назначается по итогам сессии и зависит от оценок студента. " * 3
+    raw = [{"text": text, "token_count": 60, "start_offset": 0, "end_offset": len(text)}]
+
+    def nightly_run():
+        chunks = [normalize_chunk(chunk, "https://guap.ru/a.pdf", "pdf", i, 0)[0] for i, chunk in enumerate(raw)]
+        write_artifact(tmp_path, artifact_rows(chunks))
+        qdrnt.to_qdrnt_artifact("bucket", PREFIX, COLLECTION)
+        return chunks
+
+    first = nightly_run()
+    time.sleep(0.01)
+    uploaded = counting_upload(qdrnt, monkeypatch)
+    second = nightly_run()
+
+    # created_at ставится заново при каждом прогоне, но точку не меняет
+    assert first[0]["metadata"]["created_at"] != second[0]["metadata"]["created_at"]
+    assert uploaded == []
+    assert payloads(qdrnt)[first[0]["chunk_uid"]]["metadata"]["created_at"] == first[0]["metadata"]["created_at"]
+
+
+def write_batched_artifact(directory, chunks, batch=2):
+    """Артефакт как у making_embeddings: по группе строк parquet на батч, с BM25-векторами"""
+    writer = EmbeddingArtifactWriter(str(directory), os.path.basename(PREFIX), len(chunks), DIM, sparse=True)
+    vectors = np.random.default_rng(0).random((len(chunks), DIM), dtype=np.float32)
+    for i in range(0, len(chunks), batch):
+        writer.add_batch(chunks[i:i + batch], vectors[i:i + batch],
+                         sparse=[([row], [1.0]) for row in range(i, min(i + batch, len(chunks)))])
+    writer.close()
+    return vectors
+
+
+def test_segments_span_row_groups_and_resume_from_row(tmp_path):
+    chunks = [chunk(f"Документ {i}") for i in range(5)]
+    vectors = write_batched_artifact(tmp_path, chunks)
+    name = os.path.join(str(tmp_path), os.path.basename(PREFIX))
+
+    artifact_vectors, table = open_artifact(name + ".vectors.npy", name + ".payloads.parquet")
+    segments = list(iter_artifact_segments(artifact_vectors, table, 1, 3))
+
+    assert [ids for ids, *_ in segments] == [[c["chunk_uid"] for c in chunks[1:4]], [chunks[4]["chunk_uid"]]]
+    assert [end for *_, end in segments] == [4, 5]
+    assert np.array_equal(segments[0][1], vectors[1:4])
+    assert segments[1][2][0]["text"] == "Документ 4"
+
+
+def test_hybrid_sync_keeps_sparse_vectors_aligned(qdrnt, tmp_path, monkeypatch):
+    monkeypatch.setattr(qdrnt, "hybrid", True)
+    monkeypatch.setattr(qdrnt, "segment_size", 3)
+    chunks = [chunk(f"Документ {i}") for i in range(5)]
+    write_batched_artifact(tmp_path, chunks)
+
+    qdrnt.to_qdrnt_artifact("bucket", PREFIX, COLLECTION)
+
+    points = qdrnt.client.retrieve(COLLECTION, [c["chunk_uid"] for c in chunks], with_vectors=True)
+    sparse = {str(p.id): p.vector[qdrnt.SPARSE_VECTOR].indices for p in points}
+    assert sparse == {c["chunk_uid"]: [i] for i, c in enumerate(chunks)}
@@ -0,0 +1,71 @@
+from datetime import date
+
+import pytest
+
+from rag_sources.query_analyzer import QueryAnalyzer
+from rag_sources.schedule_index import ScheduleIndex
+
+MONDAY = date(2026, 10, 12)
+
+
+@pytest.fixture
+def analyzer():
+    index = ScheduleIndex()
+    index.add_lesson({"day": "Понедельник", "time": "1 пара", "subject": "Физика", "room": "52-17",
+                      "teacher": ["Иванов И.И."], "groups": ["4318", "М412"]})
+    index.add_lesson({"day": "Среда", "time": "2 пара", "subject": "Химия", "room": "13-12а",
+                      "teacher": ["Петрова А.А."], "groups": ["ПМ-101"]})
+    return QueryAnalyzer(index)
+
+
+def criteria(analysis):
+    return {field: analysis[field] for field in ("groups", "rooms", "teachers", "days", "times") if analysis[field]}
+
+
+def test_group_day_and_pair(analyzer):
+    analysis = analyzer.analyze("что на третьей паре в пятницу у группы 4318", MONDAY)
+
+    assert analysis["type"] == "schedule"
+    assert criteria(analysis) == {"groups": ["4318"], "days": ["Пятница"], "times": ["3 пара"]}
+
+
+def test_relative_days_resolve_from_today(analyzer):
+    assert analyzer.analyze("расписание на сегодня", MONDAY)["days"] == ["Понедельник"]
+    assert analyzer.analyze("пары завтра", MONDAY)["days"] == ["Вторник"]
+
+
+def test_surname_is_normalized_to_nominative(analyzer):
+    analysis = analyzer.analyze("Какие пары у Петровой завтра?", MONDAY)
+    assert criteria(analysis) == {"teachers": ["Петрова"], "days": ["Вторник"]}
+
+
+def test_rooms_and_letter_groups(analyzer):
+    assert criteria(analyzer.analyze("ауд. 13-12а сегодня", MONDAY)) == {"rooms": ["13-12а"], "days": ["Понедельник"]}
+    assert analyzer.analyze("расписание группы ПМ-101", MONDAY)["groups"] == ["пм-101"]
+
+
+def test_pair_range(analyzer):
+    assert criteria(analyzer.analyze("1-2 пары в среду", MONDAY)) == {"days": ["Среда"], "times": ["1 пара", "2 пара"]}
+
+
+def test_unknown_room_needs_keyword_when_index_is_loaded(analyzer):
+    assert criteria(analyzer.analyze("что в 99-99", MONDAY)) == {}
+    assert criteria(analyzer.analyze("аудитория 99-99", MONDAY)) == {"rooms": ["99-99"]}
+
+
+@pytest.mark.parametrize("query", [
+    "Как пройти практику в 2024 году?",
+    "Стипендия на 2024-2025 учебный год",
+    "Какие параметры у стипендии?",
+    "Где проходят лекции по философии?",
+])
+def test_general_questions_have_no_criteria(analyzer, query):
+    analysis = analyzer.analyze(query, MONDAY)
+    assert analysis["type"] == "general"
+    assert criteria(analysis) == {}
+
+
+def test_entities_carry_spans(analyzer):
+    query = "пары у 4318"
+    (group,) = [e for e in analyzer.entities(query, MONDAY) if e.kind == "group"]
+    assert query[group.start:group.end] == "4318"
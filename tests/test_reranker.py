@@ -0,0 +1,77 @@
+import time
+
+from rag_sources.reranker import Reranker
+
+
+class FakeCrossEncoder:
+    """Оценка - число в тексте документа; каждый документ стоит cost_ms"""
+
+    def __init__(self, cost_ms=0.0):
+        self.cost_ms = cost_ms
+        self.batches = []
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        self.batches.append(len(pairs))
+        time.sleep(self.cost_ms * len(pairs) / 1000)
+        return [float(text.split()[-1]) for _, text in pairs]
+
+
+def docs(*scores):
+    return [{"id": str(i), "collection": "text_embeddings", "text": f"документ {score}", "score": 1 - i / 100}
+            for i, score in enumerate(scores)]
+
+
+def test_reorders_by_cross_encoder_score():
+    reranker = Reranker(model=FakeCrossEncoder(), top_k=2, probe_batch=2, budget_ms=1000)
+
+    result = reranker.rerank("стипендия", docs(1, 5, 3))
+
+    assert [d["id"] for d in result] == ["1", "2"]
+    assert result[0]["rerank_score"] == 5.0
+
+
+def test_first_batch_is_a_small_probe():
+    model = FakeCrossEncoder()
+    reranker = Reranker(model=model, top_k=2, batch_size=16, probe_batch=2, budget_ms=1000)
+
+    reranker.rerank("стипендия", docs(*range(10)))
+
+    assert model.batches[0] == 2
+    assert reranker.doc_cost_ms is not None
+
+
+def test_expired_deadline_keeps_cosine_order():
+    model = FakeCrossEncoder()
+    reranker = Reranker(model=model, top_k=2, budget_ms=1000)
+
+    # время ушло на ожидание в очереди пула
+    result = reranker.rerank("стипендия", docs(1, 5, 3), deadline=time.perf_counter() - 0.01)
+
+    assert [d["id"] for d in result] == ["0", "1"]
+    assert model.batches == []
+    assert reranker.skipped == 1
+
+
+def test_calibrated_cost_limits_batch_to_budget():
+    model = FakeCrossEncoder(cost_ms=5)
+    reranker = Reranker(model=model, top_k=2, batch_size=16, probe_batch=2, budget_ms=40)
+
+    reranker.rerank("стипендия", docs(*range(30)))
+
+    # после пробного батча (2 x 5 мс) в оставшиеся ~30 мс помещается ~6 документов, а не 16
+    assert model.batches[0] == 2
+    assert all(size <= 8 for size in model.batches[1:])
+    assert sum(model.batches) < 30
+
+
+def test_scores_are_cached_per_query_and_document():
+    model = FakeCrossEncoder()
+    reranker = Reranker(model=model, top_k=2, probe_batch=4, budget_ms=1000)
+
+    reranker.rerank("Стипендия", docs(1, 5, 3))
+    calls = len(model.batches)
+    result = reranker.rerank("  стипендия ", docs(1, 5, 3))
+
+    assert len(model.batches) == calls
+    assert reranker.cache_hits == 3
+    assert [d["id"] for d in result] == ["1", "2"]
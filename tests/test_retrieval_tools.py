@@ -0,0 +1,106 @@
+"""RetrievalService, RagTool and ScheduleTool against an in-memory Qdrant."""
+
+import pytest
+from qdrant_client import AsyncQdrantClient, models
+
+from core.models import ResearchContext
+from core.services.retrieval import RetrievalService
+from core.tools import rag_tool, schedule_tool
+from core.tools.rag_tool import RagTool
+from core.tools.schedule_tool import ScheduleTool
+from rag_sources.qdrant_factory import AsyncRetryingQdrantClient, QdrantClientOptions
+from utils.config import ConfigEmbeddings, ConfigQdrant, ConfigRetrieval
+
+TEXT = "text_embeddings"
+SCHEDULE = "schedules_embeddings"
+DIM = 4
+RASP_URL = "https://rasp.guap.ru/?g=4318"
+
+
+def lesson_point(point_id, day, time, subject, teacher, document_id="lessons", url=RASP_URL):
+    metadata = {"day": day, "time": time, "week": "каждая", "subject": subject, "room": "52-17",
+                "teacher": [teacher], "groups": ["4318"]}
+    return models.PointStruct(id=point_id, vector=[0.0, 0.0, 0.0, 1.0],
+                              payload={"document_id": document_id, "source_url": url, "metadata": metadata})
+
+
+def text_point(point_id, vector, text, url):
+    return models.PointStruct(id=point_id, vector=vector,
+                              payload={"text": text, "document_id": url.rsplit("/", 1)[-1], "source_url": url})
+
+
+@pytest.fixture
+async def service(monkeypatch):
+    service = RetrievalService(
+        ConfigQdrant(url="http://localhost:6333", api_key=""),
+        ConfigEmbeddings(model="test", base_url="http://localhost", api_key="test"),
+        ConfigRetrieval(enabled=True, text_collection=TEXT, schedule_collection=SCHEDULE,
+                        top_k=5, schedule_limit=1000, timeout=5),
+    )
+    qdrant = AsyncRetryingQdrantClient(AsyncQdrantClient(":memory:"), QdrantClientOptions())
+    for name in (TEXT, SCHEDULE):
+        await qdrant.create_collection(name, vectors_config=models.VectorParams(size=DIM, distance=models.Distance.COSINE))
+    await qdrant.upsert(TEXT, [
+        text_point(1, [1.0, 0.0, 0.0, 0.0], "Стипендия назначается по итогам сессии.", "https://guap.ru/scholarship"),
+        text_point(2, [0.9, 0.1, 0.0, 0.0], "Размер стипендии зависит от оценок.", "https://guap.ru/scholarship"),
+        text_point(3, [0.5, 0.5, 0.0, 0.0], "Общежитие предоставляется иногородним.", "https://guap.ru/dorm"),
+    ])
+    await qdrant.upsert(SCHEDULE, [
+        lesson_point(1, "Среда", "2 пара", "Физика", "Иванов И.И."),
+        lesson_point(2, "Понедельник", "3 пара", "Математика", "Иванов И.И."),
+        # то же занятие со страницы преподавателя
+        lesson_point(3, "Понедельник", "3 пара", "Математика", "Иванов И.И.", document_id="teachers_ivanov"),
+        lesson_point(4, "Понедельник", "1 пара", "Химия", "Иванова А.А."),
+        lesson_point(5, "Вторник", "1 пара", "Кафедра", "Иванов И.И.", document_id="departments_1"),
+    ])
+    service._qdrant = qdrant
+
+    async def embed(text):
+        return [1.0, 0.0, 0.0, 0.0]
+
+    monkeypatch.setattr(service, "_embed", embed)
+    monkeypatch.setattr(rag_tool, "get_retrieval_service", lambda: service)
+    monkeypatch.setattr(schedule_tool, "get_retrieval_service", lambda: service)
+    return service
+
+
+async def test_schedule_matches_surname_token_and_orders_by_day_and_pair(service):
+    lessons = await service.search_schedule(teacher="Иванов")
+
+    assert [(x["day"], x["time"], x["subject"]) for x in lessons] == [
+        ("Понедельник", "3 пара", "Математика"),
+        ("Среда", "2 пара", "Физика"),
+    ]
+    assert [x["subject"] for x in await service.search_schedule(teacher="Иванова А.")] == ["Химия"]
+
+
+async def test_rag_tool_cites_one_source_per_url(service):
+    context = ResearchContext()
+
+    result = await RagTool(reasoning="r", query="стипендия", max_results=3)(context, config=None)
+
+    assert list(context.sources) == ["https://guap.ru/scholarship", "https://guap.ru/dorm"]
+    assert [s.number for s in context.sources.values()] == [1, 2]
+    assert "Размер стипендии" in context.sources["https://guap.ru/scholarship"].full_content
+    assert result.count("[1] ") == 2 and result.count("[2] ") == 1
+    assert [len(s.citations) for s in context.searches] == [2]
+
+
+async def test_schedule_tool_continues_numbering_and_keeps_cited_urls(service):
+    context = ResearchContext()
+    await RagTool(reasoning="r", query="стипендия", max_results=1)(context, config=None)
+
+    result = await ScheduleTool(reasoning="r", teacher="Иванов")(context, config=None)
+    await RagTool(reasoning="r", query="стипендия", max_results=1)(context, config=None)
+
+    assert context.sources[RASP_URL].number == 2
+    assert context.sources["https://guap.ru/scholarship"].number == 1
+    assert len(context.sources) == 2
+    assert f"[2] Расписание (teacher=Иванов) - {RASP_URL}" in result
+    assert "Химия" not in result
+
+
+async def test_schedule_tool_requires_criteria(service):
+    context = ResearchContext()
+    assert "Specify" in await ScheduleTool(reasoning="r", day="Понедельник")(context, config=None)
+    assert context.sources == {}
@@ -0,0 +1,110 @@
+import pytest
+
+from rag_sources.schedule_index import ScheduleIndex, room_keys, teacher_surname
+
+
+def lesson(day, time, subject, room="52-17", teacher=("Иванов И.И. - доцент",), groups=("4318",), week="не указано"):
+    return {"day": day, "time": time, "subject": subject, "week": week, "room": room,
+            "teacher": list(teacher), "groups": list(groups)}
+
+
+def chunk(metadata, document_id="lessons"):
+    return {"document_id": document_id, "metadata": metadata}
+
+
+@pytest.fixture
+def index():
+    return ScheduleIndex.from_chunks([
+        chunk(lesson("Среда", "2 пара", "Физика")),
+        chunk(lesson("Понедельник", "10 пара", "Философия")),
+        chunk(lesson("Понедельник", "3 пара", "Математика", room="23-01", teacher=("Иванова А.А.",))),
+        # то же занятие из файла преподавателя
+        chunk(lesson("Среда", "2 пара", "Физика"), document_id="teachers_ivanov"),
+        chunk(lesson("Вторник", "1 пара", "История", groups=("М412",)), document_id="groups_m412"),
+        # кафедры в индекс не попадают
+        chunk(lesson("Вторник", "1 пара", "Кафедра"), document_id="departments_1"),
+    ])
+
+
+def test_keys():
+    assert room_keys("ауд. 52-17") == {"52-17", "5217"}
+    assert teacher_surname("Иванов И.И. - доцент") == "иванов"
+
+
+def test_duplicates_and_other_documents_are_skipped(index):
+    assert len(index) == 4
+
+
+def test_search_intersects_criteria_and_orders_by_day_and_pair(index):
+    found = index.search({"groups": ["4318"], "teachers": ["Иванов"]})
+    assert [(x["day"], x["subject"]) for x in found] == [("Понедельник", "Философия"), ("Среда", "Физика")]
+
+    assert [x["subject"] for x in index.search({"rooms": ["5217"], "days": ["среда"]})] == ["Физика"]
+    assert [x["subject"] for x in index.search({"teachers": ["Иванова"]})] == ["Математика"]
+    assert index.search({"groups": ["4318"], "times": ["1 пара"]}) == []
+    assert index.search({}) == []
+
+
+def test_apply_delta_in_version_order(index):
+    physics = lesson("Среда", "2 пара", "Физика")
+    moved = lesson("Среда", "2 пара", "Физика", room="14-03")
+    applied = index.apply_delta([
+        {"version": 1, "op": "modified", "previous": physics, "lesson": moved},
+        {"version": 2, "op": "added", "lesson": lesson("Пятница", "1 пара", "Химия")},
+        {"version": 3, "op": "removed", "previous": lesson("Вторник", "1 пара", "История", groups=("М412",))},
+    ])
+
+    assert applied == 3
+    assert index.version == 3
+    assert index.search({"rooms": ["52-17"], "days": ["Среда"]}) == []
+    assert [x["room"] for x in index.search({"rooms": ["14-03"]})] == ["14-03"]
+    assert [x["subject"] for x in index.search({"days": ["Пятница"]})] == ["Химия"]
+    assert index.search({"groups": ["М412"]}) == []
+    assert len(index) == 4
+
+    # уже применённые версии пропускаются
+    assert index.apply_delta([{"version": 2, "op": "added", "lesson": lesson("Суббота", "1 пара", "Черчение")}]) == 0
+    assert index.search({"days": ["Суббота"]}) == []
+
+
+def test_delta_net_changes_keep_last_state():
+    pytest.importorskip("tqdm")
+    from schedule_delta import net_changes
+
+    first = lesson("Среда", "2 пара", "Физика")
+    second = lesson("Среда", "2 пара", "Физика", room="14-03")
+    third = lesson("Среда", "2 пара", "Физика", room="14-05")
+    upserts, deletes = net_changes([
+        {"version": 1, "op": "modified", "previous": first, "lesson": second},
+        {"version": 2, "op": "modified", "previous": second, "lesson": third},
+    ])
+
+    assert [c["metadata"]["room"] for c in upserts.values()] == ["14-05"]
+    assert len(deletes) == 2
+    assert not deletes & upserts.keys()
+
+
+def test_delta_points_fit_hybrid_collection():
+    pytest.importorskip("tqdm")
+    import numpy as np
+    from qdrant_client import QdrantClient, models
+    from schedule_delta import net_changes, to_points
+    from sparse_encoder import DENSE_VECTOR, SPARSE_VECTOR, SparseEncoder
+
+    upserts, _ = net_changes([{"version": 1, "op": "added", "lesson": lesson("Пятница", "1 пара", "Химия")}])
+    chunks = list(upserts.values())
+    texts = [chunk["text"] for chunk in chunks]
+    points = to_points(chunks, texts, np.ones((len(chunks), 4), dtype=np.float32), SparseEncoder(avgdl=10))
+
+    # коллекция в hybrid-режиме, как её создаёт parser/qdrnt.py
+    qdrant = QdrantClient(":memory:")
+    qdrant.create_collection(
+        "schedules_embeddings",
+        vectors_config={DENSE_VECTOR: models.VectorParams(size=4, distance=models.Distance.COSINE)},
+        sparse_vectors_config={SPARSE_VECTOR: models.SparseVectorParams(modifier=models.Modifier.IDF)},
+    )
+    qdrant.upsert("schedules_embeddings", points, wait=True)
+
+    (stored,) = qdrant.retrieve("schedules_embeddings", [chunks[0]["chunk_uid"]], with_vectors=True)
+    assert set(stored.vector) == {DENSE_VECTOR, SPARSE_VECTOR}
+    assert stored.vector[SPARSE_VECTOR].indices
@@ -0,0 +1,39 @@
+from rag_sources.sparse_encoder import SparseEncoder, token_index, tokenize
+
+
+def dot(query, document):
+    weights = dict(zip(*document, strict=True))
+    return sum(value * weights.get(index, 0.0) for index, value in zip(*query, strict=True))
+
+
+def test_tokenize_keeps_codes_and_stems_words():
+    assert tokenize("Расписание группы 4318 в ауд. 52-17") == ["распис", "группы", "4318", "ауд", "52-17", "5217"]
+    assert tokenize("расписания на Ёлкиной") == ["распис", "елкино"]
+
+
+def test_document_weights_saturate_and_depend_on_length():
+    encoder = SparseEncoder(avgdl=4)
+    short = dict(zip(*encoder.encode_document("стипендия стипендия"), strict=True))
+    long = dict(zip(*encoder.encode_document("стипендия стипендия " + "приём " * 20), strict=True))
+    many = dict(zip(*encoder.encode_document("стипендия " * 50), strict=True))
+
+    index = token_index("стипен")
+    assert short[index] > long[index]
+    assert many[index] < encoder.k1 + 1
+
+
+def test_exact_group_number_ranks_first():
+    documents = ["Расписание группы 4318 на понедельник", "Расписание группы 4319 на понедельник",
+                 "Стипендия назначается по итогам сессии"]
+    encoder = SparseEncoder().fit(documents)
+    query = SparseEncoder.encode_query("расписание 4318")
+
+    scores = [dot(query, encoder.encode_document(text)) for text in documents]
+
+    assert scores[0] > scores[1] > scores[2] == 0
+
+
+def test_indices_are_sorted_and_unique():
+    indices, values = SparseEncoder.encode_query("52-17 52-17 аудитория")
+    assert indices == sorted(set(indices))
+    assert len(values) == len(indices)